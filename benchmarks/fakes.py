@@ -0,0 +1,319 @@
+"""
+Local stand-ins for the Airtable REST API and the QuickBooks Online v3 API.
+
+Both keep everything in memory, answer only the calls this app makes, and can
+add latency, random 5xx errors and 429 throttling so the pipeline can be
+load-tested without touching real services.
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+
+@dataclass
+class Behavior:
+    latency_ms: float = 0.0       # added to every response
+    jitter_ms: float = 0.0        # +/- uniform jitter on top of latency
+    error_rate: float = 0.0       # fraction of requests answered with 500
+    throttle_rate: float = 0.0    # fraction of requests answered with 429
+    rps_limit: float = 0.0        # 429 when more than this many requests arrive within one second (0 = off)
+    retry_after: float = 1.0      # Retry-After header sent with every 429
+
+
+class FakeServer:
+    """
+    ThreadingHTTPServer in a daemon thread plus the knobs and counters shared by both fakes.
+    """
+    name = "fake"
+    throttle_payload = {"error": "Too many requests"}
+
+    def __init__(self, behavior: Behavior | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.behavior = behavior or Behavior()
+        self.calls: Counter = Counter()      # "METHOD route" -> count
+        self.statuses: Counter = Counter()   # status code -> count
+        self._lock = threading.Lock()
+        self._window: list[float] = []
+        self._random = random.Random(42)
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _dispatch(self):
+                fake._handle(self)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.statuses.clear()
+
+    # Override in subclasses: return (route name for the counters, status, payload dict)
+    def route(self, method: str, path: str, query: dict, body: bytes) -> tuple[str, int, dict]:
+        raise NotImplementedError
+
+    def _injected_failure(self) -> int | None:
+        b = self.behavior
+        with self._lock:
+            now = time.monotonic()
+            if b.rps_limit:
+                self._window = [t for t in self._window if now - t < 1.0]
+                self._window.append(now)
+                if len(self._window) > b.rps_limit:
+                    return 429
+            roll = self._random.random()
+        if roll < b.throttle_rate:
+            return 429
+        if roll < b.throttle_rate + b.error_rate:
+            return 500
+        return None
+
+    def _handle(self, handler: BaseHTTPRequestHandler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        parts = urlsplit(handler.path)
+        path = unquote(parts.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+        b = self.behavior
+        delay = b.latency_ms + (self._random.uniform(-b.jitter_ms, b.jitter_ms) if b.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        status = self._injected_failure()
+        route_name = "throttled"
+        headers = {}
+        if status == 429:
+            payload = self.throttle_payload
+            headers["Retry-After"] = f"{b.retry_after:g}"
+        elif status == 500:
+            payload = {"error": {"type": "SERVER_ERROR", "message": "Injected failure"}}
+            route_name = "error"
+        else:
+            route_name, status, payload = self.route(handler.command, path, query, body)
+
+        with self._lock:
+            self.calls[f"{handler.command} {route_name}"] += 1
+            self.statuses[status] += 1
+
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+class FakeAirtable(FakeServer):
+    """
+    /v0/{base}/{table}[/{record_id}] with formula filtering limited to what the
+    app sends: RECORD_ID() lists and {Field}='value' equality.
+    """
+    name = "airtable"
+    throttle_payload = {"errors": [{"error": "RATE_LIMIT_REACHED", "message": "Rate limit exceeded"}]}
+
+    def __init__(self, behavior: Behavior | None = None, **kwargs):
+        super().__init__(behavior, **kwargs)
+        self.tables: dict[str, dict[str, dict]] = {}
+        self._ids = itertools.count(1)
+        self._data_lock = threading.Lock()
+
+    def new_id(self) -> str:
+        return f"rec{next(self._ids):014d}"
+
+    def add(self, table: str, fields: dict, record_id: str | None = None) -> str:
+        record_id = record_id or self.new_id()
+        with self._data_lock:
+            self.tables.setdefault(table, {})[record_id] = {
+                "id": record_id,
+                "createdTime": "2024-01-01T00:00:00.000Z",
+                "fields": dict(fields),
+            }
+        return record_id
+
+    def _filter(self, table: str, formula: str | None) -> list[dict]:
+        records = list(self.tables.get(table, {}).values())
+        if not formula:
+            return records
+        ids = re.findall(r"RECORD_ID\(\)\s*=\s*'([^']+)'", formula)
+        if ids:
+            wanted = set(ids)
+            return [r for r in records if r["id"] in wanted]
+        match = re.search(r"\{([^}]+)\}\s*=\s*'([^']*)'", formula)
+        if match:
+            field, value = match.groups()
+            return [r for r in records if r["fields"].get(field) == value]
+        return records
+
+    def _list(self, table: str, options: dict) -> dict:
+        records = self._filter(table, options.get("filterByFormula"))
+        page_size = int(options.get("pageSize") or 100)
+        offset = int(options.get("offset") or 0)
+        max_records = options.get("maxRecords")
+        if max_records:
+            records = records[:int(max_records)]
+        page = records[offset:offset + page_size]
+        payload = {"records": page}
+        if offset + page_size < len(records):
+            payload["offset"] = str(offset + page_size)
+        return payload
+
+    def _write(self, table: str, record_id: str | None, fields: dict) -> dict:
+        with self._data_lock:
+            rows = self.tables.setdefault(table, {})
+            if record_id and record_id in rows:
+                rows[record_id]["fields"].update(fields)
+                return rows[record_id]
+        return self.tables[table][self.add(table, fields)]
+
+    def route(self, method, path, query, body):
+        match = re.match(r"^/v0/(app[^/]+)/([^/]+)(?:/([^/]+))?$", path)
+        if not match:
+            return "unknown", 404, {"error": "NOT_FOUND"}
+        _, table, tail = match.groups()
+        data = json.loads(body) if body else {}
+
+        if method == "GET" and tail:
+            record = self.tables.get(table, {}).get(tail)
+            if record is None:
+                return "get_record", 404, {"error": "NOT_FOUND"}
+            return "get_record", 200, record
+        if method == "GET":
+            return "list_records", 200, self._list(table, query)
+        if method == "POST" and tail == "listRecords":
+            return "list_records", 200, self._list(table, data)
+        if method == "POST" and "records" in data:
+            return "batch_create", 200, {"records": [self._write(table, None, r.get("fields", {})) for r in data["records"]]}
+        if method == "POST":
+            return "create_record", 200, self._write(table, None, data.get("fields", {}))
+        if method == "PATCH" and tail:
+            return "update_record", 200, self._write(table, tail, data.get("fields", {}))
+        if method == "PATCH" and "records" in data:
+            return "batch_update", 200, {"records": [self._write(table, r["id"], r.get("fields", {})) for r in data["records"]]}
+        return "unknown", 404, {"error": "NOT_FOUND"}
+
+
+class FakeQuickBooks(FakeServer):
+    """
+    Intuit discovery document, token endpoint and the v3 calls the app makes:
+    query, get by id, create Bill and batch. Every reference lookup finds an
+    entity; duplicate_rate makes DocNumber queries find an existing bill.
+    """
+    name = "quickbooks"
+    throttle_payload = {"Fault": {"Error": [{"Message": "ThrottleExceeded", "code": "3001"}], "type": "ValidationFault"}}
+
+    def __init__(self, behavior: Behavior | None = None, duplicate_rate: float = 0.0, **kwargs):
+        super().__init__(behavior, **kwargs)
+        self.duplicate_rate = duplicate_rate
+        self.bills: dict[str, dict] = {}
+        self._ids = itertools.count(1000)
+        self._data_lock = threading.Lock()
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}/v3"
+
+    @property
+    def discovery_url(self) -> str:
+        return f"{self.url}/.well-known/openid_configuration"
+
+    def _entity(self, kind: str, where: str) -> dict:
+        value = (re.findall(r"'%?([^'%]*)%?'", where) or ["1"])[0]
+        entity = {"Id": str(abs(hash((kind, value))) % 100000), "Active": True}
+        if kind in ("Vendor", "Customer"):
+            entity["DisplayName"] = f"{kind} {value}"
+        else:
+            entity["Name"] = f"{kind} {value}"
+        return entity
+
+    def _query(self, select: str) -> dict:
+        match = re.search(r"FROM\s+(\w+)(.*)", select, re.IGNORECASE | re.DOTALL)
+        kind, rest = match.groups() if match else ("Unknown", "")
+        where = rest.split("STARTPOSITION")[0]
+        if kind == "Bill":
+            numbers = re.findall(r"'([^']*)'", where) if "DocNumber" in where else []
+            found = [{"Id": b["Id"], "DocNumber": n} for n in numbers for b in [self.bills.get(n)] if b]
+            found += [
+                {"Id": "0", "DocNumber": n} for n in numbers
+                if n not in self.bills and self._random.random() < self.duplicate_rate
+            ]
+            return {"QueryResponse": {"Bill": found} if found else {}}
+        return {"QueryResponse": {kind: [self._entity(kind, where)], "startPosition": 1, "maxResults": 1}}
+
+    def _create_bill(self, bill: dict) -> dict:
+        with self._data_lock:
+            bill = dict(bill, Id=str(next(self._ids)))
+            self.bills[bill.get("DocNumber", bill["Id"])] = bill
+        return bill
+
+    def route(self, method, path, query, body):
+        if path == "/.well-known/openid_configuration":
+            return "discovery", 200, {
+                "issuer": self.url,
+                "authorization_endpoint": f"{self.url}/oauth2/v1/authorize",
+                "token_endpoint": f"{self.url}/oauth2/v1/tokens/bearer",
+                "revocation_endpoint": f"{self.url}/oauth2/v1/tokens/revoke",
+                "jwks_uri": f"{self.url}/oauth2/v1/keys",
+                "userinfo_endpoint": f"{self.url}/v1/openid_connect/userinfo",
+            }
+        if path == "/oauth2/v1/tokens/bearer":
+            return "token_refresh", 200, {
+                "access_token": f"bench-access-{time.time()}",
+                "refresh_token": "bench-refresh",
+                "token_type": "bearer",
+                "expires_in": 3600,
+                "x_refresh_token_expires_in": 8640000,
+            }
+
+        match = re.match(r"^/v3/company/([^/]+)/(\w+)(?:/([^/]+))?$", path)
+        if not match:
+            return "unknown", 404, {"Fault": {"Error": [{"Message": "Not found", "code": "610"}]}}
+        _, resource, pk = match.groups()
+
+        if resource == "query":
+            return "query", 200, self._query(body.decode())
+        if resource == "batch":
+            items = json.loads(body).get("BatchItemRequest", [])
+            return "batch", 200, {"BatchItemResponse": [
+                {"bId": item["bId"], "Bill": self._create_bill(item.get("Bill", {}))} for item in items
+            ]}
+        if resource == "bill" and method == "POST":
+            return "create_bill", 200, {"Bill": self._create_bill(json.loads(body))}
+        if method == "GET" and pk:
+            kind = resource.capitalize()
+            return f"get_{resource}", 200, {kind: {"Id": pk, "Name": f"{kind} {pk}", "Active": True}}
+        return "unknown", 404, {"Fault": {"Error": [{"Message": "Not found", "code": "610"}]}}
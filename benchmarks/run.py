@@ -0,0 +1,324 @@
+"""
+Offline end-to-end benchmark of the bill pipeline against local stand-ins of
+Airtable and QuickBooks (benchmarks/fakes.py). Nothing leaves the machine.
+
+    python -m benchmarks.run --bills 200 --mode service --concurrency 8
+    python -m benchmarks.run --bills 500 --mode task --concurrency 16 --airtable-latency-ms 120 --qbo-latency-ms 250
+    python -m benchmarks.run --bills 300 --mode batch --airtable-rps-limit 5 --json > before.json
+
+Reports bills/sec, p50/p95/p99 latency per bill and upstream calls per bill.
+Needs Redis at REDIS_URL, or --fakeredis (pip install fakeredis) for an in-process one.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .fakes import Behavior, FakeAirtable, FakeQuickBooks
+
+BASE_ID = "appBENCHMARK0001"
+REALM_ID = "9130000000000001"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of bill_service / process_bill_task.")
+    parser.add_argument("--bills", type=int, default=100)
+    parser.add_argument("--mode", choices=["service", "task", "batch"], default="service",
+                        help="service: bill_service on one event loop; task: process_bill_task (eager) on a thread pool; "
+                             "batch: bill_batch_service in chunks")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=30, help="Bills per call in batch mode")
+    parser.add_argument("--haulers", type=int, default=20, help="Distinct haulers/customers/services (reference cache reuse)")
+    parser.add_argument("--airtable-latency-ms", type=float, default=60)
+    parser.add_argument("--qbo-latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of upstream requests answered with 429")
+    parser.add_argument("--airtable-rps-limit", type=float, default=0, help="Answer 429 above this many Airtable requests per second")
+    parser.add_argument("--qbo-rps-limit", type=float, default=0, help="Answer 429 above this many QBO requests per second")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Fraction of bills QBO reports as existing")
+    parser.add_argument("--fakeredis", action="store_true", help="Use an in-process fakeredis instead of REDIS_URL")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, airtable: FakeAirtable, qbo: FakeQuickBooks):
+    """
+    Point the app at the stand-ins. Must run before anything under app/ is imported;
+    values are forced so a local .env can never send benchmark traffic to real services.
+    """
+    db_path = Path(tempfile.mkdtemp(prefix="bench-")) / "bench.db"
+    os.environ.update({
+        "AIRTABLE_TOKEN": "bench-token",
+        "AIRTABLE_BASE_ID": BASE_ID,
+        "AIRTABLE_API_URL": airtable.url,
+        "QUICKBOOKS_CLIENT_ID": "bench",
+        "QUICKBOOKS_CLIENT_SECRET": "bench",
+        "QUICKBOOKS_COMPANY_ID": REALM_ID,
+        "QUICKBOOKS_REDIRECT_URI": "http://localhost/qbo/callback",
+        "QUICKBOOKS_ENV": qbo.discovery_url,
+        "QUICKBOOKS_API_URL": qbo.api_url,
+        "SQLALCHEMY_DATABASE_URL": f"sqlite:///{db_path}",
+        # The stand-ins speak plain http
+        "OAUTHLIB_INSECURE_TRANSPORT": "1",
+    })
+    if not os.getenv("QBO_FERNET_KEY"):
+        from cryptography.fernet import Fernet
+        os.environ["QBO_FERNET_KEY"] = Fernet.generate_key().decode()
+
+    if args.fakeredis:
+        import fakeredis
+        import redis
+        server = fakeredis.FakeServer()
+        redis.from_url = lambda url, **kw: fakeredis.FakeRedis(server=server, **{k: v for k, v in kw.items() if k != "db"})
+
+    # app.* (linked models are resolved as "app.models...")
+    src = Path(__file__).resolve().parent.parent / "src"
+    if str(src) not in sys.path:
+        sys.path.insert(0, str(src))
+
+
+def seed(airtable: FakeAirtable, bills: int, distinct: int) -> list[str]:
+    haulers, customers, services = [], [], []
+    for i in range(distinct):
+        haulers.append(airtable.add("Haulers", {"Name": f"Hauler {i}", "H#": 100 + i}))
+        customers.append(airtable.add("Customers", {"SF Customer Name": f"Customer {i}", "A#": f"A-{1000 + i}"}))
+        services.append(airtable.add("Services", {
+            "Name": f"Trash service {i}",
+            "Type": ["Trash"],
+            "Service Acc #": f"SA-{2000 + i}",
+            "Hauler Terms": [30],
+        }))
+
+    bill_ids = []
+    for n in range(bills):
+        i = n % distinct
+        bill_ids.append(airtable.add("Bills", {
+            "Bill #": f"BENCH-{n:06d}",
+            "Status": "Send bill to QB",
+            "PDF Link": f"https://files.example.com/bills/{n}.pdf",
+            "Bill date": "2024-01-15",
+            "Due": "02/15/2024",
+            "Bill amount": 100 + n % 400,
+            "Hauler 🔎": [haulers[i]],
+            "Customer 🔎": [customers[i]],
+            "Service 🔎": [services[i]],
+            "Service Account 🔎": [f"SA-{2000 + i}"],
+        }))
+    return bill_ids
+
+
+def seed_qbo_connection():
+    from app.database.engine import Base, SessionLocal, engine
+    from app.database import models  # noqa: F401 (registers tables)
+    from app.database.crud_qbo import upsert_tokens
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        now = dt.datetime.utcnow()
+        upsert_tokens(
+            db,
+            realm_id=REALM_ID,
+            environment="benchmark",
+            access_token="bench-access",
+            access_token_expires_at=now + dt.timedelta(hours=1),
+            refresh_token="bench-refresh",
+            refresh_token_expires_at=now + dt.timedelta(days=100),
+            scopes="accounting",
+        )
+    finally:
+        db.close()
+
+
+def run_service(bill_ids: list[str], concurrency: int) -> dict[str, tuple[float, str]]:
+    from app.services.bill_service import bill_service
+    from app.utils.aio import run_async
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+        results = {}
+
+        async def one(bill_id):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await bill_service(bill_id, REALM_ID)
+                    outcome = "ok"
+                except Exception as e:
+                    outcome = type(e).__name__
+                results[bill_id] = (time.perf_counter() - start, outcome)
+
+        await asyncio.gather(*(one(bill_id) for bill_id in bill_ids))
+        return results
+
+    return run_async(run_all())
+
+
+def run_task(bill_ids: list[str], concurrency: int) -> dict[str, tuple[float, str]]:
+    from app.core.celery_worker import celery
+    from app.tasks.bill_task import process_bill_task
+
+    # Run tasks in-process. Eager retries run again right away, so make them wait
+    # their countdown like on a worker (backoff, deferrals while a circuit is open)
+    celery.conf.task_always_eager = True
+    eager_apply = process_bill_task.apply
+
+    def apply_after_countdown(*args, countdown=None, **options):
+        if countdown:
+            time.sleep(countdown)
+        return eager_apply(*args, **options)
+
+    process_bill_task.apply = apply_after_countdown
+
+    def one(bill_id):
+        start = time.perf_counter()
+        result = process_bill_task.apply(args=[bill_id, REALM_ID])
+        outcome = "ok" if result.successful() else f"{result.state}:{type(result.result).__name__}"
+        return bill_id, (time.perf_counter() - start, outcome)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return dict(pool.map(one, bill_ids))
+
+
+def run_batch(bill_ids: list[str], batch_size: int) -> dict[str, tuple[float, str]]:
+    from app.services.bill_batch_service import bill_batch_service
+    from app.utils.aio import run_async
+
+    results = {}
+    for start in range(0, len(bill_ids), batch_size):
+        chunk = bill_ids[start:start + batch_size]
+        began = time.perf_counter()
+        try:
+            result = run_async(bill_batch_service(chunk, REALM_ID))
+        except Exception as e:
+            # The whole batch failed (e.g. no QBO client); the task would retry it
+            elapsed = time.perf_counter() - began
+            results.update({bill_id: (elapsed, type(e).__name__) for bill_id in chunk})
+            continue
+        # Every bill of a batch shares its latency
+        elapsed = time.perf_counter() - began
+        for bill_id in chunk:
+            if bill_id in result.created or bill_id in result.duplicates:
+                outcome = "ok"
+            else:
+                outcome = "retryable" if bill_id in result.retryable else "failed"
+            results[bill_id] = (elapsed, outcome)
+    return results
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def build_report(args, results: dict, elapsed: float, airtable: FakeAirtable, qbo: FakeQuickBooks) -> dict:
+    from app.shared.http_pool import pool_stats
+
+    latencies = [latency for latency, _ in results.values()]
+    outcomes: dict[str, int] = {}
+    for _, outcome in results.values():
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    n = max(1, len(results))
+    in_qb = sum(1 for r in airtable.tables.get("Bills", {}).values() if r["fields"].get("Status") == "Bill in QB")
+    return {
+        "mode": args.mode,
+        "bills": len(results),
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "bills_per_s": round(len(results) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "mean": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0,
+        },
+        "outcomes": outcomes,
+        "bills_in_qb": in_qb,
+        "upstream_calls_per_bill": {
+            "airtable": round(airtable.total_calls() / n, 2),
+            "quickbooks": round(qbo.total_calls() / n, 2),
+        },
+        "upstream_calls": {
+            "airtable": dict(sorted(airtable.calls.items())),
+            "quickbooks": dict(sorted(qbo.calls.items())),
+        },
+        "connections_opened": {pool["upstream"]: pool["connections_opened"] for pool in pool_stats()},
+        "upstream_statuses": {
+            "airtable": {str(k): v for k, v in sorted(airtable.statuses.items())},
+            "quickbooks": {str(k): v for k, v in sorted(qbo.statuses.items())},
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"\nmode={report['mode']} bills={report['bills']} concurrency={report['concurrency']}")
+    print(f"  throughput   {report['bills_per_s']} bills/s ({report['elapsed_s']}s)")
+    lat = report["latency_ms"]
+    print(f"  latency      p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms mean={lat['mean']}ms")
+    print(f"  outcomes     {report['outcomes']} (Bill in QB: {report['bills_in_qb']})")
+    per_bill = report["upstream_calls_per_bill"]
+    print(f"  calls/bill   airtable={per_bill['airtable']} quickbooks={per_bill['quickbooks']}")
+    for upstream, calls in report["upstream_calls"].items():
+        print(f"  {upstream:<12} " + ", ".join(f"{k}={v}" for k, v in calls.items()))
+    print(f"  connections  {report['connections_opened']}")
+    for upstream, statuses in report["upstream_statuses"].items():
+        print(f"  {upstream:<12} statuses {statuses}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    airtable = FakeAirtable(Behavior(
+        latency_ms=args.airtable_latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, rps_limit=args.airtable_rps_limit, retry_after=args.retry_after,
+    )).start()
+    qbo = FakeQuickBooks(Behavior(
+        latency_ms=args.qbo_latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, rps_limit=args.qbo_rps_limit, retry_after=args.retry_after,
+    ), duplicate_rate=args.duplicate_rate).start()
+
+    try:
+        configure_environment(args, airtable, qbo)
+        seed_qbo_connection()
+        bill_ids = seed(airtable, args.bills, max(1, args.haulers))
+        airtable.reset_counters()
+        qbo.reset_counters()
+
+        started = time.perf_counter()
+        if args.mode == "service":
+            results = run_service(bill_ids, args.concurrency)
+        elif args.mode == "task":
+            results = run_task(bill_ids, args.concurrency)
+        else:
+            results = run_batch(bill_ids, args.batch_size)
+
+        # Buffered Airtable writes are part of the work
+        from app.core.config import AIRTABLE_WRITE_BEHIND
+        if AIRTABLE_WRITE_BEHIND:
+            from app.services.airtable_writer import flush_writes
+            flush_writes()
+        elapsed = time.perf_counter() - started
+
+        report = build_report(args, results, elapsed, airtable, qbo)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+    finally:
+        airtable.stop()
+        qbo.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, status
+
+from ...core.config import AIRTABLE_BASE_ID
+from ...shared.airtable import airtable_governor
+from ...utils.circuit_breaker import circuit_breaker, airtable_circuit
+
+router = APIRouter()
+
+
+@router.get("/governor", status_code=status.HTTP_200_OK)
+def airtable_governor_stats():
+    """
+    Queue wait and 429 counters of the shared Airtable rate governor.
+    """
+    return {"base": AIRTABLE_BASE_ID, "enabled": airtable_governor.enabled, "stats": airtable_governor.stats(AIRTABLE_BASE_ID)}
+
+
+@router.get("/circuit", status_code=status.HTTP_200_OK)
+def airtable_circuit_stats():
+    """
+    State of the circuit breaker for the Airtable base.
+    """
+    return {"base": AIRTABLE_BASE_ID, "enabled": circuit_breaker.enabled, "circuit": circuit_breaker.stats(airtable_circuit(AIRTABLE_BASE_ID))}
@@ -1,17 +1,104 @@
+import time
 from fastapi import APIRouter, HTTPException, status
-from ...models import WebHook
-from ...tasks.bill_task import process_bill_task
+from fastapi.concurrency import run_in_threadpool
+from ...schemas import WebHook
+from ...services.bill_queue import enqueue_bill_events
+from ...services.webhook_outbox import accept_bill_events, outbox_relay, outbox_status
 from kombu.exceptions import OperationalError  # error típico de broker
+from redis.exceptions import RedisError
+from ...services.realm_scheduler import realm_queue_stats
+from ...utils.metrics import metrics
+from ...core.config import WEBHOOK_BATCH_MAX_BILLS, WEBHOOK_OUTBOX_ENABLED
 
 router = APIRouter()
 
+
+def _ingest(endpoint: str, bill_ids: list[str], company_id: str | None):
+    """
+    Runs on the thread pool: database, Redis and broker writes are blocking and
+    must not stall the other requests of the event loop.
+    With the outbox the events are only stored (the relay queues them) and None
+    is returned; otherwise, or when the outbox can't be written, they're queued
+    now and bill_id -> (queued, merged) is returned. Returns (events, seconds).
+    """
+    start = time.perf_counter()
+    events = None
+    if WEBHOOK_OUTBOX_ENABLED:
+        try:
+            accept_bill_events(bill_ids, company_id)
+        except Exception as e:
+            print(f"[Outbox] could not store {len(bill_ids)} events, queueing them directly: {e}")
+            events = enqueue_bill_events(bill_ids, company_id)
+    else:
+        events = enqueue_bill_events(bill_ids, company_id)
+    elapsed = time.perf_counter() - start
+    metrics.observe("webhook_ingest_seconds", elapsed, endpoint=endpoint)
+    return events, elapsed
+
+
+def _queue_unavailable(e: Exception) -> HTTPException:
+    # Service unavailable Celery error
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                         detail={"message": "Queue unavailable", "error": str(e)})
+
+
 @router.post("/webhook", status_code=status.HTTP_202_ACCEPTED)
 async def webhook_to_quickbooks(data: WebHook.WebHook):
     bill_id = data.id
     try:
-        process_bill_task.delay(bill_id)
-    except OperationalError as e:
-        # Service unavailable Celery error
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                            detail={"message": "Queue unavailable", "error": str(e)})
-    return {"message": "Webhook received", "bill_id": bill_id, "status": "queued"}
+        events, elapsed = await run_in_threadpool(_ingest, "single", [bill_id], data.company_id)
+    except (OperationalError, RedisError) as e:
+        raise _queue_unavailable(e)
+    if events is None:
+        outbox_relay.wake()
+        return {"message": "Webhook received", "bill_id": bill_id, "status": "accepted", "ingest_ms": round(elapsed * 1000, 2)}
+    # Repeated events for a bill already queued are merged into that task
+    queued, merged = events[bill_id]
+    return {"message": "Webhook received", "bill_id": bill_id, "status": "queued" if queued else "merged", "merged": merged,
+            "ingest_ms": round(elapsed * 1000, 2)}
+
+
+@router.post("/webhook/batch", status_code=status.HTTP_202_ACCEPTED)
+async def webhook_batch_to_quickbooks(data: WebHook.WebHookBatch):
+    """
+    Many bills of one company in one request (e.g. a whole Airtable view).
+    Each bill is coalesced and queued as with /webhook, with pipelined Redis and
+    broker writes for the whole batch.
+    """
+    if len(data.ids) > WEBHOOK_BATCH_MAX_BILLS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail={"message": f"At most {WEBHOOK_BATCH_MAX_BILLS} bills per request", "received": len(data.ids)})
+    try:
+        events, elapsed = await run_in_threadpool(_ingest, "batch", data.ids, data.company_id)
+    except (OperationalError, RedisError) as e:
+        raise _queue_unavailable(e)
+    if events is None:
+        outbox_relay.wake()
+        return {"message": "Webhook batch received", "received": len(data.ids), "accepted": len(data.ids),
+                "ingest_ms": round(elapsed * 1000, 2)}
+
+    queued = sum(1 for q, _ in events.values() if q)
+    return {
+        "message": "Webhook batch received",
+        "received": len(data.ids),
+        "queued": queued,
+        "merged": len(events) - queued,
+        "bills": [{"bill_id": bill_id, "status": "queued" if q else "merged", "merged": m} for bill_id, (q, m) in events.items()],
+        "ingest_ms": round(elapsed * 1000, 2),
+    }
+
+
+@router.get("/queues", status_code=status.HTTP_200_OK)
+def realm_queues():
+    """
+    Bills waiting and in flight per QuickBooks company (fair scheduling).
+    """
+    return {"realms": realm_queue_stats()}
+
+
+@router.get("/outbox", status_code=status.HTTP_200_OK)
+def webhook_outbox():
+    """
+    Webhook events stored and not yet relayed to the queue.
+    """
+    return outbox_status()
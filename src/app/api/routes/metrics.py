@@ -0,0 +1,61 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ...core.celery_worker import celery
+from ...shared.http_pool import pool_stats
+from ...utils.metrics import metrics
+from ...services.realm_scheduler import realm_queue_stats
+
+router = APIRouter()
+
+
+def _realm_backlog() -> tuple[float, float]:
+    # Bills held back by the fair scheduler don't show in the Celery queue yet
+    try:
+        stats = realm_queue_stats()
+        return float(sum(r["waiting"] for r in stats)), float(sum(r["in_flight"] for r in stats))
+    except Exception as e:
+        print(f"[Metrics] could not read realm queues: {e}")
+        return float("nan"), float("nan")
+
+
+def _queue_depth() -> float:
+    try:
+        with celery.connection_for_read() as conn:
+            return float(conn.default_channel.client.llen(celery.conf.task_default_queue))
+    except Exception as e:
+        print(f"[Metrics] could not read Celery queue depth: {e}")
+        return float("nan")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus scrape endpoint. Counters and histograms are written to Redis by
+    the web app and every Celery worker, so this shows the whole deployment.
+    """
+    # Imported here: it loads the Airtable models, which nothing else in the web app needs at startup
+    from ...services.airtable_writer import pending_writes, dead_letter_writes
+    try:
+        pending = float(pending_writes())
+        dead = float(dead_letter_writes())
+    except Exception:
+        pending = dead = float("nan")
+    waiting, in_flight = _realm_backlog()
+    gauges = {
+        "celery_queue_depth": ("Tasks waiting in the Celery queue", _queue_depth()),
+        "realm_bills_waiting": ("Bills waiting in the per-company queues of the fair scheduler", waiting),
+        "realm_bills_in_flight": ("Bills holding a per-company slot of the fair scheduler", in_flight),
+        "airtable_pending_writes": ("Airtable writes buffered by the write-behind queue", pending),
+        "airtable_dead_letter_writes": ("Buffered Airtable writes rejected too many times (airtable:writes:dead)", dead),
+    }
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/http-pools")
+def http_pool_stats():
+    """
+    Keep-alive connection pools of this web process (each worker process has its own;
+    http_connections_opened_total in /metrics covers all of them).
+    """
+    return {"pools": pool_stats()}
@@ -1,13 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
 from fastapi.responses import RedirectResponse
-from intuitlib.enums import Scopes
-from sqlalchemy.orm import Session
 import datetime as dt
 
-from ...shared.quickbooks import get_auth_client, now_utc
 from ...shared.database import get_db
-from ...database.crud_qbo import upsert_tokens
 from ...core.config import QUICKBOOKS_ENV
+from ...utils.qb_cache import reference_cache, REFERENCE_TTLS
+from ...utils.rate_limit import qbo_rate_limiter
+from ...utils.circuit_breaker import circuit_breaker, quickbooks_circuit, OAUTH_CIRCUIT
 
 router = APIRouter()
 
@@ -17,17 +17,22 @@ def qbo_connect():
     """
     Starts the OAuth flow. You only need to do this once to seed the refresh token.
     """
+    # QuickBooks SDK loaded on first use, only these two routes need it in the web app
+    from intuitlib.enums import Scopes
+    from ...shared.quickbooks import get_auth_client
     auth_client = get_auth_client()
     url = auth_client.get_authorization_url([Scopes.ACCOUNTING])
     return RedirectResponse(url)
 
 
 @router.get("/callback", status_code=status.HTTP_200_OK)
-def qbo_callback(code: str, realmId: str, db: Session = Depends(get_db)):
+def qbo_callback(code: str, realmId: str, db=Depends(get_db)):
     """
     OAuth redirect URI. Exchanges code for tokens and persists both access & refresh tokens.
     After this, the server can refresh tokens automatically without a browser.
     """
+    from ...shared.quickbooks import get_auth_client, now_utc, publish_tokens_rotated
+    from ...database.crud_qbo import upsert_tokens
     try:
         auth_client = get_auth_client()
         # Exchange authorization code for tokens
@@ -54,6 +59,8 @@ def qbo_callback(code: str, realmId: str, db: Session = Depends(get_db)):
             refresh_token_expires_at=refresh_expires_at,
             scopes="accounting",
         )
+        # Workers holding a client for this company must pick up the new tokens
+        publish_tokens_rotated(realmId)
 
         return {
             "message": "QuickBooks Online connected successfully.",
@@ -67,3 +74,47 @@ def qbo_callback(code: str, realmId: str, db: Session = Depends(get_db)):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail={"message": "Failed to complete QuickBooks OAuth callback", "error": str(e)},
         )
+
+
+@router.get("/cache/{realm_id}/stats", status_code=status.HTTP_200_OK)
+def qbo_cache_stats(realm_id: str):
+    """
+    Hit/miss counters of the shared QuickBooks reference-data cache for a company.
+    """
+    return {"company": realm_id, "stats": reference_cache.stats(realm_id)}
+
+
+@router.delete("/cache/{realm_id}", status_code=status.HTTP_200_OK)
+def qbo_cache_invalidate(realm_id: str, kind: Optional[str] = None, lookup: Optional[str] = None):
+    """
+    Drops cached vendors/customers/departments/accounts for a company.
+    Use it after renaming or deactivating records directly in QuickBooks.
+    """
+    if kind and kind not in REFERENCE_TTLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"message": f"Unknown cache kind '{kind}'", "kinds": list(REFERENCE_TTLS)},
+        )
+    deleted = reference_cache.invalidate(realm_id, kind, lookup)
+    return {"company": realm_id, "kind": kind, "lookup": lookup, "deleted": deleted}
+
+
+@router.get("/rate-limit/{realm_id}", status_code=status.HTTP_200_OK)
+def qbo_rate_limit_stats(realm_id: str):
+    """
+    Current state of the shared QuickBooks rate limiter for a company.
+    """
+    return {"company": realm_id, "enabled": qbo_rate_limiter.enabled, "stats": qbo_rate_limiter.stats(realm_id)}
+
+
+@router.get("/circuit/{realm_id}", status_code=status.HTTP_200_OK)
+def qbo_circuit_stats(realm_id: str):
+    """
+    State of the circuit breakers for a company and for Intuit OAuth.
+    """
+    return {
+        "company": realm_id,
+        "enabled": circuit_breaker.enabled,
+        "quickbooks": circuit_breaker.stats(quickbooks_circuit(realm_id)),
+        "oauth": circuit_breaker.stats(OAUTH_CIRCUIT),
+    }
@@ -0,0 +1,174 @@
+"""
+Bulk backfill of Airtable bills into QuickBooks, e.g. when onboarding a company
+or after an outage:
+
+    python -m src.app.core.backfill --name acme-2024 --formula "{Status}='Send bill to QB'"
+    python -m src.app.core.backfill --name march --view "March bills" --concurrency 16
+
+Bills are streamed page by page and sent through bill_service, at most
+--concurrency at a time. Every page is checkpointed in the SQL database, so
+running the same command again (same --name) resumes where it stopped.
+"""
+import argparse
+import time
+
+from requests.exceptions import HTTPError
+
+from .config import BILL_CONCURRENCY
+from .exceptions import DomainError, RetryableSystemError
+from ..database.engine import Base, SessionLocal, engine
+from ..database import models
+from ..database.crud_backfill import start_run, reset_run, finished_bill_ids, record_outcomes, finish_run
+from ..models.Bill import Bill as BillModel
+from ..services.bill_loader import hydrate_bills
+from ..services.bill_service import process_bills_concurrently
+from ..services.webhook_coalescer import bill_in_flight, bill_processing_lock
+from ..utils.aio import run_async
+
+# Airtable returns at most 100 records per page
+PAGE_SIZE = 100
+
+
+def _outcome(e: Exception | None) -> tuple[str, str | None]:
+    if e is None:
+        return "ok", None
+    # Same policy as process_bill_task: domain 4xx errors are final, the rest are retried on resume
+    if isinstance(e, DomainError) and not isinstance(e, RetryableSystemError):
+        return "failed", str(e)
+    return "retryable", str(e)
+
+
+class Progress:
+    def __init__(self, total: int | None, already_done: int):
+        self.total = total
+        self.already_done = already_done
+        self.handled = 0
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started = time.monotonic()
+
+    def add(self, outcomes: dict, skipped: int):
+        self.handled += len(outcomes)
+        self.ok += sum(1 for outcome, _ in outcomes.values() if outcome == "ok")
+        self.failed += sum(1 for outcome, _ in outcomes.values() if outcome != "ok")
+        self.skipped += skipped
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.handled / elapsed if elapsed > 0 else 0.0
+        text = f"[Backfill] {self.handled} bills this run ({self.ok} ok, {self.failed} failed, {self.skipped} skipped) | {rate:.2f} bills/s"
+        if self.total is not None:
+            remaining = max(0, self.total - self.already_done - self.handled - self.skipped)
+            eta = f"{remaining / rate / 60:.1f} min" if rate > 0 else "?"
+            text += f" | {self.already_done + self.handled + self.skipped}/{self.total} | ETA {eta}"
+        return text
+
+
+def _stream_pages(view: str | None, formula: str | None, fields: list[str] | None = None):
+    options = {"page_size": PAGE_SIZE}
+    if view:
+        options["view"] = view
+    if formula:
+        options["formula"] = formula
+    if fields:
+        options["fields"] = fields
+    return BillModel.meta.table.iterate(**options)
+
+
+def count_bills(view: str | None, formula: str | None) -> int:
+    # One cheap pass with a single field, only to show an ETA
+    return sum(len(page) for page in _stream_pages(view, formula, fields=["Bill #"]))
+
+
+def _process_page(run, db, records: list, done: set[str], company_id: str | None, concurrency: int, progress: Progress):
+    bills = [BillModel.from_record(record) for record in records]
+    todo = [bill for bill in bills if bill.id not in done]
+
+    # Don't race webhook tasks or the sweeper on the same bill
+    claimed, locks, skipped = {}, [], 0
+    for bill in todo:
+        lock = bill_processing_lock(bill.id)
+        if bill_in_flight(bill.id, company_id) or not lock.acquire():
+            skipped += 1
+            continue
+        locks.append(lock)
+        claimed[bill.id] = bill
+
+    try:
+        if claimed:
+            hydrate_bills(list(claimed.values()))
+            results = run_async(process_bills_concurrently(list(claimed), company_id, concurrency, bills=claimed))
+        else:
+            results = {}
+    finally:
+        for lock in locks:
+            lock.release()
+
+    outcomes = {bill_id: _outcome(e) for bill_id, e in results.items()}
+    if outcomes:
+        record_outcomes(db, run, outcomes)
+        done.update(bill_id for bill_id, (outcome, _) in outcomes.items() if outcome != "retryable")
+    progress.add(outcomes, skipped)
+    print(progress.line())
+
+
+def backfill(name: str, view: str | None, formula: str | None, company_id: str | None = None,
+             concurrency: int = BILL_CONCURRENCY, restart: bool = False, count: bool = True):
+    db = SessionLocal()
+    try:
+        if restart:
+            reset_run(db, name)
+        run = start_run(db, name, view, formula, company_id)
+        if (run.view, run.formula) != (view, formula):
+            print(f"[Backfill] warning: run '{name}' was started with view={run.view!r} formula={run.formula!r}")
+
+        done = finished_bill_ids(db, name)
+        total = count_bills(view, formula) if count else None
+        progress = Progress(total, already_done=len(done))
+        print(f"[Backfill] run '{name}': {len(done)} bills already done" + (f", {total} match" if total is not None else ""))
+
+        while True:
+            try:
+                for records in _stream_pages(view, formula):
+                    _process_page(run, db, records, done, company_id, concurrency, progress)
+                break
+            except HTTPError as e:
+                # Airtable drops the pagination cursor when pages are slow to consume;
+                # start over, the checkpoint skips every bill already handled
+                if "LIST_RECORDS_ITERATOR_NOT_AVAILABLE" not in str(e):
+                    raise
+                print("[Backfill] Airtable pagination expired, streaming again from the checkpoint")
+
+        finish_run(db, run)
+        print(f"[Backfill] run '{name}' finished: {run.processed} ok, {run.failed} failed in total")
+        if run.failed:
+            print("[Backfill] bills with transient errors are sent again if you run the same command")
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send Airtable bills to QuickBooks in bulk, resumably.")
+    parser.add_argument("--name", required=True, help="Run name; run it again with the same name to resume")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--view", help="Airtable view of the Bills table")
+    source.add_argument("--formula", help="Airtable formula selecting the bills")
+    parser.add_argument("--company-id", default=None, help="QuickBooks realm id (default company if omitted)")
+    parser.add_argument("--concurrency", type=int, default=BILL_CONCURRENCY, help="Bills in flight at once")
+    parser.add_argument("--restart", action="store_true", help="Forget the checkpoint of this run and start over")
+    parser.add_argument("--no-count", action="store_true", help="Skip the counting pass (no ETA)")
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    backfill(
+        args.name, args.view, args.formula,
+        company_id=args.company_id,
+        concurrency=args.concurrency,
+        restart=args.restart,
+        count=not args.no_count,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,11 @@ project_root = Path(__file__).parent.parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
+try:
+    from .config import AIRTABLE_WRITE_BEHIND, AIRTABLE_WRITE_FLUSH_INTERVAL_SECONDS, DOC_NUMBER_INDEX_ENABLED, DOC_NUMBER_SYNC_INTERVAL_SECONDS, BILL_SWEEP_ENABLED, BILL_SWEEP_INTERVAL_SECONDS, QBO_TOKEN_REFRESHER_ENABLED, QBO_TOKEN_REFRESH_INTERVAL_SECONDS, REALM_FAIR_SCHEDULING, REALM_DISPATCH_INTERVAL_SECONDS
+except ImportError:
+    from src.app.core.config import AIRTABLE_WRITE_BEHIND, AIRTABLE_WRITE_FLUSH_INTERVAL_SECONDS, DOC_NUMBER_INDEX_ENABLED, DOC_NUMBER_SYNC_INTERVAL_SECONDS, BILL_SWEEP_ENABLED, BILL_SWEEP_INTERVAL_SECONDS, QBO_TOKEN_REFRESHER_ENABLED, QBO_TOKEN_REFRESH_INTERVAL_SECONDS, REALM_FAIR_SCHEDULING, REALM_DISPATCH_INTERVAL_SECONDS
+
 # Configuración del worker de Celery
 celery = Celery(
     'worker',
@@ -23,9 +28,35 @@ celery.conf.update(
     accept_content=['json'],
 )
 
-# Import tasks to register them with Celery
-try:
-    from ..tasks import bill_task
-except ImportError:
-    # If direct import fails, try with the full path
-    from src.app.tasks import bill_task
\ No newline at end of file
+# Periodic jobs (run `celery -A src.app.core.celery_worker beat` next to the worker)
+celery.conf.beat_schedule = {}
+if AIRTABLE_WRITE_BEHIND:
+    celery.conf.beat_schedule['flush-airtable-writes'] = {
+        'task': 'app.task.airtable_task.flush_airtable_writes_task',
+        'schedule': AIRTABLE_WRITE_FLUSH_INTERVAL_SECONDS,
+    }
+if DOC_NUMBER_INDEX_ENABLED:
+    celery.conf.beat_schedule['sync-doc-number-index'] = {
+        'task': 'app.task.qbo_task.sync_doc_number_index_task',
+        'schedule': DOC_NUMBER_SYNC_INTERVAL_SECONDS,
+    }
+if BILL_SWEEP_ENABLED:
+    celery.conf.beat_schedule['sweep-bills-to-send'] = {
+        'task': 'app.task.bill_task.sweep_bills_task',
+        'schedule': BILL_SWEEP_INTERVAL_SECONDS,
+    }
+if QBO_TOKEN_REFRESHER_ENABLED:
+    celery.conf.beat_schedule['refresh-qbo-tokens'] = {
+        'task': 'app.task.qbo_task.refresh_qbo_tokens_task',
+        'schedule': QBO_TOKEN_REFRESH_INTERVAL_SECONDS,
+    }
+if REALM_FAIR_SCHEDULING:
+    celery.conf.beat_schedule['dispatch-realm-bills'] = {
+        'task': 'app.task.bill_task.dispatch_realm_bills_task',
+        'schedule': REALM_DISPATCH_INTERVAL_SECONDS,
+    }
+
+# Task modules are imported by the worker at startup, not here: the web process
+# only sends tasks by name and doesn't need their dependencies (QuickBooks SDK, models...)
+_app_package = __package__.rsplit(".", 1)[0]
+celery.conf.include = [f"{_app_package}.tasks.{name}" for name in ("bill_task", "airtable_task", "qbo_task")]
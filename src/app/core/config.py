@@ -25,3 +25,113 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 
 PORT = int(os.getenv("PORT", "8080"))
+
+# QuickBooks reference-data cache (vendors, customers, departments, accounts)
+QBO_REFERENCE_CACHE_ENABLED = os.getenv("QBO_REFERENCE_CACHE_ENABLED", "true").lower() == "true"
+QBO_REFERENCE_CACHE_TTL_SECONDS = int(os.getenv("QBO_REFERENCE_CACHE_TTL_SECONDS", str(6 * 3600)))
+QBO_ACCOUNT_CACHE_TTL_SECONDS = int(os.getenv("QBO_ACCOUNT_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Write-behind buffer for Airtable writes (PDF Log entries and Bill status updates)
+AIRTABLE_WRITE_BEHIND = os.getenv("AIRTABLE_WRITE_BEHIND", "false").lower() == "true"
+AIRTABLE_WRITE_FLUSH_INTERVAL_SECONDS = float(os.getenv("AIRTABLE_WRITE_FLUSH_INTERVAL_SECONDS", "5"))
+AIRTABLE_WRITE_FLUSH_MAX_RECORDS = int(os.getenv("AIRTABLE_WRITE_FLUSH_MAX_RECORDS", "500"))
+# Flushes a record rejected by Airtable (4xx) is tried in before it goes to the dead-letter list
+AIRTABLE_WRITE_MAX_ATTEMPTS = int(os.getenv("AIRTABLE_WRITE_MAX_ATTEMPTS", "5"))
+
+# Async pipeline: bills processed at once per worker process and threads for blocking SDK calls
+BILL_CONCURRENCY = int(os.getenv("BILL_CONCURRENCY", "8"))
+BILL_IO_THREADS = int(os.getenv("BILL_IO_THREADS", "32"))
+
+# Local DocNumber index used for duplicate detection
+DOC_NUMBER_INDEX_ENABLED = os.getenv("DOC_NUMBER_INDEX_ENABLED", "true").lower() == "true"
+DOC_NUMBER_INDEX_MAX_AGE_SECONDS = int(os.getenv("DOC_NUMBER_INDEX_MAX_AGE_SECONDS", "900"))
+DOC_NUMBER_SYNC_INTERVAL_SECONDS = int(os.getenv("DOC_NUMBER_SYNC_INTERVAL_SECONDS", "300"))
+
+# Per-realm QBO rate limiter shared by all workers (Intuit allows 500 req/min and 10 concurrent per realm)
+QBO_RATE_LIMIT_ENABLED = os.getenv("QBO_RATE_LIMIT_ENABLED", "true").lower() == "true"
+QBO_RATE_LIMIT_PER_MINUTE = int(os.getenv("QBO_RATE_LIMIT_PER_MINUTE", "450"))
+QBO_RATE_LIMIT_BURST = int(os.getenv("QBO_RATE_LIMIT_BURST", "20"))
+QBO_MAX_CONCURRENT_REQUESTS = int(os.getenv("QBO_MAX_CONCURRENT_REQUESTS", "8"))
+QBO_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("QBO_RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+
+# Airtable rate governor shared by web and worker processes (Airtable allows 5 req/s per base)
+AIRTABLE_GOVERNOR_ENABLED = os.getenv("AIRTABLE_GOVERNOR_ENABLED", "true").lower() == "true"
+AIRTABLE_REQUESTS_PER_SECOND = float(os.getenv("AIRTABLE_REQUESTS_PER_SECOND", "5"))
+AIRTABLE_GOVERNOR_MAX_WAIT_SECONDS = float(os.getenv("AIRTABLE_GOVERNOR_MAX_WAIT_SECONDS", "60"))
+AIRTABLE_THROTTLE_PAUSE_SECONDS = float(os.getenv("AIRTABLE_THROTTLE_PAUSE_SECONDS", "30"))
+AIRTABLE_MAX_THROTTLE_RETRIES = int(os.getenv("AIRTABLE_MAX_THROTTLE_RETRIES", "3"))
+
+# Webhook coalescing: repeated events for a bill inside the window produce one task
+WEBHOOK_COALESCE_ENABLED = os.getenv("WEBHOOK_COALESCE_ENABLED", "true").lower() == "true"
+WEBHOOK_COALESCE_WINDOW_SECONDS = int(os.getenv("WEBHOOK_COALESCE_WINDOW_SECONDS", "5"))
+WEBHOOK_COALESCE_TTL_SECONDS = int(os.getenv("WEBHOOK_COALESCE_TTL_SECONDS", "300"))
+BILL_PROCESSING_LOCK_TTL_SECONDS = int(os.getenv("BILL_PROCESSING_LOCK_TTL_SECONDS", "300"))
+# Most bill ids accepted by one POST /bills/webhook/batch
+WEBHOOK_BATCH_MAX_BILLS = int(os.getenv("WEBHOOK_BATCH_MAX_BILLS", "1000"))
+
+# Webhook outbox: events are stored in the SQL database and relayed to Celery by the web app,
+# so they aren't lost (or rejected) while Redis/the broker is down
+WEBHOOK_OUTBOX_ENABLED = os.getenv("WEBHOOK_OUTBOX_ENABLED", "true").lower() == "true"
+WEBHOOK_OUTBOX_RELAY_ENABLED = os.getenv("WEBHOOK_OUTBOX_RELAY_ENABLED", "true").lower() == "true"
+WEBHOOK_OUTBOX_RELAY_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_OUTBOX_RELAY_INTERVAL_SECONDS", "1"))
+WEBHOOK_OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("WEBHOOK_OUTBOX_MAX_BACKOFF_SECONDS", "30"))
+WEBHOOK_OUTBOX_BATCH_SIZE = int(os.getenv("WEBHOOK_OUTBOX_BATCH_SIZE", "500"))
+WEBHOOK_OUTBOX_CLAIM_LEASE_SECONDS = int(os.getenv("WEBHOOK_OUTBOX_CLAIM_LEASE_SECONDS", "60"))
+WEBHOOK_OUTBOX_RETENTION_HOURS = int(os.getenv("WEBHOOK_OUTBOX_RETENTION_HOURS", "24"))
+
+# Scheduled sweep of bills in "Send bill to QB" (doesn't depend on webhooks)
+BILL_SWEEP_ENABLED = os.getenv("BILL_SWEEP_ENABLED", "true").lower() == "true"
+BILL_SWEEP_INTERVAL_SECONDS = int(os.getenv("BILL_SWEEP_INTERVAL_SECONDS", "60"))
+BILL_SWEEP_MIN_AGE_SECONDS = int(os.getenv("BILL_SWEEP_MIN_AGE_SECONDS", "60"))
+BILL_SWEEP_MAX_BILLS = int(os.getenv("BILL_SWEEP_MAX_BILLS", "300"))
+
+# Celery retries of transient errors: exponential backoff with full jitter and one budget per error class
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "600"))
+RETRY_BUDGET_THROTTLED = int(os.getenv("RETRY_BUDGET_THROTTLED", "8"))
+RETRY_BUDGET_SERVER_ERROR = int(os.getenv("RETRY_BUDGET_SERVER_ERROR", "5"))
+RETRY_BUDGET_NETWORK = int(os.getenv("RETRY_BUDGET_NETWORK", "5"))
+RETRY_BUDGET_AUTH = int(os.getenv("RETRY_BUDGET_AUTH", "2"))
+RETRY_BUDGET_OTHER = int(os.getenv("RETRY_BUDGET_OTHER", "3"))
+
+# Circuit breakers per upstream (Airtable base, QBO realm, Intuit OAuth), state shared in Redis
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_FAILURE_WINDOW_SECONDS = int(os.getenv("CIRCUIT_FAILURE_WINDOW_SECONDS", "30"))
+CIRCUIT_OPEN_SECONDS = int(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+# Background QBO token refresher (Celery beat): rotates tokens expiring within the refresh-ahead window
+QBO_TOKEN_REFRESHER_ENABLED = os.getenv("QBO_TOKEN_REFRESHER_ENABLED", "true").lower() == "true"
+QBO_TOKEN_REFRESH_INTERVAL_SECONDS = int(os.getenv("QBO_TOKEN_REFRESH_INTERVAL_SECONDS", "300"))
+QBO_TOKEN_REFRESH_AHEAD_SECONDS = int(os.getenv("QBO_TOKEN_REFRESH_AHEAD_SECONDS", "1200"))
+
+# Idempotency: bills already sent with the same content skip every lookup (bill_submissions table)
+BILL_IDEMPOTENCY_ENABLED = os.getenv("BILL_IDEMPOTENCY_ENABLED", "true").lower() == "true"
+# Airtable Bills field that gets the QBO Bill Id; empty (default) = don't write it.
+# Create the field in the base before setting it: Airtable rejects unknown fields
+AIRTABLE_QBO_BILL_ID_FIELD = os.getenv("AIRTABLE_QBO_BILL_ID_FIELD", "")
+
+# Fair scheduling across QuickBooks companies: bills wait in per-realm queues in Redis and are
+# released to Celery round-robin, `weight` bills per realm per round, at most the cap in flight per realm
+REALM_FAIR_SCHEDULING = os.getenv("REALM_FAIR_SCHEDULING", "true").lower() == "true"
+REALM_MAX_IN_FLIGHT = int(os.getenv("REALM_MAX_IN_FLIGHT", "4"))
+REALM_SLOT_LEASE_SECONDS = int(os.getenv("REALM_SLOT_LEASE_SECONDS", "300"))
+REALM_DISPATCH_INTERVAL_SECONDS = int(os.getenv("REALM_DISPATCH_INTERVAL_SECONDS", "5"))
+# "realm_id:value" pairs separated by commas, e.g. "9130000000000001:3,9130000000000002:1"
+REALM_WEIGHTS = {k.strip(): int(v) for k, v in (p.split(":") for p in os.getenv("REALM_WEIGHTS", "").split(",") if ":" in p)}
+REALM_MAX_IN_FLIGHT_OVERRIDES = {k.strip(): int(v) for k, v in (p.split(":") for p in os.getenv("REALM_MAX_IN_FLIGHT_OVERRIDES", "").split(",") if ":" in p)}
+
+# Keep-alive HTTP connection pools per worker process, one per upstream
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+QBO_HTTP_POOL_SIZE = int(os.getenv("QBO_HTTP_POOL_SIZE", "10"))
+QBO_HTTP_TIMEOUT_SECONDS = float(os.getenv("QBO_HTTP_TIMEOUT_SECONDS", "60"))
+AIRTABLE_HTTP_POOL_SIZE = int(os.getenv("AIRTABLE_HTTP_POOL_SIZE", "10"))
+AIRTABLE_HTTP_TIMEOUT_SECONDS = float(os.getenv("AIRTABLE_HTTP_TIMEOUT_SECONDS", "30"))
+
+# Prometheus-style metrics kept in Redis (served at /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Upstream endpoint overrides (local stand-ins in benchmarks/, debugging proxies); empty = real APIs
+AIRTABLE_API_URL = os.getenv("AIRTABLE_API_URL", "")
+QUICKBOOKS_API_URL = os.getenv("QUICKBOOKS_API_URL", "")
@@ -22,3 +22,27 @@ class BusinessValidationError(DomainError):
 
 class RetryableSystemError(DomainError):
     status_code = 503
+
+class UpstreamError(RetryableSystemError):
+    """Error transitorio de Airtable o QuickBooks, clasificado para programar el reintento."""
+    # Error classes; each one has its own retry budget (utils/retry.py)
+    THROTTLED = "throttled"
+    SERVER_ERROR = "server_error"
+    NETWORK = "network"
+    AUTH = "auth"
+    CIRCUIT_OPEN = "circuit_open"
+
+    def __init__(self, message: str, *, upstream: str = "unknown", kind: str = SERVER_ERROR,
+                 retry_after: float | None = None, status_code: int | None = None, payload: dict | None = None):
+        super().__init__(message, status_code=status_code, payload=payload)
+        self.upstream = upstream
+        self.kind = kind
+        # Seconds the upstream asked us to wait (Retry-After), if it said
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    """El circuit breaker del upstream está abierto: no se llamó, reintentar en retry_after segundos."""
+
+    def __init__(self, message: str, *, upstream: str = "unknown", retry_after: float | None = None, payload: dict | None = None):
+        super().__init__(message, upstream=upstream, kind=UpstreamError.CIRCUIT_OPEN, retry_after=retry_after, payload=payload)
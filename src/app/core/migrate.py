@@ -0,0 +1,39 @@
+"""
+Creates the SQL tables (QBO tokens, DocNumber index, backfill checkpoints,
+bill submissions, webhook outbox). Run it once per deploy, before the web app
+and the workers:
+
+    python -m src.app.core.migrate
+
+Tables that already exist are left untouched (SQLAlchemy create_all), so it is
+safe to run on every deploy. The web app no longer does this when it's imported.
+"""
+import time
+
+from sqlalchemy import inspect
+
+from ..database.engine import Base, engine
+from ..database import models  # noqa: F401 (registers the tables)
+
+
+def migrate() -> list[str]:
+    """
+    Create missing tables. Returns the names of the tables it created.
+    """
+    existing = set(inspect(engine).get_table_names())
+    Base.metadata.create_all(bind=engine)
+    return [name for name in Base.metadata.tables if name not in existing]
+
+
+def main():
+    started = time.perf_counter()
+    created = migrate()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if created:
+        print(f"[Migrate] created tables: {', '.join(created)} ({elapsed_ms:.0f} ms)")
+    else:
+        print(f"[Migrate] schema up to date ({elapsed_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
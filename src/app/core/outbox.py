@@ -0,0 +1,43 @@
+"""
+Inspect or drain the webhook outbox by hand, e.g. when the web app's relay is
+disabled (WEBHOOK_OUTBOX_RELAY_ENABLED=false) or after a long broker outage:
+
+    python -m src.app.core.outbox --stats
+    python -m src.app.core.outbox --drain
+    python -m src.app.core.outbox --purge --retention-hours 6
+
+Draining claims events like the web app's relay, so both can run at once.
+"""
+import argparse
+import json
+import time
+
+from .config import WEBHOOK_OUTBOX_BATCH_SIZE, WEBHOOK_OUTBOX_RETENTION_HOURS
+from ..services.webhook_outbox import drain_outbox, purge_outbox, outbox_status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, drain or purge the webhook outbox.")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--stats", action="store_true", help="Show pending events")
+    action.add_argument("--drain", action="store_true", help="Relay every pending event to the queue now")
+    action.add_argument("--purge", action="store_true", help="Delete events relayed more than --retention-hours ago")
+    parser.add_argument("--batch-size", type=int, default=WEBHOOK_OUTBOX_BATCH_SIZE, help="Events per relay batch")
+    parser.add_argument("--retention-hours", type=int, default=WEBHOOK_OUTBOX_RETENTION_HOURS)
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        print(json.dumps(outbox_status(), indent=2))
+    elif args.drain:
+        started = time.perf_counter()
+        dispatched, failed = drain_outbox(args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"[Outbox] relayed {dispatched} events in {elapsed:.1f}s" + (f", {failed} kept (queue unavailable)" if failed else ""))
+        if failed:
+            raise SystemExit(1)
+    else:
+        print(f"[Outbox] purged {purge_outbox(args.retention_hours)} relayed events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Cold-start import time of the web app or a worker, measured in a fresh
+interpreter with `python -X importtime`:
+
+    python -m src.app.core.startup_profile web
+    python -m src.app.core.startup_profile worker --top 20
+
+Prints the total and the packages that cost the most, so startup time can be
+tracked as a number between releases.
+"""
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+
+# src.app (or app when src/ is on the path, as in benchmarks/)
+APP_PACKAGE = __package__.rsplit(".", 1)[0]
+
+TARGETS = {
+    # What uvicorn imports
+    "web": [f"{APP_PACKAGE}.main"],
+    # What `celery worker` imports: the app, then its task modules (celery.conf.include)
+    "worker": [f"{APP_PACKAGE}.core.celery_worker"] + [
+        f"{APP_PACKAGE}.tasks.{name}" for name in ("bill_task", "airtable_task", "qbo_task")
+    ],
+}
+
+
+def measure(modules: list[str]) -> list[tuple[int, int, str]]:
+    """
+    (self µs, cumulative µs, module) for every module imported by `modules`.
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def report(target: str, rows: list[tuple[int, int, str]], top: int):
+    total_us = sum(self_us for self_us, _, _ in rows)
+    by_package: dict[str, int] = defaultdict(int)
+    for self_us, _, name in rows:
+        package = name.split(".")[0]
+        if name.startswith(APP_PACKAGE + "."):
+            # Our own modules, one line per subpackage (api, services, shared...)
+            package = ".".join(name.split(".")[: APP_PACKAGE.count(".") + 2])
+        by_package[package] += self_us
+
+    print(f"[Startup] {target}: {total_us / 1000:.0f} ms to import ({len(rows)} modules)")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {package}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import time.")
+    parser.add_argument("target", choices=sorted(TARGETS), help="Process to measure")
+    parser.add_argument("--top", type=int, default=15, help="How many packages to list")
+    args = parser.parse_args(argv)
+    report(args.target, measure(TARGETS[args.target]), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import datetime as dt
+from typing import Optional
+from sqlalchemy.orm import Session
+from .models.Backfill import BackfillRun, BackfillBill
+
+# Bills with these outcomes are not sent again when a run resumes
+FINAL_OUTCOMES = ("ok", "failed")
+
+
+def get_run(db: Session, name: str) -> Optional[BackfillRun]:
+    return db.query(BackfillRun).filter_by(name=name).first()
+
+
+def start_run(db: Session, name: str, view: Optional[str], formula: Optional[str], company_id: Optional[str]) -> BackfillRun:
+    """
+    Create the run, or reopen it with the same name to resume.
+    """
+    run = get_run(db, name)
+    if run is None:
+        run = BackfillRun(name=name, view=view, formula=formula, company_id=company_id, processed=0, failed=0)
+        db.add(run)
+    run.status = "running"
+    run.finished_at = None
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def reset_run(db: Session, name: str):
+    db.query(BackfillBill).filter_by(run_name=name).delete()
+    db.query(BackfillRun).filter_by(name=name).delete()
+    db.commit()
+
+
+def finished_bill_ids(db: Session, name: str) -> set[str]:
+    rows = (
+        db.query(BackfillBill.bill_id)
+        .filter(BackfillBill.run_name == name, BackfillBill.outcome.in_(FINAL_OUTCOMES))
+        .all()
+    )
+    return {row.bill_id for row in rows}
+
+
+def record_outcomes(db: Session, run: BackfillRun, outcomes: dict[str, tuple[str, Optional[str]]]):
+    """
+    Checkpoint a page of bills: bill_id -> (outcome, error). One commit per page.
+    """
+    for bill_id, (outcome, error) in outcomes.items():
+        db.merge(BackfillBill(run_name=run.name, bill_id=bill_id, outcome=outcome, error=error))
+    db.flush()
+    # Recount so bills retried on resume are not counted twice
+    bills = db.query(BackfillBill).filter(BackfillBill.run_name == run.name)
+    run.processed = bills.filter(BackfillBill.outcome == "ok").count()
+    run.failed = bills.filter(BackfillBill.outcome != "ok").count()
+    db.commit()
+
+
+def finish_run(db: Session, run: BackfillRun):
+    run.status = "done"
+    run.finished_at = dt.datetime.utcnow()
+    db.commit()
@@ -0,0 +1,106 @@
+from typing import Iterable, Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .models.QboBillIndex import QboBillDocNumber, QboBillIndexSync
+
+# Keep IN (...) lists well below database parameter limits
+IN_CHUNK_SIZE = 500
+# Rows per multi-row INSERT (4 parameters each)
+INSERT_CHUNK_SIZE = 200
+
+
+def find_doc_numbers(db: Session, realm_id: str, doc_numbers: Iterable[str]) -> set[str]:
+    """
+    Which of the given DocNumbers are already indexed for the realm.
+    """
+    doc_numbers = list({n for n in doc_numbers if n})
+    found: set[str] = set()
+    for start in range(0, len(doc_numbers), IN_CHUNK_SIZE):
+        chunk = doc_numbers[start:start + IN_CHUNK_SIZE]
+        rows = (
+            db.query(QboBillDocNumber.doc_number)
+            .filter(QboBillDocNumber.realm_id == realm_id, QboBillDocNumber.doc_number.in_(chunk))
+            .all()
+        )
+        found.update(row.doc_number for row in rows)
+    return found
+
+
+def _insert_ignoring_conflicts(db: Session):
+    # INSERT ... ON CONFLICT DO NOTHING where the database has it
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(QboBillDocNumber).on_conflict_do_nothing(index_elements=["realm_id", "doc_number"])
+
+
+def add_doc_numbers(db: Session, realm_id: str, items: Iterable[tuple[str, Optional[str]]], source: str) -> int:
+    """
+    Insert (doc_number, qbo_bill_id) pairs that are not indexed yet. Returns how many were added.
+    Safe when another worker indexes the same numbers at the same time.
+    """
+    by_number = {doc_number: bill_id for doc_number, bill_id in items if doc_number}
+    if not by_number:
+        return 0
+    existing = find_doc_numbers(db, realm_id, by_number.keys())
+    new_rows = [
+        {"realm_id": realm_id, "doc_number": doc_number, "qbo_bill_id": bill_id, "source": source}
+        for doc_number, bill_id in by_number.items()
+        if doc_number not in existing
+    ]
+    if not new_rows:
+        return 0
+    stmt = _insert_ignoring_conflicts(db)
+    if stmt is not None:
+        added = 0
+        for start in range(0, len(new_rows), INSERT_CHUNK_SIZE):
+            result = db.execute(stmt.values(new_rows[start:start + INSERT_CHUNK_SIZE]))
+            added += max(result.rowcount or 0, 0)
+        db.commit()
+        return added
+    try:
+        db.add_all([QboBillDocNumber(**row) for row in new_rows])
+        db.commit()
+        return len(new_rows)
+    except IntegrityError:
+        # Indexed by another worker in between: it's there either way
+        db.rollback()
+        return 0
+
+
+def remove_doc_numbers(db: Session, realm_id: str, doc_numbers: Iterable[str]) -> int:
+    """
+    Drop index entries of bills no longer in QuickBooks (deleted there). Returns how many were removed.
+    """
+    doc_numbers = list({n for n in doc_numbers if n})
+    removed = 0
+    for start in range(0, len(doc_numbers), IN_CHUNK_SIZE):
+        chunk = doc_numbers[start:start + IN_CHUNK_SIZE]
+        removed += (
+            db.query(QboBillDocNumber)
+            .filter(QboBillDocNumber.realm_id == realm_id, QboBillDocNumber.doc_number.in_(chunk))
+            .delete(synchronize_session=False)
+        )
+    db.commit()
+    return removed
+
+
+def get_index_sync(db: Session, realm_id: str) -> Optional[QboBillIndexSync]:
+    return db.query(QboBillIndexSync).filter_by(realm_id=realm_id).first()
+
+
+def mark_index_synced(db: Session, realm_id: str, synced_until, full: bool) -> QboBillIndexSync:
+    obj = get_index_sync(db, realm_id)
+    if obj is None:
+        obj = QboBillIndexSync(realm_id=realm_id)
+        db.add(obj)
+    obj.synced_until = synced_until
+    if full:
+        obj.last_full_sync_at = synced_until
+    db.commit()
+    db.refresh(obj)
+    return obj
@@ -0,0 +1,58 @@
+from typing import Optional
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from .models.BillSubmission import BillSubmission
+
+# Keep IN (...) lists well below database parameter limits
+IN_CHUNK_SIZE = 500
+
+
+def find_submission(db: Session, realm_id: str, bill_id: str, content_hash: str) -> Optional[BillSubmission]:
+    return (
+        db.query(BillSubmission)
+        .filter_by(bill_id=bill_id, content_hash=content_hash, realm_id=realm_id)
+        .first()
+    )
+
+
+def find_submissions(db: Session, realm_id: str, hashes: dict[str, str]) -> dict[str, BillSubmission]:
+    """
+    bill_id -> submission for the (bill_id, content_hash) pairs already sent to the realm.
+    """
+    pairs = list(hashes.items())
+    found: dict[str, BillSubmission] = {}
+    for start in range(0, len(pairs), IN_CHUNK_SIZE):
+        chunk = pairs[start:start + IN_CHUNK_SIZE]
+        rows = (
+            db.query(BillSubmission)
+            .filter(
+                tuple_(BillSubmission.bill_id, BillSubmission.content_hash).in_(chunk),
+                BillSubmission.realm_id == realm_id,
+            )
+            .all()
+        )
+        found.update({row.bill_id: row for row in rows})
+    return found
+
+
+def delete_submissions(db: Session, rows: list[BillSubmission]) -> int:
+    for row in rows:
+        db.delete(row)
+    db.commit()
+    return len(rows)
+
+
+def record_submissions(db: Session, realm_id: str, items: list[tuple[str, str, str, Optional[str]]]) -> int:
+    """
+    Upsert (bill_id, content_hash, outcome, qbo_bill_id) records. Returns how many were written.
+    """
+    for bill_id, content_hash, outcome, qbo_bill_id in items:
+        db.merge(BillSubmission(
+            bill_id=bill_id,
+            content_hash=content_hash,
+            realm_id=realm_id,
+            outcome=outcome,
+            qbo_bill_id=qbo_bill_id,
+        ))
+    db.commit()
+    return len(items)
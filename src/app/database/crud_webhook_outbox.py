@@ -0,0 +1,102 @@
+import datetime as dt
+from typing import Optional
+from sqlalchemy import insert, select, update, delete, func, or_
+from sqlalchemy.orm import Session
+from .models.WebhookOutbox import WebhookOutbox
+
+
+def append_events(db: Session, bill_ids: list[str], company_id: Optional[str]) -> int:
+    """
+    Append-only insert of webhook events, one statement for the batch. Returns how many were written.
+    """
+    if not bill_ids:
+        return 0
+    db.execute(insert(WebhookOutbox), [{"bill_id": bill_id, "company_id": company_id, "attempts": 0} for bill_id in bill_ids])
+    db.commit()
+    return len(bill_ids)
+
+
+def _claimable(lease_seconds: int):
+    expired = dt.datetime.utcnow() - dt.timedelta(seconds=lease_seconds)
+    return (
+        WebhookOutbox.dispatched_at.is_(None),
+        or_(WebhookOutbox.claimed_at.is_(None), WebhookOutbox.claimed_at < expired),
+    )
+
+
+def claim_events(db: Session, token: str, limit: int, lease_seconds: int) -> list[WebhookOutbox]:
+    """
+    Take the oldest `limit` undispatched events for the relay identified by `token`.
+    The UPDATE repeats the claimable condition, so two relays never own the same
+    event; a relay that dies leaves its events claimable again after the lease.
+    """
+    oldest = (
+        select(WebhookOutbox.id)
+        .where(*_claimable(lease_seconds))
+        .order_by(WebhookOutbox.id)
+        .limit(limit)
+    )
+    db.execute(
+        update(WebhookOutbox)
+        .where(WebhookOutbox.id.in_(oldest.scalar_subquery()), *_claimable(lease_seconds))
+        .values(claim_token=token, claimed_at=dt.datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return list(
+        db.scalars(
+            select(WebhookOutbox)
+            .where(WebhookOutbox.claim_token == token, WebhookOutbox.dispatched_at.is_(None))
+            .order_by(WebhookOutbox.id)
+        )
+    )
+
+
+def mark_dispatched(db: Session, token: str, ids: list[int]):
+    if not ids:
+        return
+    db.execute(
+        update(WebhookOutbox)
+        .where(WebhookOutbox.id.in_(ids), WebhookOutbox.claim_token == token)
+        .values(dispatched_at=dt.datetime.utcnow(), claim_token=None, attempts=WebhookOutbox.attempts + 1, last_error=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def release_events(db: Session, token: str, ids: list[int], error: Optional[str]):
+    """
+    Give claimed events back (broker unavailable), so the next relay pass retries them in order.
+    """
+    if not ids:
+        return
+    db.execute(
+        update(WebhookOutbox)
+        .where(WebhookOutbox.id.in_(ids), WebhookOutbox.claim_token == token)
+        .values(claim_token=None, claimed_at=None, attempts=WebhookOutbox.attempts + 1, last_error=error)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def purge_dispatched(db: Session, older_than: dt.datetime) -> int:
+    result = db.execute(
+        delete(WebhookOutbox)
+        .where(WebhookOutbox.dispatched_at.is_not(None), WebhookOutbox.dispatched_at < older_than)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount or 0
+
+
+def outbox_stats(db: Session) -> dict:
+    pending, oldest = db.execute(
+        select(func.count(WebhookOutbox.id), func.min(WebhookOutbox.received_at))
+        .where(WebhookOutbox.dispatched_at.is_(None))
+    ).one()
+    dispatched = db.scalar(select(func.count(WebhookOutbox.id)).where(WebhookOutbox.dispatched_at.is_not(None)))
+    return {
+        "pending": pending,
+        "oldest_pending_received_at": oldest.isoformat() if oldest else None,
+        "dispatched_kept": dispatched,
+    }
@@ -0,0 +1,37 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, func
+from ..engine import Base
+
+class BackfillRun(Base):
+    """
+    A named bulk backfill (see app/core/backfill.py) and its counters.
+    """
+    __tablename__ = "backfill_runs"
+
+    name = Column(String, primary_key=True)
+
+    view = Column(String, nullable=True)
+    formula = Column(Text, nullable=True)
+    company_id = Column(String, nullable=True)
+
+    status = Column(String, nullable=False, default="running")  # 'running' | 'done'
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+
+    started_at = Column(DateTime, server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class BackfillBill(Base):
+    """
+    Checkpoint: outcome of every bill a backfill run already handled.
+    """
+    __tablename__ = "backfill_bills"
+
+    run_name = Column(String, primary_key=True)
+    bill_id = Column(String, primary_key=True)
+
+    outcome = Column(String, nullable=False)  # 'ok' | 'failed' | 'retryable'
+    error = Column(Text, nullable=True)
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
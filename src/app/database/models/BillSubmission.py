@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, DateTime, func
+from ..engine import Base
+
+class BillSubmission(Base):
+    """
+    Idempotency record: a bill already sent to QuickBooks with exactly this content.
+    Resubmitting the same content finds it with one primary-key lookup.
+    """
+    __tablename__ = "bill_submissions"
+
+    bill_id = Column(String, primary_key=True)       # Airtable record id
+    content_hash = Column(String, primary_key=True)  # sha256 of the normalized BillSchema
+
+    realm_id = Column(String, nullable=False)
+    qbo_bill_id = Column(String, nullable=True)
+    outcome = Column(String, nullable=False)  # 'created' | 'duplicate'
+
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
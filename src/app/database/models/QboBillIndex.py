@@ -0,0 +1,32 @@
+from sqlalchemy import Column, String, DateTime, func
+from ..engine import Base
+
+class QboBillDocNumber(Base):
+    """
+    Local index of Bill DocNumbers already present in a QuickBooks company,
+    used to detect duplicates without a QBO query per bill.
+    """
+    __tablename__ = "qbo_bill_doc_numbers"
+
+    realm_id = Column(String, primary_key=True)
+    doc_number = Column(String, primary_key=True)
+
+    qbo_bill_id = Column(String, nullable=True)
+    source = Column(String, nullable=True)  # 'sync' | 'created' | 'qbo_check'
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class QboBillIndexSync(Base):
+    """
+    Sync state of the DocNumber index per QuickBooks company.
+    """
+    __tablename__ = "qbo_bill_index_syncs"
+
+    realm_id = Column(String, primary_key=True)
+
+    # Watermark for incremental syncs (MetaData.LastUpdatedTime >= watermark)
+    synced_until = Column(DateTime, nullable=True)
+    last_full_sync_at = Column(DateTime, nullable=True)
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index, func
+from ..engine import Base
+
+class WebhookOutbox(Base):
+    """
+    Webhook events accepted by the web app and not yet handed to Celery.
+    The relay (services/webhook_outbox.py) drains them in id order.
+    """
+    __tablename__ = "webhook_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)  # arrival order
+
+    bill_id = Column(String, nullable=False)     # Airtable record id
+    company_id = Column(String, nullable=True)   # QBO realm; default company when empty
+
+    # A relay owns the event while claim_token is set and claimed_at is within the lease
+    claim_token = Column(String, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    dispatched_at = Column(DateTime, nullable=True)
+
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+    received_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_webhook_outbox_pending", "dispatched_at", "id"),
+    )
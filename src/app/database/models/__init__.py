@@ -1,3 +1,7 @@
 from .QuickBooksToken import QboConnection
+from .QboBillIndex import QboBillDocNumber, QboBillIndexSync
+from .Backfill import BackfillRun, BackfillBill
+from .BillSubmission import BillSubmission
+from .WebhookOutbox import WebhookOutbox
 
-__all__ = ['QboConnection']
\ No newline at end of file
+__all__ = ['QboConnection', 'QboBillDocNumber', 'QboBillIndexSync', 'BackfillRun', 'BackfillBill', 'BillSubmission', 'WebhookOutbox']
@@ -1,18 +1,21 @@
 import os
+import time
+
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from pydantic import ValidationError
 
 from .api.routes.bills import router as router_bills
 from .api.routes.qbo import router as router_quickbooks
-from .core.config import APP_NAME, APP_VERSION
-
-from .database.engine import Base, engine
-from .database import models
+from .api.routes.airtable import router as router_airtable
+from .api.routes.metrics import router as router_metrics
+from .core.config import APP_NAME, APP_VERSION, WEBHOOK_OUTBOX_ENABLED, WEBHOOK_OUTBOX_RELAY_ENABLED
+from .services.webhook_outbox import outbox_relay
+from .shared.http_pool import close_pools
 
-
-Base.metadata.create_all(bind=engine)
+# Tables are created by `python -m src.app.core.migrate` (release step), not on import
 
 
 app = FastAPI()
@@ -25,8 +28,25 @@ app.add_middleware(
   allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_outbox_relay():
+  # Hands the webhooks stored in the outbox to Celery
+  if WEBHOOK_OUTBOX_ENABLED and WEBHOOK_OUTBOX_RELAY_ENABLED:
+    outbox_relay.start()
+
+@app.on_event("shutdown")
+async def stop_outbox_relay():
+  await outbox_relay.stop()
+
+@app.on_event("shutdown")
+def shutdown_http_pools():
+  close_pools()
+
+
 app.include_router(router_bills, prefix="/bills")
 app.include_router(router_quickbooks, prefix="/qbo")
+app.include_router(router_airtable, prefix="/airtable")
+app.include_router(router_metrics)
 
 router = APIRouter()
 
@@ -40,6 +60,8 @@ async def root():
 
 app.include_router(router)
 
+print(f"[Startup] web app imported in {(time.perf_counter() - _import_started) * 1000:.0f} ms")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
@@ -1,5 +1,5 @@
 from pyairtable.orm import Model, fields as F
-from ..core.config import AIRTABLE_TOKEN, AIRTABLE_BASE_ID
+from ..core.config import AIRTABLE_TOKEN, AIRTABLE_BASE_ID, AIRTABLE_QBO_BILL_ID_FIELD
 
 class Bill(Model):
   bill_number = F.TextField("Bill #")
@@ -32,6 +32,8 @@ class Bill(Model):
   status_detail = F.TextField("Status detail")
   service_account_normalized = F.LookupField[str]("Service Account 🔎 normalized")
   last_modified = F.LastModifiedTimeField("Last Modified Time")
+  # Only written when AIRTABLE_QBO_BILL_ID_FIELD is set
+  qbo_bill_id = F.TextField(AIRTABLE_QBO_BILL_ID_FIELD or "QBO Bill Id")
   
   class Meta:
     base_id = AIRTABLE_BASE_ID
@@ -1,5 +0,0 @@
-from pydantic import BaseModel
-
-class WebHook(BaseModel):
-  id: str
-  name: str
\ No newline at end of file
@@ -0,0 +1,14 @@
+from .Bill import Bill
+from .Customer import Customer
+from .Hauler import Hauler
+from .PDFLog import PDFLog
+from .Service import Service
+from ..shared.airtable import install_airtable_adapter, set_airtable_endpoint
+from ..core.config import AIRTABLE_API_URL
+
+# Every Airtable call made through these models shares one connection pool and waits for the rate governor.
+# LineItem is left out: its 'id' field clashes with Model.id, so the class can't be imported yet.
+install_airtable_adapter(Bill, Customer, Hauler, PDFLog, Service)
+
+if AIRTABLE_API_URL:
+    set_airtable_endpoint(AIRTABLE_API_URL, Bill, Customer, Hauler, PDFLog, Service)
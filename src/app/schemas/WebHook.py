@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+class WebHook(BaseModel):
+  id: str
+  name: str
+  # QuickBooks realm of the bill; the default company when missing
+  company_id: str | None = None
+
+
+class WebHookBatch(BaseModel):
+  # Airtable record ids of the bills, e.g. every bill of a view
+  ids: list[str]
+  name: str | None = None
+  company_id: str | None = None
@@ -1,14 +1,18 @@
 import os
+from functools import lru_cache
 from cryptography.fernet import Fernet
 
-FERNET_KEY = os.getenv("QBO_FERNET_KEY") 
-if not FERNET_KEY:
-    raise RuntimeError("Missing QBO_FERNET_KEY env var")
 
-fernet = Fernet(FERNET_KEY.encode())
+@lru_cache(maxsize=1)
+def _fernet() -> Fernet:
+    # Built on first use, so importing this module needs no key (e.g. `migrate`, import profiling)
+    fernet_key = os.getenv("QBO_FERNET_KEY")
+    if not fernet_key:
+        raise RuntimeError("Missing QBO_FERNET_KEY env var")
+    return Fernet(fernet_key.encode())
 
 def encrypt(text: str) -> str:
-    return fernet.encrypt(text.encode("utf-8")).decode("utf-8")
+    return _fernet().encrypt(text.encode("utf-8")).decode("utf-8")
 
 def decrypt(token: str) -> str:
-    return fernet.decrypt(token.encode("utf-8")).decode("utf-8")
+    return _fernet().decrypt(token.encode("utf-8")).decode("utf-8")
@@ -0,0 +1,249 @@
+import json
+import time
+from ..shared.redis_client import redis_client
+from ..core.celery_worker import celery
+from ..utils.lock import RedisLock
+from ..models.Bill import Bill as BillModel
+from ..models.PDFLog import PDFLog
+from ..utils.metrics import metrics
+from ..core.config import AIRTABLE_WRITE_BEHIND, AIRTABLE_WRITE_FLUSH_MAX_RECORDS, AIRTABLE_WRITE_MAX_ATTEMPTS
+
+PENDING_KEY = "airtable:writes:pending"
+PROCESSING_KEY = "airtable:writes:processing"
+# Entries Airtable kept rejecting (or that can't be parsed); kept for inspection, never sent again
+DEAD_LETTER_KEY = "airtable:writes:dead"
+FLUSH_LOCK_KEY = "lock:airtable:writes:flush"
+
+# Airtable accepts at most 10 records per batch create/update request
+AIRTABLE_BATCH_SIZE = 10
+
+# Models whose writes can be buffered, by name stored in the queue entry
+WRITE_BEHIND_MODELS = {
+    "Bill": BillModel,
+    "PDFLog": PDFLog,
+}
+
+
+def _entry_for(obj) -> dict | None:
+    """
+    Serialize a pending write: a create for new records, an update with
+    only the changed fields for existing ones (None when nothing changed).
+    """
+    fields = obj.to_record(only_writable=True)["fields"]
+    if not obj.id:
+        return {"op": "create", "model": type(obj).__name__, "fields": fields, "queued_at": time.time()}
+    changed = {name: value for name, value in fields.items() if obj._changed.get(name)}
+    if not changed:
+        return None
+    return {"op": "update", "model": type(obj).__name__, "id": obj.id, "fields": changed, "queued_at": time.time()}
+
+
+def save_record(obj):
+    """
+    Save a Bill or PDFLog. With AIRTABLE_WRITE_BEHIND the write is queued in Redis
+    and sent later in batches by flush_writes(); if Redis is unavailable it falls
+    back to a direct save so no outcome is lost.
+    """
+    if not AIRTABLE_WRITE_BEHIND or type(obj).__name__ not in WRITE_BEHIND_MODELS:
+        return obj.save()
+
+    entry = _entry_for(obj)
+    if entry is None:
+        return None
+    try:
+        pending = redis_client.rpush(PENDING_KEY, json.dumps(entry))
+    except Exception as e:
+        print(f"[AirtableWriter] could not queue {entry['op']} for {entry['model']}: {e}. Saving directly.")
+        return obj.save()
+
+    obj._changed.clear()
+    if pending % AIRTABLE_BATCH_SIZE == 0:
+        _request_flush()
+    return None
+
+
+def _request_flush():
+    # A full batch is waiting: ask a worker to flush now instead of waiting for the beat interval
+    try:
+        celery.send_task('app.task.airtable_task.flush_airtable_writes_task')
+    except Exception as e:
+        print(f"[AirtableWriter] could not schedule flush: {e}")
+
+
+def _group(entries: list[tuple[bytes, dict]]):
+    """
+    Group raw entries per (model, op). Updates to the same record are merged
+    (later fields win) so Airtable gets one update per record.
+    """
+    creates: dict[str, list] = {}
+    updates: dict[str, dict] = {}
+    for raw, entry in entries:
+        model = entry["model"]
+        if entry["op"] == "create":
+            creates.setdefault(model, []).append(([raw], entry["fields"]))
+        else:
+            by_id = updates.setdefault(model, {})
+            raws, fields = by_id.get(entry["id"], ([], {}))
+            by_id[entry["id"]] = (raws + [raw], {**fields, **entry["fields"]})
+    return creates, updates
+
+
+def _ack(raws: list[bytes]):
+    pipe = redis_client.pipeline()
+    for raw in raws:
+        pipe.lrem(PROCESSING_KEY, 1, raw)
+    pipe.execute()
+
+
+def _rejected(e: Exception) -> bool:
+    # 4xx other than 429: Airtable refused the records themselves (unknown field, invalid value, deleted record)
+    response = getattr(e, "response", None)
+    status = getattr(response, "status_code", None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def _move(raw: bytes, key: str, value: bytes | str):
+    # Replace a processing entry with `value` at the end of `key`, in one transaction
+    pipe = redis_client.pipeline()
+    pipe.lrem(PROCESSING_KEY, 1, raw)
+    pipe.rpush(key, value)
+    pipe.execute()
+
+
+def _dead_letter(raw: bytes, value: bytes | str, reason: str):
+    _move(raw, DEAD_LETTER_KEY, value)
+    print(f"[AirtableWriter] dead-lettered entry ({reason}): {value!r}")
+    metrics.inc("airtable_writes_dead_lettered_total")
+
+
+def _reject(raws: list[bytes], parsed: dict, error: str, stats: dict):
+    """
+    Count an attempt on the entries of a rejected record: they go back to the end of
+    the pending list, or to the dead-letter list after AIRTABLE_WRITE_MAX_ATTEMPTS.
+    """
+    for raw in raws:
+        entry = {**parsed[raw], "error": error[:500]}
+        entry["attempts"] = entry.get("attempts", 0) + 1
+        if entry["attempts"] >= AIRTABLE_WRITE_MAX_ATTEMPTS:
+            _dead_letter(raw, json.dumps(entry), f"{entry['op']} on {entry['model']} rejected {entry['attempts']} times")
+            stats["dead_lettered"] += 1
+        else:
+            _move(raw, PENDING_KEY, json.dumps(entry))
+            stats["rejected"] += 1
+
+
+def _write(send, chunk: list[tuple[list[bytes], dict]], parsed: dict, stats: dict, done: str, label: str):
+    """
+    Send a chunk of (raws, record) with `send` and acknowledge its entries. When
+    Airtable rejects the chunk, its records are sent one by one so a bad record
+    doesn't hold back the rest; each record still rejected counts an attempt.
+    """
+    try:
+        send([record for _, record in chunk])
+    except Exception as e:
+        if not _rejected(e):
+            # Throttling, 5xx or network: the entries stay in processing for the next flush
+            print(f"[AirtableWriter] {label} failed: {e}")
+            stats["failed"] += len(chunk)
+            return
+        if len(chunk) > 1:
+            print(f"[AirtableWriter] {label} rejected, sending its {len(chunk)} records one by one: {e}")
+            for item in chunk:
+                _write(send, [item], parsed, stats, done, label)
+            return
+        print(f"[AirtableWriter] {label} rejected a record: {e}")
+        _reject(chunk[0][0], parsed, str(e), stats)
+        return
+    _ack([raw for raws, _ in chunk for raw in raws])
+    stats[done] += len(chunk)
+
+
+def _lock_lost(stats: dict) -> dict:
+    # Unsent entries stay in the processing list for the flush that holds the lock now
+    print(f"[AirtableWriter] flush lock lost, stopping after {stats}")
+    return {**stats, "lock_lost": True}
+
+
+def flush_writes(max_records: int = AIRTABLE_WRITE_FLUSH_MAX_RECORDS) -> dict:
+    """
+    Send queued writes to Airtable with batch_create/batch_update, 10 records per request.
+    Entries stay in the processing list until their request succeeds, and anything
+    left there by a crashed flush is re-queued first (at-least-once delivery).
+    Records Airtable rejects are retried by later flushes and moved to the
+    dead-letter list after AIRTABLE_WRITE_MAX_ATTEMPTS.
+    """
+    lock = RedisLock(redis_client, FLUSH_LOCK_KEY, ttl=300)
+    if not lock.acquire():
+        return {"skipped": True}
+
+    stats = {"created": 0, "updated": 0, "failed": 0, "rejected": 0, "dead_lettered": 0, "requeued": 0}
+    try:
+        # Recover entries from a flush that died before acknowledging them
+        while redis_client.lmove(PROCESSING_KEY, PENDING_KEY, "RIGHT", "LEFT") is not None:
+            stats["requeued"] += 1
+
+        entries = []
+        while len(entries) < max_records:
+            raw = redis_client.lmove(PENDING_KEY, PROCESSING_KEY, "LEFT", "RIGHT")
+            if raw is None:
+                break
+            try:
+                entries.append((raw, json.loads(raw)))
+            except ValueError:
+                _dead_letter(raw, raw, "malformed")
+                stats["dead_lettered"] += 1
+
+        parsed = dict(entries)
+        creates, updates = _group(entries)
+
+        for model_name, items in creates.items():
+            table = WRITE_BEHIND_MODELS[model_name].meta.table
+            for start in range(0, len(items), AIRTABLE_BATCH_SIZE):
+                chunk = items[start:start + AIRTABLE_BATCH_SIZE]
+                # A long flush keeps the lock while it makes progress; once lost, another flush owns the entries
+                if not lock.extend():
+                    return _lock_lost(stats)
+                _write(lambda records: table.batch_create(records, typecast=True), chunk, parsed, stats,
+                       "created", f"batch create on {model_name}")
+
+        for model_name, by_id in updates.items():
+            table = WRITE_BEHIND_MODELS[model_name].meta.table
+            items = [(raws, {"id": record_id, "fields": fields}) for record_id, (raws, fields) in by_id.items()]
+            for start in range(0, len(items), AIRTABLE_BATCH_SIZE):
+                chunk = items[start:start + AIRTABLE_BATCH_SIZE]
+                if not lock.extend():
+                    return _lock_lost(stats)
+                _write(lambda records: table.batch_update(records, typecast=True), chunk, parsed, stats,
+                       "updated", f"batch update on {model_name}")
+    finally:
+        lock.release()
+
+    if any(stats.values()):
+        print(f"[AirtableWriter] flush {stats}")
+    return stats
+
+
+def pending_writes() -> int:
+    return redis_client.llen(PENDING_KEY) + redis_client.llen(PROCESSING_KEY)
+
+
+def dead_letter_writes() -> int:
+    return redis_client.llen(DEAD_LETTER_KEY)
+
+
+def pending_record_ids(model_name: str) -> set[str]:
+    """
+    Ids of records of the model with buffered updates not yet in Airtable (what
+    Airtable returns for them is out of date). Empty without write-behind.
+    """
+    if not AIRTABLE_WRITE_BEHIND:
+        return set()
+    ids = set()
+    for raw in redis_client.lrange(PENDING_KEY, 0, -1) + redis_client.lrange(PROCESSING_KEY, 0, -1):
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            continue
+        if entry.get("op") == "update" and entry.get("model") == model_name:
+            ids.add(entry["id"])
+    return ids
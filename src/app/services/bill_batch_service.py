@@ -0,0 +1,247 @@
+from dataclasses import dataclass, field
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from quickbooks.batch import BatchManager
+from quickbooks.objects.batchrequest import BatchOperation
+from quickbooks.objects.bill import Bill as QbBill
+from ..models.Bill import Bill as BillModel
+from ..schemas.Bill import BillBase as BillSchema
+from ..shared.quickbooks import get_qbo_client
+from ..utils.quickbooks import _get_default_company_id
+from ..database.engine import SessionLocal
+from ..utils.aio import run_blocking
+from ..core.exceptions import DomainError, BusinessValidationError, NotFoundDomainError, RetryableSystemError, CircuitOpenError
+from .bill_loader import load_bills
+from .doc_number_index import find_duplicate_doc_numbers, record_created_bills
+from .bill_idempotency import bill_content_hash, previous_submissions, confirm_submissions, remember_submissions
+from .bill_service import (
+    _build_bill_schema,
+    _build_qbo_bill,
+    _classify_save_error,
+    _record_already_sent,
+    _record_duplicate,
+    _record_success,
+    _record_failure,
+)
+
+# QuickBooks accepts at most 30 items per batch request
+QBO_BATCH_MAX_ITEMS = 30
+
+
+@dataclass
+class BatchItem:
+    bill: BillModel
+    bill_schema: BillSchema
+    qbo_bill: QbBill
+    content_hash: str
+
+
+@dataclass
+class BatchResult:
+    created: dict[str, str] = field(default_factory=dict)     # bill_id -> QBO Bill Id
+    duplicates: list[str] = field(default_factory=list)       # bill_ids already in QBO
+    failed: dict[str, str] = field(default_factory=dict)      # bill_id -> error
+    retryable: list[str] = field(default_factory=list)        # bill_ids worth sending again
+    retry_errors: dict[str, Exception] = field(default_factory=dict)  # bill_id -> error of each retryable bill
+
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "retryable": self.retryable,
+        }
+
+
+def _fail(result: BatchResult, bill: BillModel | None, bill_id: str, e: Exception):
+    # An open circuit means the bill was never tried: nothing to log
+    if bill and not isinstance(e, CircuitOpenError):
+        try:
+            _record_failure(bill, e)
+        except Exception as log_error:
+            print(f"[Batch] could not record failure for bill_id={bill_id}: {log_error}")
+    if isinstance(e, ValidationError):
+        e = BusinessValidationError("Pydantic validation error", payload={"errors": e.errors()})
+    result.failed[bill_id] = str(e)
+    # Same policy as process_bill_task: transient and unknown errors are retried
+    if isinstance(e, RetryableSystemError) or not isinstance(e, DomainError):
+        result.retryable.append(bill_id)
+        result.retry_errors[bill_id] = e
+
+
+def _prepare_items(qb, db: Session, bill_ids: list[str], result: BatchResult, bills: dict[str, BillModel] | None = None) -> list[BatchItem]:
+    """
+    Loads every bill (unless already loaded and hydrated) and builds its QBO payload.
+    Bills already sent with the same content are only brought up to date in Airtable.
+    Bills that fail here get their error outcome written right away and are left out of the batch.
+    """
+    if bills is None:
+        bills = load_bills(bill_ids)
+    schemas: dict[str, tuple[BillModel, BillSchema]] = {}
+    for bill_id in bill_ids:
+        bill: BillModel | None = bills.get(bill_id)
+        try:
+            if bill is None:
+                raise NotFoundDomainError(f"Bill with id {bill_id} not found")
+            print(f"Processing bill {bill.bill_number} with status {bill.status}")
+            schemas[bill_id] = (bill, _build_bill_schema(bill))
+        except Exception as e:
+            _fail(result, bill, bill_id, e)
+
+    # One indexed query for the whole batch, and one QBO query to confirm the hits
+    hashes = {bill_id: bill_content_hash(bill_schema) for bill_id, (_, bill_schema) in schemas.items()}
+    sent = confirm_submissions(qb, db, previous_submissions(db, str(qb.company_id), hashes))
+
+    items: list[BatchItem] = []
+    for bill_id, (bill, bill_schema) in schemas.items():
+        try:
+            if bill_id in sent:
+                _record_already_sent(bill, sent[bill_id].qbo_bill_id)
+                result.duplicates.append(bill_id)
+                continue
+            qbo_bill = _build_qbo_bill(qb, bill_schema)
+            items.append(BatchItem(bill=bill, bill_schema=bill_schema, qbo_bill=qbo_bill, content_hash=hashes[bill_id]))
+        except Exception as e:
+            _fail(result, bill, bill_id, e)
+    return items
+
+
+def _remember(qb, db: Session, submissions: list, created_numbers: list[tuple[str, str]] | None = None):
+    # Bookkeeping only: a DB error must not stop the write-back of bills QBO already has
+    if not submissions:
+        return
+    try:
+        remember_submissions(db, str(qb.company_id), submissions)
+        if created_numbers:
+            record_created_bills(str(qb.company_id), created_numbers)
+    except Exception as e:
+        print(f"[Batch] could not record {len(submissions)} submissions, continuing: {e}")
+
+
+def _mark_duplicate(item: BatchItem, result: BatchResult):
+    # Duplicate bills behave as in bill_service: log it and mark the bill as in QB
+    try:
+        _record_duplicate(item.bill, item.bill_schema)
+        _record_success(item.bill)
+    except Exception as e:
+        print(f"[Batch] could not record duplicate for bill_id={item.bill.id}: {e}")
+    result.duplicates.append(item.bill.id)
+
+
+def _send_chunk(qb, db: Session, chunk: list[BatchItem], result: BatchResult):
+    # Local index first, then at most one DocNumber IN (...) query for the whole chunk
+    try:
+        existing = find_duplicate_doc_numbers(qb, [item.bill_schema.bill_number for item in chunk])
+    except Exception as e:
+        for item in chunk:
+            _fail(result, item.bill, item.bill.id, _classify_save_error(qb, item.bill_schema, e))
+        return
+
+    to_create: list[BatchItem] = []
+    # Same DocNumber as a bill earlier in this chunk: decided once that one is answered
+    repeats: list[BatchItem] = []
+    seen: set[str] = set()
+    duplicates = [item for item in chunk if item.bill_schema.bill_number in existing]
+    _remember(qb, db, [(item.bill.id, item.content_hash, "duplicate", None) for item in duplicates])
+    for item in chunk:
+        number = item.bill_schema.bill_number
+        if number in existing:
+            _mark_duplicate(item, result)
+        elif number in seen:
+            repeats.append(item)
+        else:
+            seen.add(number)
+            to_create.append(item)
+
+    if not to_create:
+        return
+
+    batch_manager = BatchManager(BatchOperation.CREATE, max_request_items=QBO_BATCH_MAX_ITEMS)
+    batch = batch_manager.list_to_batch_request([item.qbo_bill for item in to_create])
+    by_bid = {req.bId: item for req, item in zip(batch.BatchItemRequest, to_create)}
+
+    try:
+        json_data = qb.batch_operation(batch.to_json())
+    except Exception as e:
+        # The whole request failed, every bill in it (and its repeats) shares the outcome
+        for item in to_create + repeats:
+            _fail(result, item.bill, item.bill.id, _classify_save_error(qb, item.bill_schema, e))
+        return
+
+    answered = set()
+    created_numbers: list[tuple[str, str]] = []
+    created_items: list[tuple[BatchItem, str]] = []
+    for data in json_data.get("BatchItemResponse", []):
+        item = by_bid.get(data.get("bId"))
+        if item is None:
+            continue
+        answered.add(data.get("bId"))
+
+        if "Fault" in data:
+            errors = data["Fault"].get("Error", [])
+            msg = "; ".join(f"{err.get('code')}: {err.get('Message')} {err.get('Detail', '')}".strip() for err in errors)
+            _fail(result, item.bill, item.bill.id, _classify_save_error(qb, item.bill_schema, Exception(msg)))
+            continue
+
+        created = QbBill.from_json(data[QbBill.qbo_object_name])
+        print(f"Bill {item.bill_schema.bill_number} created in QBO with Id {created.Id}")
+        created_items.append((item, created.Id))
+        result.created[item.bill.id] = created.Id
+        created_numbers.append((item.bill_schema.bill_number, created.Id))
+
+    # Remember them before the Airtable write-back, so a retry doesn't go to QBO again
+    _remember(qb, db, [(item.bill.id, item.content_hash, "created", qbo_id) for item, qbo_id in created_items], created_numbers)
+    for item, qbo_id in created_items:
+        try:
+            _record_success(item.bill, qbo_id)
+        except Exception as e:
+            print(f"[Batch] could not record success for bill_id={item.bill.id}: {e}")
+
+    for bid, item in by_bid.items():
+        if bid not in answered:
+            _fail(result, item.bill, item.bill.id, RetryableSystemError("QBO batch response did not include this bill"))
+
+    if repeats:
+        # A repeat is a duplicate only if the first copy was created; otherwise it gets its own try
+        created_now = {number for number, _ in created_numbers}
+        duplicates = [item for item in repeats if item.bill_schema.bill_number in created_now]
+        _remember(qb, db, [(item.bill.id, item.content_hash, "duplicate", None) for item in duplicates])
+        for item in duplicates:
+            _mark_duplicate(item, result)
+        resend = [item for item in repeats if item.bill_schema.bill_number not in created_now]
+        if resend:
+            _send_chunk(qb, db, resend, result)
+
+
+async def bill_batch_service(
+    bill_ids: list[str],
+    company_id: str | None = None,
+    bills: dict[str, BillModel] | None = None,
+) -> BatchResult:
+    """
+    Batch counterpart of bill_service for bills of the same QuickBooks company.
+    Lookups still run per bill (served by the reference cache), but the duplicate
+    check and the creation go through one query and one batch request per 30 bills.
+    Every bill gets its own status and PDF Log entry, exactly as in bill_service.
+    `bills` (bill_id -> hydrated BillModel) skips the Airtable load when the caller has them.
+    """
+    db: Session | None = None
+    result = BatchResult()
+
+    try:
+        db = SessionLocal()
+        if not company_id:
+            company_id = await run_blocking(_get_default_company_id, db)
+        qb = await run_blocking(get_qbo_client, realm_id=company_id, db=db)
+
+        print(f"QBO client obtained for company_id {company_id}, batch of {len(bill_ids)} bills")
+
+        items = await run_blocking(_prepare_items, qb, db, bill_ids, result, bills)
+        for start in range(0, len(items), QBO_BATCH_MAX_ITEMS):
+            await run_blocking(_send_chunk, qb, db, items[start:start + QBO_BATCH_MAX_ITEMS], result)
+    finally:
+        if db is not None:
+            db.close()
+
+    print(f"[Batch] company_id={company_id} created={len(result.created)} duplicates={len(result.duplicates)} failed={len(result.failed)}")
+    return result
@@ -0,0 +1,82 @@
+import hashlib
+import json
+from sqlalchemy.orm import Session
+
+from ..schemas.Bill import BillBase as BillSchema
+from ..database.crud_bill_submission import find_submission, find_submissions, record_submissions, delete_submissions
+from ..database.models.BillSubmission import BillSubmission
+from ..utils.quickbooks import existing_bill_ids
+from ..core.config import BILL_IDEMPOTENCY_ENABLED
+
+# The status is what triggers a resubmission, not part of what goes to QuickBooks
+HASH_EXCLUDED_FIELDS = {"status"}
+
+
+def bill_content_hash(bill_schema: BillSchema) -> str:
+    """
+    sha256 of the validated bill without its status. Normalized by the schema
+    (dates, decimals, trimmed strings), so only a real change gives a new hash.
+    """
+    data = bill_schema.model_dump(mode="json", exclude=HASH_EXCLUDED_FIELDS)
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def previous_submission(db: Session, realm_id: str, bill_id: str, content_hash: str) -> BillSubmission | None:
+    """
+    Record of the same content already sent, if it has a QBO Bill Id to confirm with
+    confirm_submissions() (a "duplicate" without one goes the long way).
+    """
+    if not BILL_IDEMPOTENCY_ENABLED:
+        return None
+    try:
+        row = find_submission(db, realm_id, bill_id, content_hash)
+        return row if row is not None and row.qbo_bill_id else None
+    except Exception as e:
+        # Without the table the bill goes the long way, as before
+        db.rollback()
+        print(f"[Idempotency] lookup failed for bill_id={bill_id}: {e}")
+        return None
+
+
+def previous_submissions(db: Session, realm_id: str, hashes: dict[str, str]) -> dict[str, BillSubmission]:
+    if not BILL_IDEMPOTENCY_ENABLED or not hashes:
+        return {}
+    try:
+        return {bill_id: row for bill_id, row in find_submissions(db, realm_id, hashes).items() if row.qbo_bill_id}
+    except Exception as e:
+        db.rollback()
+        print(f"[Idempotency] lookup failed for {len(hashes)} bills: {e}")
+        return {}
+
+
+def confirm_submissions(qb, db: Session, submissions: dict[str, BillSubmission]) -> dict[str, BillSubmission]:
+    """
+    Keep the submissions whose QBO bill still exists, checked with one Id IN (...) query.
+    A bill deleted in QuickBooks since is sent again, and its record is removed.
+    """
+    if not submissions:
+        return {}
+    existing = existing_bill_ids(qb, [row.qbo_bill_id for row in submissions.values()])
+    stale = [row for row in submissions.values() if row.qbo_bill_id not in existing]
+    if stale:
+        print(f"[Idempotency] {len(stale)} sent bills are no longer in QuickBooks, sending them again")
+        try:
+            delete_submissions(db, stale)
+        except Exception as e:
+            db.rollback()
+            print(f"[Idempotency] could not remove {len(stale)} stale submissions: {e}")
+    return {bill_id: row for bill_id, row in submissions.items() if row.qbo_bill_id in existing}
+
+
+def remember_submissions(db: Session, realm_id: str, items: list[tuple[str, str, str, str | None]]):
+    """
+    Record (bill_id, content_hash, outcome, qbo_bill_id) right after QuickBooks accepted
+    the bills, before the Airtable write-back, so a retry of a failed write-back skips QBO.
+    """
+    if not BILL_IDEMPOTENCY_ENABLED or not items:
+        return
+    try:
+        record_submissions(db, realm_id, items)
+    except Exception as e:
+        db.rollback()
+        print(f"[Idempotency] could not record {len(items)} submissions: {e}")
@@ -0,0 +1,72 @@
+from pyairtable.formulas import OR, EQ, RECORD_ID
+from ..models.Bill import Bill as BillModel
+
+# Record IDs per RECORD_ID() OR-formula; matches Airtable's page size so each chunk is one request
+RECORD_ID_CHUNK_SIZE = 100
+
+# Bill link fields we need to build BillSchema and the PDF Log name
+BILL_LINKS = (BillModel.hauler, BillModel.customer, BillModel.service)
+
+
+def _fetch_by_ids(model, record_ids) -> dict:
+    """
+    Fetch records of one table with RECORD_ID() OR-formulas, one request per chunk.
+    Missing IDs are simply absent from the result.
+    """
+    record_ids = sorted(set(record_ids))
+    by_id = {}
+    for start in range(0, len(record_ids), RECORD_ID_CHUNK_SIZE):
+        chunk = record_ids[start:start + RECORD_ID_CHUNK_SIZE]
+        formula = OR(*(EQ(RECORD_ID(), record_id) for record_id in chunk))
+        for obj in model.all(formula=formula, page_size=RECORD_ID_CHUNK_SIZE):
+            by_id[obj.id] = obj
+    return by_id
+
+
+def _linked_ids(bills, link_field) -> set:
+    ids = set()
+    for bill in bills:
+        for value in bill._fields.get(link_field.field_name) or []:
+            if isinstance(value, str):
+                ids.add(value)
+    return ids
+
+
+def _attach(bill, link_field, by_id: dict):
+    # Swap record IDs for loaded instances; IDs we could not load stay lazy
+    values = bill._fields.get(link_field.field_name) or []
+    bill._fields[link_field.field_name] = [by_id.get(v, v) if isinstance(v, str) else v for v in values]
+
+
+def hydrate_bills(bills: list[BillModel]) -> list[BillModel]:
+    """
+    Loads the Hauler, Customer and Service linked to every bill with one
+    request per table (per 100 records) instead of one request per link.
+    """
+    for link_field in BILL_LINKS:
+        ids = _linked_ids(bills, link_field)
+        if not ids:
+            continue
+        by_id = _fetch_by_ids(link_field.linked_model, ids)
+        for bill in bills:
+            _attach(bill, link_field, by_id)
+    return bills
+
+
+def load_bills(bill_ids: list[str]) -> dict[str, BillModel]:
+    """
+    Fetch bills and all their linked records: one request per 100 bills plus
+    one request per linked table. Bills that don't exist are left out.
+    """
+    by_id = _fetch_by_ids(BillModel, bill_ids)
+    hydrate_bills(list(by_id.values()))
+    return by_id
+
+
+def load_bill(bill_id: str) -> BillModel:
+    """
+    Single-bill version of load_bills; raises like BillModel.from_id when the bill doesn't exist.
+    """
+    bill = BillModel.from_id(bill_id)
+    hydrate_bills([bill])
+    return bill
@@ -0,0 +1,112 @@
+import math
+import time
+
+from ..core.celery_worker import celery
+from ..shared.redis_client import redis_client
+from ..core.config import WEBHOOK_COALESCE_ENABLED, WEBHOOK_COALESCE_WINDOW_SECONDS, REALM_FAIR_SCHEDULING
+from .webhook_coalescer import register_bill_event, forget_bill_event, register_bill_events, forget_bill_events
+from .realm_scheduler import submit_bill, submit_bills, dispatch_bills
+
+# Tasks are sent by name so the web process doesn't import the task modules (and their SDKs)
+PROCESS_BILL_TASK = 'app.task.bill_task.process_bill_task'
+DISPATCH_REALM_BILLS_TASK = 'app.task.bill_task.dispatch_realm_bills_task'
+
+
+def send_bill_task(bill_id: str, company_id: str | None = None, countdown: float | None = None, producer=None):
+    celery.send_task(PROCESS_BILL_TASK, args=[bill_id, company_id], countdown=countdown, producer=producer)
+
+
+def send_bill_tasks(bill_ids: list[str], company_id: str | None = None, countdown: float | None = None,
+                    sent: list[str] | None = None) -> int:
+    """
+    Publish process_bill_task for many bills through one producer (one broker
+    connection checkout for the batch instead of one per task).
+    Every published bill id is appended to `sent`, so after an error the caller
+    knows which ones went out. Returns how many were sent.
+    """
+    sent = [] if sent is None else sent
+    with celery.producer_or_acquire() as producer:
+        for bill_id in bill_ids:
+            send_bill_task(bill_id, company_id, countdown=countdown, producer=producer)
+            sent.append(bill_id)
+    return len(sent)
+
+
+def dispatch_waiting_bills() -> int:
+    """
+    dispatch_bills() with every task of the round published through one producer.
+    """
+    with celery.producer_or_acquire() as producer:
+        return dispatch_bills(lambda bill_id, company_id: send_bill_task(bill_id, company_id, producer=producer))
+
+
+def enqueue_bill_event(bill_id: str, company_id: str | None = None) -> tuple[bool, int]:
+    """
+    Queue process_bill_task for a webhook event unless a task for the bill is
+    already waiting. The task starts after the coalescing window so that a burst
+    of events (e.g. a status toggled back and forth) is handled once, on the final data.
+    With REALM_FAIR_SCHEDULING the bill waits in its realm's queue and is handed
+    to Celery by dispatch_bills().
+    Returns (queued, merged events).
+    """
+    queued, merged = register_bill_event(bill_id)
+    if queued:
+        countdown = WEBHOOK_COALESCE_WINDOW_SECONDS if WEBHOOK_COALESCE_ENABLED else None
+        try:
+            if REALM_FAIR_SCHEDULING:
+                submit_bill(bill_id, company_id, delay=countdown or 0)
+                schedule_dispatch(countdown)
+            else:
+                send_bill_task(bill_id, company_id, countdown=countdown)
+        except Exception:
+            forget_bill_event(bill_id)
+            raise
+    return queued, merged
+
+
+def enqueue_bill_events(bill_ids: list[str], company_id: str | None = None) -> dict[str, tuple[bool, int]]:
+    """
+    enqueue_bill_event() for many bills of one company: coalescing, the realm
+    queue and the broker each get pipelined writes for the whole batch, and at
+    most one dispatch is scheduled.
+    Returns bill_id -> (queued, merged events).
+    """
+    bill_ids = list(dict.fromkeys(bill_ids))
+    events = register_bill_events(bill_ids)
+    new_bills = [bill_id for bill_id in bill_ids if events[bill_id][0]]
+    if not new_bills:
+        return events
+    countdown = WEBHOOK_COALESCE_WINDOW_SECONDS if WEBHOOK_COALESCE_ENABLED else None
+    if REALM_FAIR_SCHEDULING:
+        try:
+            submit_bills(new_bills, company_id, delay=countdown or 0)
+        except Exception:
+            forget_bill_events(new_bills)
+            raise
+        try:
+            schedule_dispatch(countdown)
+        except Exception as e:
+            # Already in the realm queue: the beat dispatcher catches up
+            print(f"[Scheduler] could not schedule dispatch for {len(new_bills)} bills: {e}")
+    else:
+        sent: list[str] = []
+        try:
+            send_bill_tasks(new_bills, company_id, countdown=countdown, sent=sent)
+        except Exception:
+            # Only bills without a task: the ones already published keep their marker
+            forget_bill_events(new_bills[len(sent):])
+            raise
+    return events
+
+
+def schedule_dispatch(countdown: float | None = None):
+    """
+    Run dispatch_bills() now, or once `countdown` seconds passed. Webhooks of the
+    same second share one delayed dispatch task.
+    """
+    if not countdown:
+        dispatch_waiting_bills()
+        return
+    run_at = math.ceil(time.time() + countdown)
+    if redis_client.set(f"realm:dispatch:at:{run_at}", 1, nx=True, ex=int(countdown) + 60):
+        celery.send_task(DISPATCH_REALM_BILLS_TASK, countdown=run_at - time.time())
@@ -1,272 +1,516 @@
 from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from quickbooks.objects.bill import Bill as QbBill
-from quickbooks.objects import Account
+from quickbooks.exceptions import AuthorizationException
 from ..models.Bill import Bill as BillModel
 from ..models.PDFLog import PDFLog
 from ..schemas.Bill import BillBase as BillSchema, BillStatus
-from ..shared.quickbooks import get_qbo_client
+from ..shared.quickbooks import get_qbo_client, invalidate_qbo_client
 from ..utils.qb_accounts import  SERVICE_TYPE_TO_QB_ACCOUNT, DEFAULT_TRASH_EXPENSE_ACCOUNT_ID
-from ..utils.quickbooks import _get_customer_by_display_name, _get_default_company_id, _get_vendor, get_department_from_service_account, check_duplicate_bill_number
+from ..utils.quickbooks import _get_customer_by_display_name, _get_default_company_id, _get_vendor, get_department_from_service_account, get_expense_account, invalidate_reference_cache
 from ..utils.qb_terms import TERMS_ID_ON_QB, DEFAULT_TERM_ID
 from ..database.engine import SessionLocal
-from ..core.exceptions import BusinessValidationError, NotFoundDomainError, RetryableSystemError
+from ..core.exceptions import DomainError, BusinessValidationError, NotFoundDomainError, RetryableSystemError, UpstreamError, CircuitOpenError
 from ..utils.status_detail import StatusDetail
+from .bill_loader import load_bill
+from .airtable_writer import save_record
+from .doc_number_index import is_duplicate_doc_number, record_created_bills
+from .bill_idempotency import bill_content_hash, previous_submission, confirm_submissions, remember_submissions
+from ..utils.aio import run_blocking
+from ..utils.metrics import metrics
+from ..utils.retry import classify_upstream_error
+from ..core.config import BILL_CONCURRENCY, AIRTABLE_QBO_BILL_ID_FIELD
+import asyncio
 import datetime
 
-async def bill_service(bill_id: str, company_id: str | None = None):
-    db: Session | None = None
-    bill: BillModel | None = None
 
+# PDF Log entry name for a bill
+def _pdf_log_name(bill: BillModel) -> str:
+    return f"{bill.hauler.name} - {bill.bill_number} - {bill.service.service_account_number}" if bill.hauler and bill.service else f"{bill.bill_number}"
+
+
+def _load_bill(bill_id: str) -> BillModel:
+    # 1) Get bill (+ Hauler, Customer and Service in one request per table)
     try:
-        db = SessionLocal()
+        bill = load_bill(bill_id)
+        print(f"Processing bill {bill.bill_number} with status {bill.status}")
+    except Exception as e:
+        # A throttled or failing Airtable is not a missing bill
+        typed = classify_upstream_error(e, upstream="airtable")
+        if isinstance(typed, UpstreamError):
+            raise typed from e
+        raise NotFoundDomainError(f"Bill with id {bill_id} not found: {e}")
+    return bill
 
-        # 1) Get bill
-        try:
-            bill = BillModel.from_id(bill_id)
-            print(f"Processing bill {bill.bill_number} with status {bill.status}")
-        except Exception as e:
-            raise NotFoundDomainError(f"Bill with id {bill_id} not found: {e}")
-          
-        if bill.bill_amount is None:
-          raise BusinessValidationError(
-              "Bill amount is missing")
 
-        # 2) Build schema
-        bill_schema = BillSchema(
-            bill_number=bill.bill_number,
-            status=bill.status,
-            pdf_link=bill.pdf_link,
-            bill_date=bill.bill_date,
-            due=bill.due,
-            hauler_id=bill.hauler.hauler_number if bill.hauler else 0,
-            account_number=bill.customer.account_number if bill.customer else "",
-            service_type=bill.service.type[0] if bill.service else "",
-            total_amount=bill.bill_amount,
-            customer_account=bill.customer.account_number,
-            service_account=bill.service_account[0] if bill.service_account else "",
-            service_name=bill.service.name if bill.service else "",
-            sales_term= bill.service.hauler_terms[0] if bill.service and bill.service.hauler_terms else 0,
+def _build_bill_schema(bill: BillModel) -> BillSchema:
+    if bill.bill_amount is None:
+      raise BusinessValidationError(
+          "Bill amount is missing")
+
+    # 2) Build schema
+    bill_schema = BillSchema(
+        bill_number=bill.bill_number,
+        status=bill.status,
+        pdf_link=bill.pdf_link,
+        bill_date=bill.bill_date,
+        due=bill.due,
+        hauler_id=bill.hauler.hauler_number if bill.hauler else 0,
+        account_number=bill.customer.account_number if bill.customer else "",
+        service_type=bill.service.type[0] if bill.service else "",
+        total_amount=bill.bill_amount,
+        customer_account=bill.customer.account_number,
+        service_account=bill.service_account[0] if bill.service_account else "",
+        service_name=bill.service.name if bill.service else "",
+        sales_term= bill.service.hauler_terms[0] if bill.service and bill.service.hauler_terms else 0,
+    )
+
+    print(f"Bill schema: {bill_schema}")
+    return bill_schema
+
+
+def _expense_account_id_for(bill_schema: BillSchema) -> str:
+    expense_account_id = SERVICE_TYPE_TO_QB_ACCOUNT.get(bill_schema.service_type) or DEFAULT_TRASH_EXPENSE_ACCOUNT_ID
+    if not expense_account_id:
+        raise BusinessValidationError(
+            f"No QuickBooks account mapping found for service type '{bill_schema.service_type}'",
+            payload={"service_type": bill_schema.service_type},
         )
-        
-        print(f"Bill schema: {bill_schema}")
+    return expense_account_id
 
-        # 3) Get QBO client
-        if not company_id:
-            company_id = _get_default_company_id(db)
-        qb = get_qbo_client(realm_id=company_id, db=db)
-        
-        print(f"QBO client obtained for company_id {company_id}")
 
-        # 4) Business validations
-        if not bill_schema.hauler_id:
-            raise BusinessValidationError("Bill does not have a Hauler associated")
-        hauler = _get_vendor(qb, bill_schema.hauler_id)
-        
-        print(f"Hauler (Vendor) found: {hauler.DisplayName}")
-
-        if not bill_schema.customer_account:
-            raise BusinessValidationError("Bill does not have a Customer associated")
-        customer = _get_customer_by_display_name(qb, bill_schema.customer_account)
-        
-        print(f"Customer found: {customer.DisplayName}")
-        
-        # 5) Get expense account
-        expense_account_id = SERVICE_TYPE_TO_QB_ACCOUNT.get(bill_schema.service_type) or DEFAULT_TRASH_EXPENSE_ACCOUNT_ID
-        if not expense_account_id:
-            raise BusinessValidationError(
-                f"No QuickBooks account mapping found for service type '{bill_schema.service_type}'",
-                payload={"service_type": bill_schema.service_type},
-            )
-            
-        print(f"Using expense account ID: {expense_account_id} for service type: {bill_schema.service_type}")
-
-        
-        expense_account = Account.get(expense_account_id, qb=qb)
-        if expense_account is None:
-            raise BusinessValidationError(
-                f"Account id '{expense_account_id}' not found in QuickBooks",
-                payload={"account_id": expense_account_id},
-            )
+def _validate_references(bill_schema: BillSchema) -> str:
+    """
+    Checks that need no QuickBooks call. Returns the expense account id to look up.
+    """
+    # 4) Business validations
+    if not bill_schema.hauler_id:
+        raise BusinessValidationError("Bill does not have a Hauler associated")
+    if not bill_schema.customer_account:
+        raise BusinessValidationError("Bill does not have a Customer associated")
 
-        print(f"Expense account found: {expense_account.Name}")
-        #Comment on development
-        #Location
-        location = get_department_from_service_account(qb, bill_schema.service_account)
-        if not location:
-            raise BusinessValidationError(
-                f"No department found for service account '{bill_schema.service_account}'",
-                payload={"service_account": bill_schema.service_account},
-            )
-        
-        #Comment on development
-        #terms
-        term = TERMS_ID_ON_QB.get(bill_schema.sales_term)
-        if not term:
-            term = DEFAULT_TERM_ID
-        
-
-        # 6) Get QBO bill
-        qbo_bill = QbBill()
-        qbo_bill.DocNumber = bill_schema.bill_number
-        qbo_bill.VendorRef = {"value": hauler.Id}
-        qbo_bill.TxnDate = bill_schema.bill_date.strftime("%Y-%m-%d") # Ensures format YYYY-MM-DD (in case that bill_date is datetime)
-        qbo_bill.DueDate = bill_schema.due.strftime("%Y-%m-%d")
-        qbo_bill.PrivateNote = f"{bill_schema.pdf_link}"
-        qbo_bill.DepartmentRef = {"value": location.Id} # Comment on dev
-        
-        qbo_bill.SalesTermRef = {"value": term}
-
-        qbo_bill.Line = [{
-            "DetailType": "AccountBasedExpenseLineDetail",
-            "Amount": float(bill_schema.total_amount),
-            "Description": bill_schema.service_name, # Service name
-            "AccountBasedExpenseLineDetail": {
-                "AccountRef": {"value": expense_account.Id, "name": expense_account.Name},
-                "CustomerRef": {"value": customer.Id}
-            },
-        }]
+    # 5) Get expense account
+    expense_account_id = _expense_account_id_for(bill_schema)
 
-        # 7) Save to QBO
-        try:
-            if check_duplicate_bill_number(qb, bill_schema.bill_number):
-              print(f"Bill with number {bill_schema.bill_number} already exists in QuickBooks. Skipping creation.")
-              logged_pdf = PDFLog(
-                name = f"{bill.hauler.name} - {bill.bill_number} - {bill.service.service_account_number}" if bill.hauler and bill.service else f"{bill.bill_number}",
-                pdf_file = bill.pdf_link,
-                status = ["Bill already exists in QuickBooks"],
-                details = f"Bill with number {bill_schema.bill_number} already exists in QuickBooks. Skipping creation.",
-                tech_details = f"Bill with number {bill_schema.bill_number} already exists in QuickBooks. Skipping creation.",
-              )
-              logged_pdf.save()
-            else:
-              qbo_bill.save(qb=qb)
-              print(f"Bill {bill_schema.bill_number} created in QBO with Id {qbo_bill.Id}")
-        except Exception as e:
-            msg = str(e)
-            # simple heuristic
-            if "429" in msg or "500" in msg or "503" in msg or "timeout" in msg.lower():
-                raise RetryableSystemError(f"QBO transient error: {msg}")
-            raise BusinessValidationError(f"QBO validation error: {msg}")
+    print(f"Using expense account ID: {expense_account_id} for service type: {bill_schema.service_type}")
+    return expense_account_id
 
-    except ValidationError as e:
-        if bill:
-            bill.status = "Issue sending to QB"
+
+def _lookup_vendor(qb, bill_schema: BillSchema):
+    hauler = _get_vendor(qb, bill_schema.hauler_id)
+    print(f"Hauler (Vendor) found: {hauler.DisplayName}")
+    return hauler
+
+
+def _lookup_customer(qb, bill_schema: BillSchema):
+    customer = _get_customer_by_display_name(qb, bill_schema.customer_account)
+    print(f"Customer found: {customer.DisplayName}")
+    return customer
+
+
+def _lookup_expense_account(qb, expense_account_id: str):
+    expense_account = get_expense_account(qb, expense_account_id)
+    if expense_account is None:
+        raise BusinessValidationError(
+            f"Account id '{expense_account_id}' not found in QuickBooks",
+            payload={"account_id": expense_account_id},
+        )
+    print(f"Expense account found: {expense_account.Name}")
+    return expense_account
+
+
+def _lookup_location(qb, bill_schema: BillSchema):
+    #Comment on development
+    #Location
+    location = get_department_from_service_account(qb, bill_schema.service_account)
+    if not location:
+        raise BusinessValidationError(
+            f"No department found for service account '{bill_schema.service_account}'",
+            payload={"service_account": bill_schema.service_account},
+        )
+    return location
+
+
+def _lookup_duplicate(qb, bill_schema: BillSchema) -> bool:
+    # Part of step 7: errors are classified like a failed save
+    try:
+        return is_duplicate_doc_number(qb, bill_schema.bill_number)
+    except Exception as e:
+        raise _classify_save_error(qb, bill_schema, e)
+
+
+def _assemble_qbo_bill(bill_schema: BillSchema, hauler, customer, expense_account, location) -> QbBill:
+    #Comment on development
+    #terms
+    term = TERMS_ID_ON_QB.get(bill_schema.sales_term)
+    if not term:
+        term = DEFAULT_TERM_ID
+
+
+    # 6) Get QBO bill
+    qbo_bill = QbBill()
+    qbo_bill.DocNumber = bill_schema.bill_number
+    qbo_bill.VendorRef = {"value": hauler.Id}
+    qbo_bill.TxnDate = bill_schema.bill_date.strftime("%Y-%m-%d") # Ensures format YYYY-MM-DD (in case that bill_date is datetime)
+    qbo_bill.DueDate = bill_schema.due.strftime("%Y-%m-%d")
+    qbo_bill.PrivateNote = f"{bill_schema.pdf_link}"
+    qbo_bill.DepartmentRef = {"value": location.Id} # Comment on dev
+
+    qbo_bill.SalesTermRef = {"value": term}
+
+    qbo_bill.Line = [{
+        "DetailType": "AccountBasedExpenseLineDetail",
+        "Amount": float(bill_schema.total_amount),
+        "Description": bill_schema.service_name, # Service name
+        "AccountBasedExpenseLineDetail": {
+            "AccountRef": {"value": expense_account.Id, "name": expense_account.Name},
+            "CustomerRef": {"value": customer.Id}
+        },
+    }]
+    return qbo_bill
+
+
+def _build_qbo_bill(qb, bill_schema: BillSchema) -> QbBill:
+    """
+    Sequential lookups + payload, used by the batch service where the reference cache serves most lookups.
+    """
+    expense_account_id = _validate_references(bill_schema)
+    hauler = _lookup_vendor(qb, bill_schema)
+    customer = _lookup_customer(qb, bill_schema)
+    expense_account = _lookup_expense_account(qb, expense_account_id)
+    location = _lookup_location(qb, bill_schema)
+    return _assemble_qbo_bill(bill_schema, hauler, customer, expense_account, location)
+
+
+async def _fan_out(calls: dict) -> dict:
+    """
+    Run independent blocking lookups at the same time. The first failure cancels
+    the lookups that haven't started yet and is raised unchanged, so error
+    classification is the same as running them one after another.
+    """
+    tasks = {name: asyncio.ensure_future(run_blocking(fn, *args)) for name, (fn, *args) in calls.items()}
+    done, pending = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+    failed = [t for t in done if t.exception() is not None]
+    if failed:
+        for t in pending:
+            t.cancel()
+        # Lookups already running on a thread can't be interrupted; they finish and are discarded
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise failed[0].exception()
+    return {name: task.result() for name, task in tasks.items()}
+
+
+async def _build_qbo_bill_concurrently(qb, bill_schema: BillSchema) -> tuple[QbBill, bool]:
+    """
+    Vendor, customer, expense account, department and DocNumber duplicate check run
+    concurrently, so a bill waits for the slowest lookup instead of the sum of all five.
+    Returns the QBO bill payload and whether the DocNumber already exists.
+    """
+    expense_account_id = _validate_references(bill_schema)
+    found = await _fan_out({
+        "hauler": (_lookup_vendor, qb, bill_schema),
+        "customer": (_lookup_customer, qb, bill_schema),
+        "expense_account": (_lookup_expense_account, qb, expense_account_id),
+        "location": (_lookup_location, qb, bill_schema),
+        "duplicate": (_lookup_duplicate, qb, bill_schema),
+    })
+    qbo_bill = _assemble_qbo_bill(bill_schema, found["hauler"], found["customer"], found["expense_account"], found["location"])
+    return qbo_bill, found["duplicate"]
+
+
+def _classify_save_error(qb, bill_schema: BillSchema, e: Exception) -> DomainError:
+    msg = str(e)
+    # Throttling, 5xx, network and auth failures (by HTTP status / QBO fault code)
+    typed = classify_upstream_error(e, upstream="quickbooks")
+    if isinstance(typed, UpstreamError):
+        if typed.kind == UpstreamError.AUTH:
+            # Tokens were revoked or rotated elsewhere: rebuild the cached client on retry
+            invalidate_qbo_client(str(qb.company_id))
+        return typed
+    if isinstance(e, DomainError):
+        return e
+    # A rejected bill may point to stale cached references (inactive vendor, renamed department...)
+    invalidate_reference_cache(qb, "vendor", bill_schema.hauler_id)
+    invalidate_reference_cache(qb, "customer", bill_schema.customer_account.split(" - ")[-1])
+    invalidate_reference_cache(qb, "department", bill_schema.service_account)
+    invalidate_reference_cache(qb, "account", _expense_account_id_for(bill_schema))
+    return BusinessValidationError(f"QBO validation error: {msg}")
+
+
+def _record_duplicate(bill: BillModel, bill_schema: BillSchema):
+    print(f"Bill with number {bill_schema.bill_number} already exists in QuickBooks. Skipping creation.")
+    logged_pdf = PDFLog(
+      name = _pdf_log_name(bill),
+      pdf_file = bill.pdf_link,
+      status = ["Bill already exists in QuickBooks"],
+      details = f"Bill with number {bill_schema.bill_number} already exists in QuickBooks. Skipping creation.",
+      tech_details = f"Bill with number {bill_schema.bill_number} already exists in QuickBooks. Skipping creation.",
+    )
+    save_record(logged_pdf)
+
+
+def _remember_sent_bill(db: Session, company_id: str, bill_id: str, content_hash: str, doc_number: str, qbo_bill_id: str | None):
+    # Idempotency record and DocNumber index of a bill QBO has (created now, or a duplicate when qbo_bill_id is None)
+    try:
+        remember_submissions(db, company_id, [(bill_id, content_hash, "created" if qbo_bill_id else "duplicate", qbo_bill_id)])
+        if qbo_bill_id:
+            record_created_bills(company_id, [(doc_number, qbo_bill_id)])
+    except Exception as e:
+        print(f"[Idempotency] could not record bill_id={bill_id} after the save, continuing: {e}")
+
+
+def _record_success(bill: BillModel, qbo_bill_id: str | None = None):
+    bill.status_detail = ""
+    bill.status = BillStatus.BILL_IN_QB.value
+    if qbo_bill_id and AIRTABLE_QBO_BILL_ID_FIELD:
+        bill.qbo_bill_id = qbo_bill_id
+
+    logged_pdf = PDFLog(
+        name=_pdf_log_name(bill),
+        pdf_file=bill.pdf_link,
+        status=["Bill in QB"],
+        details=f"The bill {bill.bill_number} was successfully sent to QuickBooks.",
+        tech_details="",
+    )
+    save_record(logged_pdf)
+    save_record(bill)
+
+
+def _record_already_sent(bill: BillModel, qbo_bill_id: str | None):
+    # Same content already in QuickBooks: only bring the Bill in Airtable up to date
+    print(f"Bill {bill.bill_number} was already sent with this content (QBO Id {qbo_bill_id}). Skipping.")
+    bill.status_detail = ""
+    bill.status = BillStatus.BILL_IN_QB.value
+    if qbo_bill_id and AIRTABLE_QBO_BILL_ID_FIELD:
+        bill.qbo_bill_id = qbo_bill_id
+    save_record(bill)
+
+
+def _record_failure(bill: BillModel, e: Exception):
+    """
+    Writes the error outcome of a bill to Airtable (Bill status detail + PDF Log entry).
+    """
+    if isinstance(e, ValidationError):
+        bill.status = "Issue sending to QB"
+        detail = StatusDetail(
+            logg_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            file_link=bill.pdf_link,
+            status="Validation Error",
+            detail=f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
+            actions=[
+                "Review the bill details in AirTable for any inconsistencies.",
+                "Ensure all required fields are correctly filled.",
+                "If the error persists, contact your system administrator."
+            ]
+        )
+        bill.status_detail = str(detail)
+        #bill.status_detail = f"400: ValidationError | {e}"
+
+        logged_pdf = PDFLog(
+          name = _pdf_log_name(bill),
+          pdf_file = bill.pdf_link,
+          status = ["Record is missing required values"],
+          details = f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
+          tech_details = str(e),
+        )
+        save_record(logged_pdf)
+        save_record(bill)
+
+    elif isinstance(e, (BusinessValidationError, NotFoundDomainError, RetryableSystemError)):
+        bill.status = "Issue sending to QB"
+        if isinstance(e, BusinessValidationError) and e.payload and "errors" in e.payload:
             detail = StatusDetail(
                 logg_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 file_link=bill.pdf_link,
-                status="Validation Error",
-                detail=f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
+                status="Error with Bill Data",
+                detail=f"There was a problem sending the bill to QuickBooks",
                 actions=[
                     "Review the bill details in AirTable for any inconsistencies.",
                     "Ensure all required fields are correctly filled.",
+                    "Verify the Hauler and Customer exist in QuickBooks.",
                     "If the error persists, contact your system administrator."
                 ]
             )
             bill.status_detail = str(detail)
-            #bill.status_detail = f"400: ValidationError | {e}"
-            
+
             logged_pdf = PDFLog(
-              name = f"{bill.hauler.name} - {bill.bill_number} - {bill.service.service_account_number}" if bill.hauler and bill.service else f"{bill.bill_number}",
-              pdf_file = bill.pdf_link,
-              status = ["Record is missing required values"],
-              details = f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
-              tech_details = str(e),
+                name = _pdf_log_name(bill),
+                pdf_file=bill.pdf_link,
+                status=["Record is missing required values"],
+                details=f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
+                tech_details=str(e),
             )
-            logged_pdf.save()
-            bill.save()
+            save_record(logged_pdf)
+        else:
+            detail = StatusDetail(
+                logg_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                file_link=bill.pdf_link,
+                status="Error with AirTable to QuickBooks Workflow",
+                detail=f"There was a problem sending the bill to QuickBooks",
+                actions=[
+                    "Try resending the bill after some time.",
+                    "If the error persists, contact your system administrator."
+                ]
+            )
+            bill.status_detail = str(detail)
+
+            logged_pdf = PDFLog(
+                name = _pdf_log_name(bill),
+                pdf_file=bill.pdf_link,
+                status=["Workflow error"] ,
+                details=f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
+                tech_details=str(e),
+                action=["Wait 3 minutes and change the status to 'Done' and then to 'Send to QB' to try again"]
+            )
+            save_record(logged_pdf)
+        #bill.status_detail = e.to_airtable_detail()
+        save_record(bill)
+
+    else:
+        bill.status = "Issue sending to QB"
+        detail = StatusDetail(
+            logg_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            file_link=bill.pdf_link,
+            status="Error sending to QuickBooks",
+            detail=f"There was an unexpected error sending the bill to QuickBooks.",
+            actions=[
+                "Try resending the bill after some time.",
+                "If the error persists, contact your system administrator."
+            ]
+        )
+        bill.status_detail = str(detail)
+        logged_pdf = PDFLog(
+            name = _pdf_log_name(bill),
+            pdf_file=bill.pdf_link,
+            status=["Workflow error"],
+            details=f"There was an unexpected error sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
+            tech_details=str(e),
+            action=["Wait 3 minutes and change the status to 'Done' and then to 'Send to QB' to try again"]
+        )
+        save_record(logged_pdf)
+        # bill.status_detail = f"500: {e}"
+        save_record(bill)
+
+
+async def bill_service(bill_id: str, company_id: str | None = None, preloaded: BillModel | None = None):
+    db: Session | None = None
+    bill: BillModel | None = None
+
+    try:
+        db = SessionLocal()
+
+        # 1) Get bill (callers that stream bills in bulk pass it already hydrated)
+        with metrics.timed("bill_stage_seconds", stage="1_load_bill"):
+            bill = preloaded or await run_blocking(_load_bill, bill_id)
+
+        # 2) Build schema
+        with metrics.timed("bill_stage_seconds", stage="2_build_schema"):
+            bill_schema = await run_blocking(_build_bill_schema, bill)
+
+        # 2b) Same content already sent: one indexed lookup
+        with metrics.timed("bill_stage_seconds", stage="2b_idempotency"):
+            if not company_id:
+                company_id = await run_blocking(_get_default_company_id, db)
+            content_hash = bill_content_hash(bill_schema)
+            previous = await run_blocking(previous_submission, db, company_id, bill.id, content_hash)
+
+        # 3) Get QBO client
+        with metrics.timed("bill_stage_seconds", stage="3_qbo_client"):
+            qb = await run_blocking(get_qbo_client, realm_id=company_id, db=db)
+
+        print(f"QBO client obtained for company_id {company_id}")
+
+        # 2b) ...skipped if its QBO bill still exists (one query instead of lookups and save)
+        if previous:
+            with metrics.timed("bill_stage_seconds", stage="2b_idempotency"):
+                confirmed = await run_blocking(confirm_submissions, qb, db, {bill.id: previous})
+            if confirmed:
+                metrics.inc("bill_processed_total", outcome="already_sent")
+                with metrics.timed("bill_stage_seconds", stage="8_write_back"):
+                    await run_blocking(_record_already_sent, bill, previous.qbo_bill_id)
+                return
+
+        # 4-6) Lookups (+ duplicate check of step 7) in parallel, then the QBO bill payload
+        with metrics.timed("bill_stage_seconds", stage="4_6_lookups"):
+            qbo_bill, is_duplicate = await _build_qbo_bill_concurrently(qb, bill_schema)
+
+        # 7) Save to QBO
+        try:
+            with metrics.timed("bill_stage_seconds", stage="7_save"):
+                if is_duplicate:
+                  await run_blocking(_record_duplicate, bill, bill_schema)
+                else:
+                  await run_blocking(qbo_bill.save, qb=qb)
+                  print(f"Bill {bill_schema.bill_number} created in QBO with Id {qbo_bill.Id}")
+        except Exception as e:
+            raise _classify_save_error(qb, bill_schema, e)
+
+        # Outside the try above: the bill is in QBO now, a DB error here is not a failed save
+        await run_blocking(
+            _remember_sent_bill, db, company_id, bill.id, content_hash, bill_schema.bill_number,
+            None if is_duplicate else qbo_bill.Id,
+        )
+
+    except ValidationError as e:
+        metrics.inc("bill_processed_total", outcome="validation_error")
+        if bill:
+            with metrics.timed("bill_stage_seconds", stage="8_write_back"):
+                await run_blocking(_record_failure, bill, e)
         raise BusinessValidationError("Pydantic validation error", payload={"errors": e.errors()})
 
+    except CircuitOpenError:
+        # Upstream is down and wasn't called: no PDF Log entry, the task comes back later
+        metrics.inc("bill_processed_total", outcome="deferred")
+        raise
+
     except (BusinessValidationError, NotFoundDomainError, RetryableSystemError) as e:
+        metrics.inc("bill_processed_total", outcome=type(e).__name__)
         if bill:
-            bill.status = "Issue sending to QB"
-            if isinstance(e, BusinessValidationError) and e.payload and "errors" in e.payload:
-                detail = StatusDetail(
-                    logg_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    file_link=bill.pdf_link,
-                    status="Error with Bill Data",
-                    detail=f"There was a problem sending the bill to QuickBooks",
-                    actions=[
-                        "Review the bill details in AirTable for any inconsistencies.",
-                        "Ensure all required fields are correctly filled.",
-                        "Verify the Hauler and Customer exist in QuickBooks.",
-                        "If the error persists, contact your system administrator."
-                    ]
-                )
-                bill.status_detail = str(detail)
-
-                logged_pdf = PDFLog(
-                    name = f"{bill.hauler.name} - {bill.bill_number} - {bill.service.service_account_number}" if bill.hauler and bill.service else f"{bill.bill_number}",
-                    pdf_file=bill.pdf_link,
-                    status=["Record is missing required values"],
-                    details=f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
-                    tech_details=str(e),
-                )
-                logged_pdf.save()
-            else:
-                detail = StatusDetail(
-                    logg_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    file_link=bill.pdf_link,
-                    status="Error with AirTable to QuickBooks Workflow",
-                    detail=f"There was a problem sending the bill to QuickBooks",
-                    actions=[
-                        "Try resending the bill after some time.",
-                        "If the error persists, contact your system administrator."
-                    ]
-                )
-                bill.status_detail = str(detail)
-                
-                logged_pdf = PDFLog(
-                    name = f"{bill.hauler.name} - {bill.bill_number} - {bill.service.service_account_number}" if bill.hauler and bill.service else f"{bill.bill_number}",
-                    pdf_file=bill.pdf_link,
-                    status=["Workflow error"] ,
-                    details=f"There was a problem sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
-                    tech_details=str(e),
-                    action=["Wait 3 minutes and change the status to 'Done' and then to 'Send to QB' to try again"]
-                )
-                logged_pdf.save()
-            #bill.status_detail = e.to_airtable_detail()
-            bill.save()
+            with metrics.timed("bill_stage_seconds", stage="8_write_back"):
+                await run_blocking(_record_failure, bill, e)
         raise
 
     except Exception as e:
+      metrics.inc("bill_processed_total", outcome="unexpected_error")
+      if isinstance(e, AuthorizationException) and company_id:
+          invalidate_qbo_client(company_id)
       if bill:
-          bill.status = "Issue sending to QB"
-          detail = StatusDetail(
-              logg_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-              file_link=bill.pdf_link,
-              status="Error sending to QuickBooks",
-              detail=f"There was an unexpected error sending the bill to QuickBooks.",
-              actions=[
-                  "Try resending the bill after some time.",
-                  "If the error persists, contact your system administrator."
-              ]
-          )
-          bill.status_detail = str(detail)
-          logged_pdf = PDFLog(
-              name = f"{bill.hauler.name} - {bill.bill_number} - {bill.service.service_account_number}" if bill.hauler and bill.service else f"{bill.bill_number}",
-              pdf_file=bill.pdf_link,
-              status=["Workflow error"],
-              details=f"There was an unexpected error sending the bill {bill.bill_number} to QuickBooks. Errors: {e}",
-              tech_details=str(e),
-              action=["Wait 3 minutes and change the status to 'Done' and then to 'Send to QB' to try again"]
-          )
-          logged_pdf.save()
-          # bill.status_detail = f"500: {e}"
-          bill.save()
-          
+          with metrics.timed("bill_stage_seconds", stage="8_write_back"):
+              await run_blocking(_record_failure, bill, e)
+
       # Let the worker retry
       raise
     else:
-        bill.status_detail = ""
-        bill.status = BillStatus.BILL_IN_QB.value
-        
-        logged_pdf = PDFLog(
-            name=f"{bill.hauler.name} - {bill.bill_number} - {bill.service.service_account_number}" if bill.hauler and bill.service else f"{bill.bill_number}",
-            pdf_file=bill.pdf_link,
-            status=["Bill in QB"],
-            details=f"The bill {bill.bill_number} was successfully sent to QuickBooks.",
-            tech_details="",
-        )
-        logged_pdf.save()
-        bill.save()
\ No newline at end of file
+        metrics.inc("bill_processed_total", outcome="duplicate" if is_duplicate else "created")
+        with metrics.timed("bill_stage_seconds", stage="8_write_back"):
+            await run_blocking(_record_success, bill, None if is_duplicate else qbo_bill.Id)
+    finally:
+        if db is not None:
+            db.close()
+
+
+async def process_bills_concurrently(
+    bill_ids: list[str],
+    company_id: str | None = None,
+    concurrency: int = BILL_CONCURRENCY,
+    bills: dict[str, BillModel] | None = None,
+) -> dict[str, Exception | None]:
+    """
+    Run bill_service for many bills on one event loop, at most `concurrency` at a time.
+    `bills` (bill_id -> hydrated BillModel) skips the per-bill Airtable load.
+    Returns bill_id -> None on success or the exception that bill_service raised.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    bills = bills or {}
+
+    async def run_one(bill_id: str):
+        async with semaphore:
+            try:
+                await bill_service(bill_id, company_id, preloaded=bills.get(bill_id))
+                return bill_id, None
+            except Exception as e:
+                print(f"[Concurrent] bill_id={bill_id} err={e}")
+                return bill_id, e
+
+    results = await asyncio.gather(*(run_one(bill_id) for bill_id in bill_ids))
+    return dict(results)
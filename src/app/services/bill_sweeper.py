@@ -0,0 +1,79 @@
+import datetime as dt
+
+from pyairtable.formulas import EQ
+from ..models.Bill import Bill as BillModel
+from ..schemas.Bill import BillStatus
+from ..shared.redis_client import redis_client
+from ..utils.lock import RedisLock
+from ..core.config import BILL_SWEEP_MIN_AGE_SECONDS, BILL_SWEEP_MAX_BILLS
+from .bill_loader import hydrate_bills
+from .bill_batch_service import bill_batch_service, BatchResult
+from .webhook_coalescer import bill_in_flight, bill_processing_lock
+from .airtable_writer import pending_record_ids
+
+SWEEP_LOCK_KEY = "lock:bill_sweeper"
+# Airtable returns at most 100 records per page
+SWEEP_PAGE_SIZE = 100
+
+
+def list_bills_to_send(max_bills: int = BILL_SWEEP_MAX_BILLS) -> list[BillModel]:
+    """
+    Every Bill in "Send bill to QB" with one paginated formula query, oldest first.
+    """
+    return BillModel.all(
+        formula=EQ(BillModel.status, BillStatus.SEND_BILL_TO_QB.value),
+        page_size=SWEEP_PAGE_SIZE,
+        max_records=max_bills,
+        sort=["Last Modified Time"],
+    )
+
+
+def _settled(bill: BillModel, now: dt.datetime) -> bool:
+    # Give the webhook of a bill that just changed a chance to arrive first
+    if not bill.last_modified:
+        return True
+    return (now - bill.last_modified).total_seconds() >= BILL_SWEEP_MIN_AGE_SECONDS
+
+
+async def sweep_bills(company_id: str | None = None) -> dict:
+    """
+    Sends every settled "Send bill to QB" bill through the batch pipeline.
+    Bills with a queued task, a worker on them or buffered Airtable updates are
+    skipped; the rest are locked exactly as process_bill_task does while the batch runs.
+    """
+    sweep_lock = RedisLock(redis_client, SWEEP_LOCK_KEY, ttl=15 * 60)
+    if not sweep_lock.acquire():
+        print("[Sweeper] previous sweep still running, skipped")
+        return {"skipped": True}
+
+    locks: list[RedisLock] = []
+    try:
+        now = dt.datetime.now(dt.timezone.utc)
+        # A bill whose "Bill in QB" update is still buffered (write-behind) still reads "Send bill to QB"
+        unflushed = pending_record_ids("Bill")
+        candidates = [bill for bill in list_bills_to_send() if _settled(bill, now) and bill.id not in unflushed]
+
+        claimed: dict[str, BillModel] = {}
+        in_flight = 0
+        for bill in candidates:
+            if bill_in_flight(bill.id, company_id):
+                in_flight += 1
+                continue
+            lock = bill_processing_lock(bill.id)
+            if not lock.acquire():
+                in_flight += 1
+                continue
+            locks.append(lock)
+            claimed[bill.id] = bill
+
+        print(f"[Sweeper] {len(candidates)} bills to send, {in_flight} already in flight, {len(claimed)} claimed")
+        if not claimed:
+            return {"found": len(candidates), "in_flight": in_flight, **BatchResult().as_dict()}
+
+        hydrate_bills(list(claimed.values()))
+        result = await bill_batch_service(list(claimed), company_id, bills=claimed)
+        return {"found": len(candidates), "in_flight": in_flight, **result.as_dict()}
+    finally:
+        for lock in locks:
+            lock.release()
+        sweep_lock.release()
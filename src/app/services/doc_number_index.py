@@ -0,0 +1,138 @@
+import datetime as dt
+from contextlib import contextmanager
+from sqlalchemy.orm import Session
+from quickbooks.objects.bill import Bill as QbBill
+from ..database.engine import SessionLocal
+from ..database.crud_bill_index import find_doc_numbers, add_doc_numbers, remove_doc_numbers, get_index_sync, mark_index_synced
+from ..shared.quickbooks import now_utc, ensure_aware
+from ..utils.quickbooks import check_duplicate_bill_number, check_duplicate_bill_numbers
+from ..core.config import DOC_NUMBER_INDEX_ENABLED, DOC_NUMBER_INDEX_MAX_AGE_SECONDS
+
+# QBO returns at most 1000 entities per query page
+QBO_PAGE_SIZE = 1000
+# Incremental syncs start a bit before the last watermark to absorb clock skew
+WATERMARK_OVERLAP = dt.timedelta(minutes=5)
+
+
+@contextmanager
+def _session(db: Session | None):
+    # Lookups may run on the I/O thread pool, so by default each call uses its own session
+    if db is not None:
+        yield db
+        return
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _realm_of(qb) -> str:
+    return str(qb.company_id)
+
+
+def _index_is_fresh(db: Session, realm_id: str) -> bool:
+    state = get_index_sync(db, realm_id)
+    if state is None or state.synced_until is None:
+        return False
+    age = (now_utc() - ensure_aware(state.synced_until)).total_seconds()
+    return age < DOC_NUMBER_INDEX_MAX_AGE_SECONDS
+
+
+def sync_doc_numbers(qb, full: bool = False, db: Session | None = None) -> int:
+    """
+    Pull Bill DocNumbers from QuickBooks into the local index, 1000 per page.
+    The first sync of a realm (or full=True) reads every bill, later ones only bills
+    updated since the previous sync. Returns how many DocNumbers were added.
+    """
+    realm_id = _realm_of(qb)
+    with _session(db) as db:
+        state = get_index_sync(db, realm_id)
+        full = full or state is None or state.synced_until is None
+        started_at = now_utc()
+
+        where = ""
+        if not full:
+            since = ensure_aware(state.synced_until) - WATERMARK_OVERLAP
+            where = f"WHERE MetaData.LastUpdatedTime >= '{since.strftime('%Y-%m-%dT%H:%M:%S')}-00:00' "
+
+        added = 0
+        position = 1
+        while True:
+            page = QbBill.query(
+                f"SELECT Id, DocNumber FROM Bill {where}STARTPOSITION {position} MAXRESULTS {QBO_PAGE_SIZE}",
+                qb=qb,
+            )
+            added += add_doc_numbers(db, realm_id, [(b.DocNumber, b.Id) for b in page], source="sync")
+            if len(page) < QBO_PAGE_SIZE:
+                break
+            position += QBO_PAGE_SIZE
+
+        mark_index_synced(db, realm_id, started_at.replace(tzinfo=None), full=full)
+        print(f"DocNumber index for realm_id {realm_id} synced ({'full' if full else 'incremental'}): {added} added")
+        return added
+
+
+def is_duplicate_doc_number(qb, doc_number: str, db: Session | None = None) -> bool:
+    """
+    Duplicate check backed by the local index. A miss is trusted while the index
+    was synced within DOC_NUMBER_INDEX_MAX_AGE_SECONDS; a miss on a stale (or never
+    synced) index falls back to a QBO query. A hit is confirmed with QBO, since
+    incremental syncs can't see bills deleted there: a stale entry is dropped.
+    """
+    if not DOC_NUMBER_INDEX_ENABLED:
+        return check_duplicate_bill_number(qb, doc_number)
+
+    realm_id = _realm_of(qb)
+    with _session(db) as db:
+        indexed = bool(find_doc_numbers(db, realm_id, [doc_number]))
+        if not indexed and _index_is_fresh(db, realm_id):
+            return False
+
+        exists = check_duplicate_bill_number(qb, doc_number)
+        if exists and not indexed:
+            add_doc_numbers(db, realm_id, [(doc_number, None)], source="qbo_check")
+        elif indexed and not exists:
+            print(f"DocNumber {doc_number} is no longer in QuickBooks, removed from the local index.")
+            remove_doc_numbers(db, realm_id, [doc_number])
+        return exists
+
+
+def find_duplicate_doc_numbers(qb, doc_numbers: list[str], db: Session | None = None) -> set[str]:
+    """
+    Batch version of is_duplicate_doc_number: index hits, plus the remaining
+    numbers when the index is stale, are checked with a single DocNumber IN (...) query.
+    """
+    if not DOC_NUMBER_INDEX_ENABLED:
+        return check_duplicate_bill_numbers(qb, doc_numbers)
+
+    realm_id = _realm_of(qb)
+    with _session(db) as db:
+        indexed = find_doc_numbers(db, realm_id, doc_numbers)
+        to_check = [n for n in doc_numbers if n in indexed]
+        if not _index_is_fresh(db, realm_id):
+            to_check = [n for n in doc_numbers if n]
+        if not to_check:
+            return set()
+
+        in_qbo = check_duplicate_bill_numbers(qb, to_check)
+        if in_qbo - indexed:
+            add_doc_numbers(db, realm_id, [(n, None) for n in in_qbo - indexed], source="qbo_check")
+        stale = indexed - in_qbo
+        if stale:
+            print(f"{len(stale)} DocNumbers are no longer in QuickBooks, removed from the local index.")
+            remove_doc_numbers(db, realm_id, stale)
+        return in_qbo
+
+
+def record_created_bills(realm_id: str, created: list[tuple[str, str]], db: Session | None = None):
+    """
+    Add (doc_number, qbo_bill_id) of bills we just created to the index.
+    """
+    if not DOC_NUMBER_INDEX_ENABLED or not created:
+        return
+    try:
+        with _session(db) as db:
+            add_doc_numbers(db, realm_id, created, source="created")
+    except Exception as e:
+        print(f"Could not add created bills to the DocNumber index for realm_id {realm_id}: {e}")
@@ -0,0 +1,223 @@
+import time
+from typing import Callable
+
+from ..shared.redis_client import redis_client
+from ..utils.lock import RedisLock
+from ..utils.metrics import metrics
+from ..core.config import (
+    REALM_MAX_IN_FLIGHT,
+    REALM_MAX_IN_FLIGHT_OVERRIDES,
+    REALM_SLOT_LEASE_SECONDS,
+    REALM_WEIGHTS,
+)
+
+# Bills waiting per realm: zset bill_id -> time it may start (after the coalescing window)
+QUEUE_KEY = "realm:{realm}:queue"
+# Bills released to Celery per realm: zset bill_id -> lease expiry (a crashed worker frees its slot)
+IN_FLIGHT_KEY = "realm:{realm}:in_flight"
+ACTIVE_REALMS_KEY = "realm:active"
+CURSOR_KEY = "realm:cursor"
+DISPATCH_LOCK_KEY = "lock:realm:dispatch"
+# Set when a dispatch was asked for while another one was running, so that one goes around again
+DISPATCH_AGAIN_KEY = "realm:dispatch:again"
+
+# Queue of bills without a company_id while the default company can't be looked up (bill_service resolves it)
+DEFAULT_REALM = "default"
+
+
+def _default_realm() -> str:
+    # Loaded on first use and cached per process by _get_default_company_id: the web app doesn't import SQLAlchemy at startup
+    from ..database.engine import SessionLocal
+    from ..utils.quickbooks import _get_default_company_id
+    db = SessionLocal()
+    try:
+        return _get_default_company_id(db)
+    except Exception as e:
+        print(f"[RealmScheduler] default company unavailable, using the '{DEFAULT_REALM}' queue: {e}")
+        return DEFAULT_REALM
+    finally:
+        db.close()
+
+
+def realm_key(company_id: str | None) -> str:
+    # Bills without a company_id share the queue, cap and weight of the default company
+    return company_id or _default_realm()
+
+
+def realm_weight(realm: str) -> int:
+    return max(1, REALM_WEIGHTS.get(realm, 1))
+
+
+def realm_cap(realm: str) -> int:
+    return max(1, REALM_MAX_IN_FLIGHT_OVERRIDES.get(realm, REALM_MAX_IN_FLIGHT))
+
+
+def submit_bill(bill_id: str, company_id: str | None = None, delay: float = 0):
+    """
+    Put a bill in its realm's queue; dispatch_bills() hands it to a worker once
+    `delay` seconds passed and the realm has a free slot.
+    A bill already waiting keeps its place.
+    """
+    realm = realm_key(company_id)
+    pipe = redis_client.pipeline()
+    pipe.zadd(QUEUE_KEY.format(realm=realm), {bill_id: time.time() + (delay or 0)}, nx=True)
+    pipe.sadd(ACTIVE_REALMS_KEY, realm)
+    pipe.execute()
+
+
+def submit_bills(bill_ids: list[str], company_id: str | None = None, delay: float = 0):
+    """
+    submit_bill() for many bills of one realm, in one round trip.
+    """
+    if not bill_ids:
+        return
+    realm = realm_key(company_id)
+    ready_at = time.time() + (delay or 0)
+    pipe = redis_client.pipeline()
+    pipe.zadd(QUEUE_KEY.format(realm=realm), {bill_id: ready_at for bill_id in bill_ids}, nx=True)
+    pipe.sadd(ACTIVE_REALMS_KEY, realm)
+    pipe.execute()
+
+
+def release_slot(company_id: str | None, bill_id: str):
+    """
+    Called when a task of the bill ends (done, failed or scheduled for retry).
+    """
+    redis_client.zrem(IN_FLIGHT_KEY.format(realm=realm_key(company_id)), bill_id)
+
+
+def hold_slot(company_id: str | None, bill_id: str, seconds: float):
+    """
+    Keep the bill's slot for `seconds` more (plus the usual lease), e.g. while its
+    task waits for a Celery retry, so retries count against the realm's cap.
+    """
+    redis_client.zadd(IN_FLIGHT_KEY.format(realm=realm_key(company_id)), {bill_id: time.time() + (seconds or 0) + REALM_SLOT_LEASE_SECONDS})
+
+
+def bill_scheduled(bill_id: str, company_id: str | None = None) -> bool:
+    """
+    True when the bill waits in a realm queue or holds an unexpired slot. A bill
+    may wait longer than its coalescing marker lives, so this is checked too.
+    Looks at the given realm and every realm with bills waiting.
+    """
+    realms = {realm_key(company_id)} | {m.decode() if isinstance(m, bytes) else m for m in redis_client.smembers(ACTIVE_REALMS_KEY)}
+    pipe = redis_client.pipeline(transaction=False)
+    for realm in realms:
+        pipe.zscore(QUEUE_KEY.format(realm=realm), bill_id)
+        pipe.zscore(IN_FLIGHT_KEY.format(realm=realm), bill_id)
+    scores = pipe.execute()
+    now = time.time()
+    return any(score is not None for score in scores[0::2]) or any(score is not None and score > now for score in scores[1::2])
+
+
+def _free_slots(realms: list[str], now: float) -> dict[str, int]:
+    pipe = redis_client.pipeline()
+    for realm in realms:
+        pipe.zremrangebyscore(IN_FLIGHT_KEY.format(realm=realm), "-inf", now)
+        pipe.zcard(IN_FLIGHT_KEY.format(realm=realm))
+    counts = pipe.execute()[1::2]
+    return {realm: realm_cap(realm) - int(n) for realm, n in zip(realms, counts)}
+
+
+def _dispatch_round_robin(send: Callable[[str, str | None], None]) -> int:
+    realms = sorted(m.decode() if isinstance(m, bytes) else m for m in redis_client.smembers(ACTIVE_REALMS_KEY))
+    if not realms:
+        return 0
+    # Start each dispatch at the next realm, so no realm always goes first
+    start = redis_client.incr(CURSOR_KEY) % len(realms)
+    realms = realms[start:] + realms[:start]
+
+    now = time.time()
+    free = _free_slots(realms, now)
+    dispatched = 0
+    progress = True
+    while progress:
+        progress = False
+        for realm in realms:
+            take = min(realm_weight(realm), free[realm])
+            if take <= 0:
+                continue
+            queue_key = QUEUE_KEY.format(realm=realm)
+            bill_ids = [b.decode() if isinstance(b, bytes) else b for b in redis_client.zrangebyscore(queue_key, "-inf", now, start=0, num=take)]
+            if not bill_ids:
+                continue
+
+            pipe = redis_client.pipeline()
+            pipe.zrem(queue_key, *bill_ids)
+            pipe.zadd(IN_FLIGHT_KEY.format(realm=realm), {bill_id: now + REALM_SLOT_LEASE_SECONDS for bill_id in bill_ids})
+            pipe.execute()
+            for position, bill_id in enumerate(bill_ids):
+                try:
+                    send(bill_id, None if realm == DEFAULT_REALM else realm)
+                except Exception:
+                    # Broker down: put it and the rest of the chunk back at the front, the next dispatch tries again
+                    unsent = bill_ids[position:]
+                    pipe = redis_client.pipeline()
+                    pipe.zadd(queue_key, {unsent_id: 0 for unsent_id in unsent})
+                    pipe.zrem(IN_FLIGHT_KEY.format(realm=realm), *unsent)
+                    pipe.execute()
+                    raise
+            metrics.inc("realm_bills_dispatched_total", len(bill_ids), realm=realm)
+            free[realm] -= len(bill_ids)
+            dispatched += len(bill_ids)
+            progress = True
+
+    # Forget realms with nothing left; re-add if a bill came in meanwhile
+    for realm in realms:
+        if not redis_client.zcard(QUEUE_KEY.format(realm=realm)):
+            redis_client.srem(ACTIVE_REALMS_KEY, realm)
+            if redis_client.zcard(QUEUE_KEY.format(realm=realm)):
+                redis_client.sadd(ACTIVE_REALMS_KEY, realm)
+    return dispatched
+
+
+def dispatch_bills(send: Callable[[str, str | None], None]) -> int:
+    """
+    Hand waiting bills to `send` (which queues the Celery task), weighted
+    round-robin across realms and never more than the realm's cap in flight, so
+    a big backlog in one company doesn't delay the others and workers don't all
+    pile on one realm's QBO rate limit. Only one dispatch runs at a time; a call
+    made meanwhile makes the running one go around again.
+    Returns how many bills were sent.
+    """
+    lock = RedisLock(redis_client, DISPATCH_LOCK_KEY, ttl=30)
+    if not lock.acquire():
+        redis_client.set(DISPATCH_AGAIN_KEY, 1, ex=30)
+        return 0
+    dispatched = 0
+    try:
+        while True:
+            redis_client.delete(DISPATCH_AGAIN_KEY)
+            dispatched += _dispatch_round_robin(send)
+            if not redis_client.exists(DISPATCH_AGAIN_KEY):
+                break
+    finally:
+        lock.release()
+    return dispatched
+
+
+def next_ready_in() -> float | None:
+    """
+    Seconds until the earliest waiting bill may start (0 if one is ready), None when nothing waits.
+    """
+    soonest = None
+    for realm in redis_client.smembers(ACTIVE_REALMS_KEY):
+        realm = realm.decode() if isinstance(realm, bytes) else realm
+        first = redis_client.zrange(QUEUE_KEY.format(realm=realm), 0, 0, withscores=True)
+        if first:
+            soonest = first[0][1] if soonest is None else min(soonest, first[0][1])
+    return None if soonest is None else max(0.0, soonest - time.time())
+
+
+def realm_queue_stats() -> list[dict]:
+    stats = []
+    now = time.time()
+    for realm in sorted(m.decode() if isinstance(m, bytes) else m for m in redis_client.smembers(ACTIVE_REALMS_KEY)):
+        stats.append({
+            "realm": realm,
+            "waiting": redis_client.zcard(QUEUE_KEY.format(realm=realm)),
+            "in_flight": redis_client.zcount(IN_FLIGHT_KEY.format(realm=realm), now, "+inf"),
+            "cap": realm_cap(realm),
+            "weight": realm_weight(realm),
+        })
+    return stats
@@ -0,0 +1,123 @@
+from ..shared.redis_client import redis_client
+from ..utils.lock import RedisLock
+from .realm_scheduler import bill_scheduled
+from ..core.config import (
+    REALM_FAIR_SCHEDULING,
+    WEBHOOK_COALESCE_ENABLED,
+    WEBHOOK_COALESCE_TTL_SECONDS,
+    BILL_PROCESSING_LOCK_TTL_SECONDS,
+)
+
+PENDING_KEY = "webhook:bill:{bill_id}:pending"
+MERGED_KEY = "webhook:bill:{bill_id}:merged"
+PROCESSING_LOCK_KEY = "lock:bill:{bill_id}"
+
+
+def register_bill_event(bill_id: str) -> tuple[bool, int]:
+    """
+    Record a webhook event for a bill. Returns (enqueue, merged): enqueue is True
+    only for the first event since the last task started; later events are merged
+    into that task and merged counts them.
+    """
+    if not WEBHOOK_COALESCE_ENABLED:
+        return True, 0
+    try:
+        if redis_client.set(PENDING_KEY.format(bill_id=bill_id), 1, nx=True, ex=WEBHOOK_COALESCE_TTL_SECONDS):
+            return True, 0
+        merged_key = MERGED_KEY.format(bill_id=bill_id)
+        pipe = redis_client.pipeline()
+        pipe.incr(merged_key)
+        pipe.expire(merged_key, WEBHOOK_COALESCE_TTL_SECONDS)
+        merged, _ = pipe.execute()
+        return False, int(merged)
+    except Exception as e:
+        # Without Redis every event gets its own task, as before
+        print(f"[Webhook] coalescing unavailable for bill_id={bill_id}: {e}")
+        return True, 0
+
+
+def register_bill_events(bill_ids: list[str]) -> dict[str, tuple[bool, int]]:
+    """
+    register_bill_event() for many bills in two pipelined round trips instead of
+    two per bill. Returns bill_id -> (enqueue, merged).
+    """
+    if not WEBHOOK_COALESCE_ENABLED or not bill_ids:
+        return {bill_id: (True, 0) for bill_id in bill_ids}
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for bill_id in bill_ids:
+            pipe.set(PENDING_KEY.format(bill_id=bill_id), 1, nx=True, ex=WEBHOOK_COALESCE_TTL_SECONDS)
+        created = pipe.execute()
+        events = {bill_id: (True, 0) for bill_id, first in zip(bill_ids, created) if first}
+        repeated = [bill_id for bill_id, first in zip(bill_ids, created) if not first]
+        if repeated:
+            pipe = redis_client.pipeline(transaction=False)
+            for bill_id in repeated:
+                pipe.incr(MERGED_KEY.format(bill_id=bill_id))
+                pipe.expire(MERGED_KEY.format(bill_id=bill_id), WEBHOOK_COALESCE_TTL_SECONDS)
+            counts = pipe.execute()[::2]
+            events.update({bill_id: (False, int(merged)) for bill_id, merged in zip(repeated, counts)})
+        return {bill_id: events[bill_id] for bill_id in bill_ids}
+    except Exception as e:
+        print(f"[Webhook] coalescing unavailable for {len(bill_ids)} bills: {e}")
+        return {bill_id: (True, 0) for bill_id in bill_ids}
+
+
+def forget_bill_events(bill_ids: list[str]):
+    """
+    forget_bill_event() for many bills, in one call.
+    """
+    if not bill_ids:
+        return
+    try:
+        keys = [key.format(bill_id=bill_id) for bill_id in bill_ids for key in (PENDING_KEY, MERGED_KEY)]
+        redis_client.delete(*keys)
+    except Exception as e:
+        print(f"[Webhook] could not clear pending events for {len(bill_ids)} bills: {e}")
+
+
+def forget_bill_event(bill_id: str):
+    """
+    Drop the pending marker when the task could not be queued, so the next event tries again.
+    """
+    try:
+        redis_client.delete(PENDING_KEY.format(bill_id=bill_id), MERGED_KEY.format(bill_id=bill_id))
+    except Exception as e:
+        print(f"[Webhook] could not clear pending event for bill_id={bill_id}: {e}")
+
+
+def take_bill_event(bill_id: str) -> int:
+    """
+    Called when the task starts: events from now on queue a new task.
+    Returns how many events were merged into this one.
+    """
+    if not WEBHOOK_COALESCE_ENABLED:
+        return 0
+    try:
+        pipe = redis_client.pipeline()
+        pipe.get(MERGED_KEY.format(bill_id=bill_id))
+        pipe.delete(PENDING_KEY.format(bill_id=bill_id), MERGED_KEY.format(bill_id=bill_id))
+        merged, _ = pipe.execute()
+        return int(merged or 0)
+    except Exception as e:
+        print(f"[Webhook] could not take pending event for bill_id={bill_id}: {e}")
+        return 0
+
+
+def bill_in_flight(bill_id: str, company_id: str | None = None) -> bool:
+    """
+    True when a task for the bill is waiting in the queue (or its realm's queue)
+    or a worker is processing it.
+    """
+    try:
+        if redis_client.exists(PENDING_KEY.format(bill_id=bill_id), PROCESSING_LOCK_KEY.format(bill_id=bill_id)):
+            return True
+        return REALM_FAIR_SCHEDULING and bill_scheduled(bill_id, company_id)
+    except Exception as e:
+        print(f"[Webhook] could not check bill_id={bill_id}: {e}")
+        return True
+
+
+def bill_processing_lock(bill_id: str) -> RedisLock:
+    # Only one worker processes a given bill at a time
+    return RedisLock(redis_client, PROCESSING_LOCK_KEY.format(bill_id=bill_id), ttl=BILL_PROCESSING_LOCK_TTL_SECONDS)
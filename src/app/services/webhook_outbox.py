@@ -0,0 +1,178 @@
+import asyncio
+import datetime as dt
+import time
+import uuid
+from itertools import groupby
+
+from ..utils.metrics import metrics
+from ..core.config import (
+    WEBHOOK_OUTBOX_BATCH_SIZE,
+    WEBHOOK_OUTBOX_CLAIM_LEASE_SECONDS,
+    WEBHOOK_OUTBOX_RELAY_INTERVAL_SECONDS,
+    WEBHOOK_OUTBOX_MAX_BACKOFF_SECONDS,
+    WEBHOOK_OUTBOX_RETENTION_HOURS,
+)
+from .bill_queue import enqueue_bill_events
+
+# How often the relay loop deletes events dispatched more than WEBHOOK_OUTBOX_RETENTION_HOURS ago
+PURGE_INTERVAL_SECONDS = 600
+
+
+def _session():
+    # Loaded on first use, like get_db(): the web app doesn't import SQLAlchemy at startup
+    from ..database.engine import SessionLocal
+    return SessionLocal()
+
+
+def accept_bill_events(bill_ids: list[str], company_id: str | None = None) -> int:
+    """
+    Store webhook events in the outbox (one INSERT, no Redis or broker involved),
+    so they are kept even while the broker is down. The relay queues them.
+    Returns how many were stored.
+    """
+    from ..database.crud_webhook_outbox import append_events
+    db = _session()
+    try:
+        return append_events(db, bill_ids, company_id)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def relay_batch(token: str | None = None, batch_size: int = WEBHOOK_OUTBOX_BATCH_SIZE) -> tuple[int, int]:
+    """
+    Hand the oldest claimed batch of outbox events to the queue (enqueue_bill_events,
+    i.e. coalescing, realm queues, Celery), in arrival order, one call per run of
+    events of the same company.
+    An event is marked dispatched only once it was queued; if the broker fails, it
+    and everything after it go back to the outbox to keep the order. An event queued
+    again after a crash between the two steps merges into the pending task.
+    Returns (dispatched, pending events it could not queue).
+    """
+    from ..database.crud_webhook_outbox import claim_events, mark_dispatched, release_events
+    token = token or uuid.uuid4().hex
+    db = _session()
+    try:
+        events = claim_events(db, token, batch_size, WEBHOOK_OUTBOX_CLAIM_LEASE_SECONDS)
+        dispatched = 0
+        for company_id, run in groupby(events, key=lambda event: event.company_id):
+            run = list(run)
+            try:
+                enqueue_bill_events([event.bill_id for event in run], company_id)
+            except Exception as e:
+                left = [event.id for event in events[dispatched:]]
+                release_events(db, token, left, str(e)[:500])
+                print(f"[Outbox] queue unavailable, {len(left)} events kept for the next pass: {e}")
+                metrics.inc("webhook_outbox_relay_errors_total")
+                return dispatched, len(left)
+            mark_dispatched(db, token, [event.id for event in run])
+            dispatched += len(run)
+        if dispatched:
+            metrics.inc("webhook_outbox_relayed_total", dispatched)
+        return dispatched, 0
+    finally:
+        db.close()
+
+
+def drain_outbox(batch_size: int = WEBHOOK_OUTBOX_BATCH_SIZE, max_batches: int | None = None) -> tuple[int, int]:
+    """
+    Relay batches until the outbox is empty, the broker fails or max_batches ran.
+    Returns (dispatched, pending events left by a failed batch).
+    """
+    token = uuid.uuid4().hex
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        dispatched, failed = relay_batch(token, batch_size)
+        total += dispatched
+        batches += 1
+        if failed or dispatched < batch_size:
+            return total, failed
+    return total, 0
+
+
+def purge_outbox(retention_hours: int = WEBHOOK_OUTBOX_RETENTION_HOURS) -> int:
+    from ..database.crud_webhook_outbox import purge_dispatched
+    db = _session()
+    try:
+        return purge_dispatched(db, dt.datetime.utcnow() - dt.timedelta(hours=retention_hours))
+    finally:
+        db.close()
+
+
+def outbox_status() -> dict:
+    from ..database.crud_webhook_outbox import outbox_stats
+    db = _session()
+    try:
+        return outbox_stats(db)
+    finally:
+        db.close()
+
+
+class OutboxRelay:
+    """
+    Background loop of the web app that drains the outbox. It wakes up when a
+    webhook is accepted, or every WEBHOOK_OUTBOX_RELAY_INTERVAL_SECONDS. While the
+    broker fails it backs off (up to WEBHOOK_OUTBOX_MAX_BACKOFF_SECONDS) and new
+    webhooks keep landing in the outbox.
+    """
+
+    def __init__(self, interval: float = WEBHOOK_OUTBOX_RELAY_INTERVAL_SECONDS, max_backoff: float = WEBHOOK_OUTBOX_MAX_BACKOFF_SECONDS):
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._task: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._backoff = 0.0
+        self._last_purge = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        # Ignored while backing off: new events wait for the next attempt
+        if self._wakeup is not None and not self._backoff:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                dispatched, failed = await asyncio.to_thread(drain_outbox, WEBHOOK_OUTBOX_BATCH_SIZE)
+            except Exception as e:
+                # Database unavailable: same backoff as a broker error
+                print(f"[Outbox] relay pass failed: {e}")
+                dispatched, failed = 0, 1
+            if dispatched:
+                print(f"[Outbox] relayed {dispatched} events")
+            self._backoff = min(self.max_backoff, (self._backoff * 2) or self.interval) if failed else 0.0
+
+            if time.monotonic() - self._last_purge > PURGE_INTERVAL_SECONDS:
+                self._last_purge = time.monotonic()
+                try:
+                    await asyncio.to_thread(purge_outbox)
+                except Exception as e:
+                    print(f"[Outbox] purge failed: {e}")
+
+            if self._backoff:
+                await asyncio.sleep(self._backoff)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+outbox_relay = OutboxRelay()
@@ -0,0 +1,279 @@
+import re
+import time
+
+from .redis_client import redis_client
+from .http_pool import PooledHTTPAdapter, mount_pooled, register_adapter
+from ..utils.metrics import metrics
+from ..utils.retry import parse_retry_after
+from ..utils.circuit_breaker import circuit_breaker, airtable_circuit, is_outage
+from ..core.config import (
+    AIRTABLE_GOVERNOR_ENABLED,
+    AIRTABLE_REQUESTS_PER_SECOND,
+    AIRTABLE_GOVERNOR_MAX_WAIT_SECONDS,
+    AIRTABLE_THROTTLE_PAUSE_SECONDS,
+    AIRTABLE_MAX_THROTTLE_RETRIES,
+    AIRTABLE_HTTP_POOL_SIZE,
+    AIRTABLE_HTTP_TIMEOUT_SECONDS,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+)
+from ..core.exceptions import UpstreamError
+
+_BASE_IN_URL = re.compile(r"/v0/(app[A-Za-z0-9]+)")
+
+# Reserves the next send time of a base (requests spaced by interval_ms across every process).
+# Returns how many ms the caller must wait, or -wait when that exceeds max_wait_ms (nothing reserved).
+#   KEYS[1] = governor hash (tat = next free time, pause_until = set after a 429)
+#   ARGV = now_ms, interval_ms, max_wait_ms
+_RESERVE_LUA = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local tat = tonumber(redis.call('HGET', KEYS[1], 'tat') or '0')
+local pause_until = tonumber(redis.call('HGET', KEYS[1], 'pause_until') or '0')
+local start = math.max(now, tat, pause_until)
+local wait = start - now
+if wait > max_wait then
+  return -wait
+end
+redis.call('HSET', KEYS[1], 'tat', start + interval)
+redis.call('PEXPIRE', KEYS[1], wait + interval + 60000)
+return wait
+"""
+
+# Pushes pause_until forward (never backwards) after Airtable answered 429
+_PAUSE_LUA = """
+local pause_until = tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'pause_until') or '0')
+if pause_until > current then
+  redis.call('HSET', KEYS[1], 'pause_until', pause_until)
+end
+redis.call('PEXPIRE', KEYS[1], math.max(60000, pause_until - tonumber(ARGV[2]) + 60000))
+return 1
+"""
+
+
+class AirtableGovernor:
+    def __init__(
+        self,
+        redis_client,
+        prefix: str = "airtable:gov",
+        requests_per_second: float = 5,
+        max_wait: float = 60,
+        throttle_pause: float = 30,
+        enabled: bool = True,
+    ):
+        """
+        :param redis_client: Client instance for Redis (shared by web and worker processes).
+        :param prefix: Key prefix, keys look like '{prefix}:{base_id}' and '{prefix}:{base_id}:stats'.
+        :param requests_per_second: Requests allowed per base; calls are spaced evenly, not burst.
+        :param max_wait: Longest queue wait accepted before giving up with UpstreamError.
+        :param throttle_pause: Pause applied to the whole base after a 429 without Retry-After.
+        :param enabled: When False requests go straight to Airtable.
+        """
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.interval_ms = int(1000 / requests_per_second)
+        self.max_wait_ms = int(max_wait * 1000)
+        self.throttle_pause = throttle_pause
+        self.enabled = enabled
+        self._reserve_script = redis_client.register_script(_RESERVE_LUA)
+        self._pause_script = redis_client.register_script(_PAUSE_LUA)
+
+    def _key(self, base_id: str) -> str:
+        return f"{self.prefix}:{base_id}"
+
+    def _stats_key(self, base_id: str) -> str:
+        return f"{self.prefix}:{base_id}:stats"
+
+    def _count(self, base_id: str, wait_ms: int = 0, throttled: bool = False):
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            key = self._stats_key(base_id)
+            if throttled:
+                pipe.hincrby(key, "throttled", 1)
+            else:
+                pipe.hincrby(key, "requests", 1)
+                pipe.hincrby(key, "wait_ms_total", wait_ms)
+                pipe.hset(key, "last_wait_ms", wait_ms)
+            pipe.execute()
+        except Exception as e:
+            print(f"[AirtableGovernor] could not update stats: {e}")
+
+    def wait_turn(self, base_id: str):
+        """
+        Block until this process may send the next request to the base.
+        """
+        if not self.enabled:
+            return
+        while True:
+            try:
+                wait_ms = int(self._reserve_script(
+                    keys=[self._key(base_id)],
+                    args=[int(time.time() * 1000), self.interval_ms, self.max_wait_ms],
+                ))
+            except Exception as e:
+                # Never block Airtable calls because Redis is down
+                print(f"[AirtableGovernor] governor unavailable, calling without it: {e}")
+                return
+
+            if wait_ms < 0:
+                raise UpstreamError(
+                    f"Airtable rate limit: queue wait of {-wait_ms / 1000:.1f}s for base {base_id} is over the limit",
+                    upstream="airtable",
+                    kind=UpstreamError.THROTTLED,
+                    retry_after=-wait_ms / 1000.0,
+                    payload={"base_id": base_id, "wait_ms": -wait_ms},
+                )
+            self._count(base_id, wait_ms=wait_ms)
+            if not wait_ms:
+                return
+            time.sleep(wait_ms / 1000.0)
+            # A 429 may have paused the base while we were queued: take a new turn after the pause
+            if not self._is_paused(base_id):
+                return
+
+    def _is_paused(self, base_id: str) -> bool:
+        try:
+            pause_until = int(self.redis_client.hget(self._key(base_id), "pause_until") or 0)
+        except Exception:
+            return False
+        return pause_until > int(time.time() * 1000)
+
+    def throttled(self, base_id: str, retry_after: float | None):
+        """
+        Airtable answered 429: hold every process off the base for Retry-After
+        seconds (Airtable asks for 30s when it doesn't send the header).
+        """
+        self._count(base_id, throttled=True)
+        pause = retry_after if retry_after is not None else self.throttle_pause
+        now_ms = int(time.time() * 1000)
+        try:
+            self._pause_script(keys=[self._key(base_id)], args=[now_ms + int(pause * 1000), now_ms])
+        except Exception as e:
+            print(f"[AirtableGovernor] could not store pause: {e}")
+        return pause
+
+    def stats(self, base_id: str) -> dict:
+        raw = self.redis_client.hgetall(self._key(base_id))
+        counters = {k.decode(): int(v) for k, v in self.redis_client.hgetall(self._stats_key(base_id)).items()}
+        now_ms = int(time.time() * 1000)
+        next_free = max(int(raw.get(b"tat", 0)), int(raw.get(b"pause_until", 0)))
+        requests = counters.get("requests", 0)
+        return {
+            "current_wait_ms": max(0, next_free - now_ms),
+            "paused_for_ms": max(0, int(raw.get(b"pause_until", 0)) - now_ms),
+            "requests": requests,
+            "throttled": counters.get("throttled", 0),
+            "avg_wait_ms": round(counters.get("wait_ms_total", 0) / requests, 1) if requests else 0,
+            "last_wait_ms": counters.get("last_wait_ms", 0),
+        }
+
+
+class GovernedAdapter(PooledHTTPAdapter):
+    """
+    Transport adapter for the pyairtable sessions: every request (and every
+    retry after a 429) waits for its turn in the shared governor, unless the
+    base's circuit breaker is open. One instance serves every model, so they
+    share one keep-alive connection pool.
+    """
+    def __init__(self, governor: AirtableGovernor, max_throttle_retries: int = 3, **kwargs):
+        self.governor = governor
+        self.max_throttle_retries = max_throttle_retries
+        super().__init__("airtable", **kwargs)
+
+    def send(self, request, **kwargs):
+        match = _BASE_IN_URL.search(request.url or "")
+        base_id = match.group(1) if match else "default"
+
+        circuit = airtable_circuit(base_id)
+        probe = circuit_breaker.check(circuit)
+        try:
+            response = self._send_governed(base_id, request, **kwargs)
+        except Exception as e:
+            circuit_breaker.record(circuit, probe, failed=is_outage(e))
+            raise
+        circuit_breaker.record(circuit, probe, failed=response.status_code >= 500)
+        return response
+
+    def _send_governed(self, base_id: str, request, **kwargs):
+        attempt = 0
+        while True:
+            self.governor.wait_turn(base_id)
+            start = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            except Exception as e:
+                metrics.inc("upstream_http_responses_total", upstream="airtable", status=type(e).__name__)
+                raise
+            finally:
+                metrics.observe("upstream_request_seconds", time.perf_counter() - start, upstream="airtable")
+            metrics.inc("upstream_http_responses_total", upstream="airtable", status=response.status_code)
+            if response.status_code != 429:
+                return response
+
+            pause = self.governor.throttled(base_id, parse_retry_after(response))
+            attempt += 1
+            print(f"[AirtableGovernor] 429 from Airtable for base {base_id}, pausing {pause}s (attempt {attempt})")
+            if attempt > self.max_throttle_retries:
+                response.close()
+                raise UpstreamError(
+                    f"Airtable rate limit: still throttled after {self.max_throttle_retries} retries",
+                    upstream="airtable",
+                    kind=UpstreamError.THROTTLED,
+                    retry_after=pause,
+                    status_code=429,
+                    payload={"base_id": base_id},
+                )
+            response.close()
+
+
+airtable_governor = AirtableGovernor(
+    redis_client,
+    requests_per_second=AIRTABLE_REQUESTS_PER_SECOND,
+    max_wait=AIRTABLE_GOVERNOR_MAX_WAIT_SECONDS,
+    throttle_pause=AIRTABLE_THROTTLE_PAUSE_SECONDS,
+    enabled=AIRTABLE_GOVERNOR_ENABLED,
+)
+
+
+airtable_adapter = GovernedAdapter(
+    airtable_governor,
+    max_throttle_retries=AIRTABLE_MAX_THROTTLE_RETRIES,
+    pool_size=AIRTABLE_HTTP_POOL_SIZE,
+    timeout=AIRTABLE_HTTP_TIMEOUT_SECONDS,
+    connect_timeout=HTTP_CONNECT_TIMEOUT_SECONDS,
+)
+register_adapter(airtable_adapter)
+
+
+def install_airtable_adapter(*models):
+    """
+    Route the HTTP session of each pyairtable Model through the shared adapter:
+    one connection pool for all models, and the governor in front of every call.
+    The governor replaces pyairtable's own 429 retry, which backs off for under
+    2 seconds in every process separately; with the governor off that retry is kept.
+    """
+    if not models:
+        return
+    adapter = airtable_adapter
+    if not AIRTABLE_GOVERNOR_ENABLED:
+        adapter = PooledHTTPAdapter(
+            "airtable",
+            pool_size=AIRTABLE_HTTP_POOL_SIZE,
+            timeout=AIRTABLE_HTTP_TIMEOUT_SECONDS,
+            connect_timeout=HTTP_CONNECT_TIMEOUT_SECONDS,
+            max_retries=models[0].meta.api.session.get_adapter("https://").max_retries,
+        )
+        register_adapter(adapter)
+    for model in models:
+        mount_pooled(model.meta.api.session, adapter)
+
+
+def set_airtable_endpoint(endpoint_url: str, *models):
+    """
+    Point pyairtable Models at another Airtable-compatible endpoint (e.g. the
+    stand-in server of benchmarks/). Must run before the models make any request.
+    """
+    from pyairtable.utils import Url
+    for model in models:
+        model.meta.api.endpoint_url = Url(endpoint_url)
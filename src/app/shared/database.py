@@ -1,6 +1,6 @@
-from ..database.engine import SessionLocal
-
 def get_db():
+    # The database (SQLAlchemy) is loaded on the first request that needs it
+    from ..database.engine import SessionLocal
     db = SessionLocal()
     try:
         yield db
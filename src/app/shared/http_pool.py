@@ -0,0 +1,117 @@
+import threading
+
+from requests.adapters import HTTPAdapter
+
+from ..utils.metrics import metrics
+from ..core.config import (
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    QBO_HTTP_POOL_SIZE,
+    QBO_HTTP_TIMEOUT_SECONDS,
+)
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    requests adapter whose keep-alive connection pool is meant to be shared by
+    every Session talking to one upstream in this process, so connections (and
+    their TLS handshakes) are reused across tasks and client rebuilds.
+    Adds a default timeout, requests doesn't have one and a stuck socket
+    would hold a worker forever.
+    """
+    def __init__(self, name: str, pool_size: int = 10, timeout: float = 60, connect_timeout: float = 5, **kwargs):
+        self.name = name
+        self.timeout = (connect_timeout, timeout)
+        self.requests_sent = 0
+        self._opened_seen = 0
+        self._lock = threading.Lock()
+        # One pool per host; Intuit uses three (discovery, OAuth, API)
+        super().__init__(pool_connections=4, pool_maxsize=pool_size, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        self.requests_sent += 1
+        try:
+            return super().send(request, timeout=timeout or self.timeout, **kwargs)
+        finally:
+            self._count_new_connections()
+
+    def _connections_opened(self) -> int:
+        pools = self.poolmanager.pools
+        return sum(getattr(pools.get(key), "num_connections", 0) for key in list(pools.keys()))
+
+    def _count_new_connections(self):
+        # Only new connections (TCP + TLS handshake) cost a Redis write
+        opened = self._connections_opened()
+        with self._lock:
+            new, self._opened_seen = opened - self._opened_seen, opened
+        if new > 0:
+            metrics.inc("http_connections_opened_total", new, upstream=self.name)
+
+    def reset(self):
+        """
+        Drop pooled connections without closing the adapter, e.g. in a forked
+        worker process that must not share its parent's sockets.
+        """
+        self.poolmanager.clear()
+        with self._lock:
+            self._opened_seen = 0
+
+    def stats(self) -> dict:
+        hosts = []
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "requests": pool.num_requests,
+                "connections_opened": pool.num_connections,
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+            })
+        requests_ = sum(h["requests"] for h in hosts)
+        opened = sum(h["connections_opened"] for h in hosts)
+        return {
+            "upstream": self.name,
+            "pool_size": self._pool_maxsize,
+            "requests": self.requests_sent,
+            "connections_opened": opened,
+            "reuse_ratio": round(1 - opened / requests_, 3) if requests_ else None,
+            "hosts": hosts,
+        }
+
+
+# Every Intuit call of this process: discovery document, OAuth tokens and the v3 API
+quickbooks_adapter = PooledHTTPAdapter(
+    "quickbooks",
+    pool_size=QBO_HTTP_POOL_SIZE,
+    timeout=QBO_HTTP_TIMEOUT_SECONDS,
+    connect_timeout=HTTP_CONNECT_TIMEOUT_SECONDS,
+)
+
+# Filled by shared/airtable.py (the Airtable adapter also governs the request rate)
+_adapters: dict[str, PooledHTTPAdapter] = {"quickbooks": quickbooks_adapter}
+
+
+def register_adapter(adapter: PooledHTTPAdapter):
+    _adapters[adapter.name] = adapter
+
+
+def mount_pooled(session, adapter: PooledHTTPAdapter):
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def pool_stats() -> list[dict]:
+    return [adapter.stats() for adapter in _adapters.values()]
+
+
+def reset_pools():
+    for adapter in _adapters.values():
+        adapter.reset()
+
+
+def close_pools():
+    for adapter in _adapters.values():
+        stats = adapter.stats()
+        print(f"[HTTP] {adapter.name}: {stats['requests']} requests over {stats['connections_opened']} connections")
+        adapter.close()
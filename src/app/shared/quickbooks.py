@@ -1,31 +1,100 @@
 import datetime as dt
-import redis
+import json
+import os
+import socket
+import threading
 from sqlalchemy.orm import Session
 from intuitlib.client import AuthClient
 from quickbooks import QuickBooks
 import time
 from ..utils.lock import RedisLock
-from ..core.config import REDIS_URL, REDIS_PORT, REDIS_DB
+from ..utils.rate_limit import qbo_rate_limiter
+from ..utils.metrics import metrics
+from ..utils.retry import classify_upstream_error, upstream_http_error
+from ..utils.circuit_breaker import circuit_breaker, quickbooks_circuit, OAUTH_CIRCUIT
+from .redis_client import redis_client
+from .http_pool import quickbooks_adapter, mount_pooled
 
 from ..core.config import (
     QUICKBOOKS_CLIENT_ID,
     QUICKBOOKS_CLIENT_SECRET,
     QUICKBOOKS_REDIRECT_URI,
     QUICKBOOKS_ENV,
+    QUICKBOOKS_API_URL,
 )
 from ..database.crud_qbo import get_decrypted_tokens, upsert_tokens
+from ..security.fernet import encrypt, decrypt
 from ..core.exceptions import BusinessValidationError
 
-redis_client = redis.from_url(REDIS_URL, db = int(REDIS_DB) if REDIS_DB else 0, decode_responses=False)
 TOKEN_SAFETY_WINDOW_SECONDS = 5 * 60  # refresh 5 minutes before expiry
+TOKEN_REFRESH_LOCK_TTL_SECONDS = 10  # also how long other workers wait for the refresh
 UTC = dt.timezone.utc # all times in UTC
 
+# Pub/sub channel announcing token rotations so every process drops its cached client
+TOKENS_CHANNEL = "qbo:tokens:rotated"
+
+# Per-process cache of authenticated clients: realm_id -> (QuickBooks, access token expiry)
+_client_cache: dict[str, tuple[QuickBooks, dt.datetime]] = {}
+_client_cache_lock = threading.Lock()
+# One client build (discovery document, tokens) per realm at a time in this process
+_build_locks: dict[str, threading.Lock] = {}
+_listener_pid: int | None = None
+
+
+class RateLimitedQuickBooks(QuickBooks):
+    """
+    QuickBooks client whose HTTP calls (queries, creates, batch, PDFs) wait for a
+    slot of the per-realm rate limiter shared by all workers.
+    429, 5xx and network failures are raised as UpstreamError (with Retry-After)
+    instead of python-quickbooks' generic exceptions, and count towards the
+    realm's circuit breaker.
+    """
+    def process_request(self, request_type, url, headers="", params="", data=""):
+        # Fail fast while the realm's circuit is open, before waiting for a slot
+        with circuit_breaker.guard(quickbooks_circuit(str(self.company_id))):
+            with qbo_rate_limiter.slot(str(self.company_id)):
+                start = time.perf_counter()
+                try:
+                    response = super().process_request(request_type, url, headers=headers, params=params, data=data)
+                except Exception as e:
+                    metrics.inc("upstream_http_responses_total", upstream="quickbooks", status=type(e).__name__)
+                    typed = classify_upstream_error(e, upstream="quickbooks")
+                    if typed is e:
+                        raise
+                    raise typed from e
+                finally:
+                    metrics.observe("upstream_request_seconds", time.perf_counter() - start, upstream="quickbooks")
+                metrics.inc("upstream_http_responses_total", upstream="quickbooks", status=response.status_code)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise upstream_http_error("quickbooks", response)
+                return response
+
+    def _start_session(self):
+        # Reuse this process's pooled connections instead of a fresh OAuth2Session pool per client
+        refresh_token = super()._start_session()
+        mount_pooled(self.session, quickbooks_adapter)
+        return refresh_token
+
+
+# Identifies this process in pub/sub messages (module state is copied on fork, so use the pid)
+def _process_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
 # Get the authentication client for QuickBooks
+class PooledAuthClient(AuthClient):
+    """
+    AuthClient (a requests Session) whose discovery document and token calls
+    go through this process's pooled Intuit connections.
+    """
+    def get_adapter(self, url):
+        return quickbooks_adapter
+
+
 def get_auth_client() -> AuthClient:
-    return AuthClient(
+    return PooledAuthClient(
         client_id=QUICKBOOKS_CLIENT_ID,
         client_secret=QUICKBOOKS_CLIENT_SECRET,
-        environment=QUICKBOOKS_ENV,         # "sandbox" or "production"
+        environment=QUICKBOOKS_ENV,         # "sandbox", "production" or a discovery document URL
         redirect_uri=QUICKBOOKS_REDIRECT_URI,
     )
 
@@ -66,9 +135,10 @@ def refresh_tokens(db: Session, auth_client: AuthClient, realm_id: str, refresh_
     Uses a Redis lock to prevent concurrent refreshes.
     """
     lock_key = f"lock:refresh_token:{realm_id}"
-    lock = RedisLock(redis_client, lock_key, ttl=10)  # TTL 10s para evitar locks pegados
+    lock = RedisLock(redis_client, lock_key, ttl=TOKEN_REFRESH_LOCK_TTL_SECONDS)  # TTL corto para evitar locks pegados
 
     if lock.acquire():
+        tokens = None
         try:
             print(f"Acquired lock for refreshing tokens for realm_id {realm_id}")
 
@@ -76,7 +146,12 @@ def refresh_tokens(db: Session, auth_client: AuthClient, realm_id: str, refresh_
                 raise ValueError("No refresh token provided")
 
             # Refresh the tokens with QuickBooks
-            auth_client.refresh(refresh_token)
+            try:
+                with metrics.timed("qbo_token_refresh_seconds"):
+                    auth_client.refresh(refresh_token)
+            except Exception:
+                metrics.inc("qbo_token_refresh_total", outcome="failed")
+                raise
 
             # Access token + expiry
             access_token = auth_client.access_token
@@ -101,33 +176,160 @@ def refresh_tokens(db: Session, auth_client: AuthClient, realm_id: str, refresh_
             )
 
             print(f"Tokens refreshed successfully for realm_id {realm_id}")
-            return access_token, access_expires_at, new_refresh, new_refresh_expires_at
+            metrics.inc("qbo_token_refresh_total", outcome="refreshed")
+            publish_tokens_rotated(realm_id, access_token, access_expires_at)
+            tokens = (access_token, access_expires_at, new_refresh, new_refresh_expires_at)
+            return tokens
         finally:
-            lock.release()
+            # Waiting workers get the new tokens with the release, no DB read
+            lock.release(_encode_tokens(tokens) if tokens else None)
             print(f"Released lock for refreshing tokens for realm_id {realm_id}")
     else:
-        # Lock ocupado: espera a que el otro worker termine y lea los tokens de DB
+        # Lock ocupado: espera a que el otro worker termine y use sus tokens
         print(f"Lock already acquired for realm_id {realm_id}. Waiting for tokens...")
-        timeout = 5  # segundos
         start = time.time()
-        while time.time() - start < timeout:
-            record = get_decrypted_tokens(db, realm_id)
-            if record and record.get("refresh_token"):
-                return (
-                    record.get("access_token"),
-                    record.get("access_token_expires_at"),
-                    record.get("refresh_token"),
-                    record.get("refresh_token_expires_at")
-                )
-            time.sleep(0.5)
+        result = lock.wait(timeout=TOKEN_REFRESH_LOCK_TTL_SECONDS)
+        metrics.observe("qbo_token_lock_wait_seconds", time.time() - start)
+        if result:
+            metrics.inc("qbo_token_refresh_total", outcome="waited_for_other_worker")
+            return _decode_tokens(result)
+
+        # The holder failed or its result expired: use the DB only if it has a fresh access token
+        record = get_decrypted_tokens(db, realm_id)
+        if record and record.get("access_token") and not needs_refresh(record.get("access_token_expires_at")):
+            metrics.inc("qbo_token_refresh_total", outcome="waited_for_other_worker")
+            return (
+                record.get("access_token"),
+                record.get("access_token_expires_at"),
+                record.get("refresh_token"),
+                record.get("refresh_token_expires_at")
+            )
+        metrics.inc("qbo_token_refresh_total", outcome="lock_timeout")
         raise ValueError("Refresh token not available after waiting for lock release")
 
 
+def _encode_tokens(tokens: tuple) -> str:
+    # Tokens never go to Redis in clear text
+    access_token, access_expires_at, refresh_token, refresh_expires_at = tokens
+    return json.dumps({
+        "access_token": encrypt(access_token),
+        "access_token_expires_at": ensure_aware(access_expires_at).isoformat(),
+        "refresh_token": encrypt(refresh_token),
+        "refresh_token_expires_at": ensure_aware(refresh_expires_at).isoformat(),
+    })
+
+
+def _decode_tokens(payload: str) -> tuple:
+    data = json.loads(payload)
+    return (
+        decrypt(data["access_token"]),
+        dt.datetime.fromisoformat(data["access_token_expires_at"]),
+        decrypt(data["refresh_token"]),
+        dt.datetime.fromisoformat(data["refresh_token_expires_at"]),
+    )
+
+
+def publish_tokens_rotated(realm_id: str, access_token: str | None = None, access_expires_at: dt.datetime | None = None):
+    """
+    Tell every worker that the tokens of a realm changed. With the new access token
+    (encrypted) they update their cached client in place instead of rebuilding it.
+    """
+    message = {"realm_id": realm_id, "origin": _process_id()}
+    if access_token and access_expires_at:
+        message["access_token"] = encrypt(access_token)
+        message["access_token_expires_at"] = ensure_aware(access_expires_at).isoformat()
+    try:
+        redis_client.publish(TOKENS_CHANNEL, json.dumps(message))
+    except Exception as e:
+        print(f"Could not publish token rotation for realm_id {realm_id}: {e}")
+
+
+def invalidate_qbo_client(realm_id: str | None = None):
+    """
+    Drop the cached client of a realm (or all of them) in this process.
+    """
+    with _client_cache_lock:
+        if realm_id is None:
+            _client_cache.clear()
+        else:
+            _client_cache.pop(realm_id, None)
+
+
+def _apply_rotated_tokens(realm_id: str, encrypted_access_token: str, expires_at: str):
+    with _client_cache_lock:
+        cached = _client_cache.get(realm_id)
+    if not cached:
+        return
+    try:
+        access_token = decrypt(encrypted_access_token)
+        access_expires_at = ensure_aware(dt.datetime.fromisoformat(expires_at))
+    except Exception as e:
+        print(f"Could not read rotated tokens for realm_id {realm_id}: {e}")
+        invalidate_qbo_client(realm_id)
+        return
+    qb = cached[0]
+    qb.session.access_token = access_token
+    qb.auth_client.access_token = access_token
+    with _client_cache_lock:
+        _client_cache[realm_id] = (qb, access_expires_at)
+
+
+def _on_tokens_rotated(message):
+    try:
+        data = json.loads(message["data"])
+    except (TypeError, ValueError):
+        return
+    if data.get("access_token"):
+        _apply_rotated_tokens(data.get("realm_id"), data["access_token"], data.get("access_token_expires_at"))
+        return
+    # The process that refreshed already cached the new client
+    if data.get("origin") == _process_id():
+        return
+    invalidate_qbo_client(data.get("realm_id"))
+
+
+def _ensure_tokens_listener():
+    """
+    Start (once per process) the background thread that listens for token rotations.
+    Started lazily because Celery forks worker processes after import.
+    """
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    try:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{TOKENS_CHANNEL: _on_tokens_rotated})
+        pubsub.run_in_thread(sleep_time=1, daemon=True)
+        _listener_pid = os.getpid()
+    except Exception as e:
+        # Without the listener we still expire clients by token expiry
+        print(f"Could not subscribe to {TOKENS_CHANNEL}: {e}")
+
+
 def get_qbo_client(realm_id: str, db: Session) -> QuickBooks:
     """
     Returns a QuickBooks client with valid tokens.
+    Clients are cached per process and realm until the access token gets within
+    TOKEN_SAFETY_WINDOW_SECONDS of expiry or another worker rotates the tokens.
     Automatically refreshes & persists tokens when needed.
     """
+    _ensure_tokens_listener()
+
+    cached = _client_cache.get(realm_id)
+    if cached and not needs_refresh(cached[1]):
+        return cached[0]
+
+    with _client_cache_lock:
+        build_lock = _build_locks.setdefault(realm_id, threading.Lock())
+    # Concurrent bills of a realm wait for the first one's client instead of each building their own
+    with build_lock:
+        cached = _client_cache.get(realm_id)
+        if cached and not needs_refresh(cached[1]):
+            return cached[0]
+        return _build_qbo_client(realm_id, db)
+
+
+def _build_qbo_client(realm_id: str, db: Session) -> QuickBooks:
     record = get_decrypted_tokens(db, realm_id)
     if not record:
         raise BusinessValidationError("QuickBooks is not connected yet. Go to /qbo/connect")
@@ -137,29 +339,58 @@ def get_qbo_client(realm_id: str, db: Session) -> QuickBooks:
     record["refresh_token_expires_at"] = ensure_aware(record["refresh_token_expires_at"])
 
     env = record.get("environment") or QUICKBOOKS_ENV
-    auth_client = get_auth_client()
-
-    # Si el access token está expirado o no existe
-    if needs_refresh(record["access_token_expires_at"]) or not record["access_token"]:
-        if not record.get("refresh_token"):
-            raise BusinessValidationError("Missing refresh token. Reconnect QuickBooks at /qbo/connect")
-
-        # Refresca tokens usando lock
-        access_token, access_expires_at, refresh_token, refresh_expires_at = refresh_tokens(
-            db, auth_client, realm_id, record["refresh_token"], env
-        )
-        auth_client.access_token = access_token
-        auth_client.refresh_token = refresh_token
-    else:
-        # Reusa tokens existentes
-        auth_client.access_token = record["access_token"]
-        auth_client.refresh_token = record["refresh_token"]
+    if (needs_refresh(record["access_token_expires_at"]) or not record["access_token"]) and not record.get("refresh_token"):
+        raise BusinessValidationError("Missing refresh token. Reconnect QuickBooks at /qbo/connect")
+
+    # Discovery document and token refresh go to Intuit's OAuth servers
+    with circuit_breaker.guard(OAUTH_CIRCUIT):
+        auth_client = get_auth_client()
+
+        # Si el access token está expirado o no existe
+        if needs_refresh(record["access_token_expires_at"]) or not record["access_token"]:
+            # Refresca tokens usando lock
+            access_token, access_expires_at, refresh_token, refresh_expires_at = refresh_tokens(
+                db, auth_client, realm_id, record["refresh_token"], env
+            )
+            auth_client.access_token = access_token
+            auth_client.refresh_token = refresh_token
+            access_expires_at = ensure_aware(access_expires_at)
+        else:
+            # Reusa tokens existentes
+            auth_client.access_token = record["access_token"]
+            auth_client.refresh_token = record["refresh_token"]
+            access_expires_at = record["access_token_expires_at"]
 
     # Construye cliente QuickBooks
-    qb = QuickBooks(
+    qb = RateLimitedQuickBooks(
         auth_client=auth_client,
         company_id=realm_id,
         refresh_token=auth_client.refresh_token,
         sandbox=(env == "sandbox"),
     )
+    if QUICKBOOKS_API_URL:
+        # Local stand-in or proxy instead of Intuit's v3 API
+        qb.api_url_v3 = qb.sandbox_api_url_v3 = QUICKBOOKS_API_URL
+
+    with _client_cache_lock:
+        _client_cache[realm_id] = (qb, access_expires_at)
     return qb
+
+
+def refresh_realm_tokens(db: Session, realm_id: str, ahead_seconds: float) -> bool:
+    """
+    Rotate the tokens of a realm when its access token expires within `ahead_seconds`.
+    Run on a schedule (refresh_qbo_tokens_task) well before TOKEN_SAFETY_WINDOW_SECONDS,
+    so get_qbo_client finds fresh tokens and bill tasks never refresh inline.
+    Returns True when the tokens were refreshed.
+    """
+    record = get_decrypted_tokens(db, realm_id)
+    if not record or not record.get("refresh_token"):
+        return False
+    if record.get("access_token") and expires_in_seconds(record["access_token_expires_at"]) > ahead_seconds:
+        return False
+
+    env = record.get("environment") or QUICKBOOKS_ENV
+    with circuit_breaker.guard(OAUTH_CIRCUIT):
+        refresh_tokens(db, get_auth_client(), realm_id, record["refresh_token"], env)
+    return True
@@ -0,0 +1,6 @@
+import redis
+
+from ..core.config import REDIS_URL, REDIS_DB
+
+# Shared Redis client (locks, caches, counters). Celery uses its own connection.
+redis_client = redis.from_url(REDIS_URL, db = int(REDIS_DB) if REDIS_DB else 0, decode_responses=False)
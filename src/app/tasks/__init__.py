@@ -1,4 +1,8 @@
 # Import all tasks so they can be discovered by Celery
 from . import bill_task
+from . import airtable_task
+from . import qbo_task
+# Registers the task signals (worker-side retry and failure metrics by exception class)
+from . import signals  # noqa: F401
 
-__all__ = ['bill_task']
+__all__ = ['bill_task', 'airtable_task', 'qbo_task']
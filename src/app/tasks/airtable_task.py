@@ -0,0 +1,7 @@
+from ..core.celery_worker import celery
+from ..services.airtable_writer import flush_writes
+
+
+@celery.task(name='app.task.airtable_task.flush_airtable_writes_task', ignore_result=True)
+def flush_airtable_writes_task():
+    return flush_writes()
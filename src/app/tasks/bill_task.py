@@ -1,21 +1,160 @@
+from celery.exceptions import Retry
 from ..core.celery_worker import celery
-from ..services.bill_service import bill_service
-from ..core.exceptions import BusinessValidationError, NotFoundDomainError, RetryableSystemError
+from ..services.bill_service import bill_service, process_bills_concurrently
+from ..services.bill_batch_service import bill_batch_service
+from ..services.bill_sweeper import sweep_bills
+from ..core.exceptions import DomainError, BusinessValidationError, NotFoundDomainError, RetryableSystemError
+from ..utils.aio import run_async
+from ..utils.retry import retry_task, dominant_error, backoff_delay, defer_task
+from ..utils.circuit_breaker import circuit_breaker, pipeline_circuits
+from ..services.webhook_coalescer import take_bill_event, bill_processing_lock
+from ..services.realm_scheduler import release_slot, hold_slot, next_ready_in
+from ..services.bill_queue import enqueue_bill_event, schedule_dispatch, dispatch_waiting_bills
+from ..core.config import REALM_FAIR_SCHEDULING
 
-@celery.task(name='app.task.bill_task.process_bill_task', bind=True, max_retries=3, default_retry_delay=10)
-def process_bill_task(self, bill_id: str, company_id: str | None = None):
-    import asyncio
+# max_retries=None: retries are capped per error class by retry_task (RETRY_BUDGET_*)
+@celery.task(name='app.task.bill_task.process_bill_task', bind=True, max_retries=None)
+def process_bill_task(self, bill_id: str, company_id: str | None = None, retry_counts: dict | None = None):
+    retrying = False
     try:
-        asyncio.run(bill_service(bill_id, company_id))
+        _process_bill(self, bill_id, company_id)
+    except Retry as e:
+        retrying = True
+        if REALM_FAIR_SCHEDULING:
+            # The retry keeps the bill's slot: throttled/deferred bills still count against the realm's cap
+            _hold_slot_for_retry(bill_id, company_id, e.when)
+        raise
+    finally:
+        if REALM_FAIR_SCHEDULING and not retrying:
+            # Free the realm's slot and let its next bill in
+            _next_bill_for_realm(bill_id, company_id)
+
+
+def _process_bill(task, bill_id: str, company_id: str | None):
+    # Upstream down: come back when its circuit half-opens (the pending event keeps merging new ones)
+    wait = circuit_breaker.open_for(*pipeline_circuits(company_id))
+    if wait:
+        raise defer_task(task, wait)
+
+    merged = take_bill_event(bill_id)
+    if merged:
+        print(f"[Webhook] bill_id={bill_id} merged {merged} repeated events into this task")
+
+    lock = bill_processing_lock(bill_id)
+    try:
+        locked = lock.acquire()
+    except Exception as e:
+        print(f"[Lock] could not lock bill_id={bill_id}, processing anyway: {e}")
+        locked, lock = True, None
+    if not locked:
+        # Another worker is on this bill: run once more after it, the event may carry newer data
+        print(f"[Lock] bill_id={bill_id} is being processed by another worker, queued again")
+        enqueue_bill_event(bill_id, company_id)
+        return
+
+    try:
+        run_async(bill_service(bill_id, company_id))
     except (BusinessValidationError, NotFoundDomainError) as e:
         # 4xx / no-retry: let fail clean (will be logged by the service)
         print(f"[Non-retryable] bill_id={bill_id} err={e}")
         raise
-    except RetryableSystemError as e:
-        # Temporary errors: yes retry
+    except Exception as e:
+        # Temporary and unknown errors: backoff with jitter, honoring Retry-After
         print(f"[Retryable] bill_id={bill_id} err={e}")
-        raise self.retry(exc=e)
+        raise retry_task(task, e)
+    finally:
+        if lock is not None:
+            lock.release()
+
+
+def _hold_slot_for_retry(bill_id: str, company_id: str | None, when):
+    countdown = when if isinstance(when, (int, float)) else 0
+    try:
+        hold_slot(company_id, bill_id, countdown)
     except Exception as e:
-        # Unknowns: treat as retryable once (would improve with type classification)
-        print(f"[Retryable-unknown] bill_id={bill_id} err={e}")
-        raise self.retry(exc=e)
+        # The slot lease runs out on its own
+        print(f"[Scheduler] could not keep the slot of bill_id={bill_id} for its retry: {e}")
+
+
+def _next_bill_for_realm(bill_id: str, company_id: str | None):
+    try:
+        release_slot(company_id, bill_id)
+        dispatch_waiting_bills()
+    except Exception as e:
+        # The beat dispatcher catches up, and the slot lease expires on its own
+        print(f"[Scheduler] could not dispatch after bill_id={bill_id}: {e}")
+
+
+@celery.task(name='app.task.bill_task.dispatch_realm_bills_task', ignore_result=True)
+def dispatch_realm_bills_task():
+    """
+    Hands waiting bills to the workers (also run by beat to catch up after
+    expired slot leases or broker errors).
+    """
+    dispatched = dispatch_waiting_bills()
+    if dispatched:
+        print(f"[Scheduler] dispatched {dispatched} bills")
+    # Bills still inside their coalescing window get their own dispatch
+    wait = next_ready_in()
+    if wait:
+        schedule_dispatch(wait)
+    return dispatched
+
+
+@celery.task(name='app.task.bill_task.process_bill_batch_task', bind=True, max_retries=None)
+def process_bill_batch_task(self, bill_ids: list[str], company_id: str | None = None, retry_counts: dict | None = None):
+    wait = circuit_breaker.open_for(*pipeline_circuits(company_id))
+    if wait:
+        raise defer_task(self, wait)
+
+    try:
+        result = run_async(bill_batch_service(bill_ids, company_id))
+    except Exception as e:
+        # The batch as a whole failed (QBO client, default company, loading the bills): retry all of it
+        print(f"[Retryable] batch of {len(bill_ids)} bills err={e}")
+        raise retry_task(self, e)
+    if result.retryable:
+        # Only bills with transient errors go back to the queue
+        print(f"[Retryable] batch bill_ids={result.retryable}")
+        raise retry_task(self, dominant_error(result.retry_errors.values()), args=[result.retryable, company_id])
+    return result.as_dict()
+
+
+@celery.task(name='app.task.bill_task.process_bills_concurrent_task', bind=True, max_retries=None)
+def process_bills_concurrent_task(self, bill_ids: list[str], company_id: str | None = None, retry_counts: dict | None = None):
+    """
+    Many bills in flight on one event loop (BILL_CONCURRENCY at a time) instead of
+    one bill per worker process.
+    """
+    wait = circuit_breaker.open_for(*pipeline_circuits(company_id))
+    if wait:
+        raise defer_task(self, wait)
+
+    results = run_async(process_bills_concurrently(bill_ids, company_id))
+    # Same policy as process_bill_task: domain 4xx errors are final, the rest are retried
+    retryable = {
+        bill_id: e for bill_id, e in results.items()
+        if e is not None and (isinstance(e, RetryableSystemError) or not isinstance(e, DomainError))
+    }
+    if retryable:
+        print(f"[Retryable] concurrent bill_ids={list(retryable)}")
+        raise retry_task(self, dominant_error(retryable.values()), args=[list(retryable), company_id])
+    return {bill_id: (str(e) if e else "ok") for bill_id, e in results.items()}
+
+
+@celery.task(name='app.task.bill_task.sweep_bills_task', ignore_result=True)
+def sweep_bills_task(company_id: str | None = None):
+    """
+    Beat job: sends every "Send bill to QB" bill not already in flight, webhook or not.
+    """
+    wait = circuit_breaker.open_for(*pipeline_circuits(company_id))
+    if wait:
+        # The next beat run picks them up
+        print(f"[Sweeper] skipped, an upstream circuit is open for {wait:.0f}s more")
+        return {"skipped": "circuit_open"}
+    result = run_async(sweep_bills(company_id))
+    if result.get("retryable"):
+        # Transient failures get the same second chance as process_bill_batch_task
+        print(f"[Sweeper] retrying bill_ids={result['retryable']}")
+        process_bill_batch_task.apply_async(args=[result["retryable"], company_id], countdown=backoff_delay(1))
+    return result
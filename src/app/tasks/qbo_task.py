@@ -0,0 +1,51 @@
+from ..core.celery_worker import celery
+from ..database.engine import SessionLocal
+from ..database.models.QuickBooksToken import QboConnection
+from ..shared.quickbooks import get_qbo_client, refresh_realm_tokens
+from ..services.doc_number_index import sync_doc_numbers
+from ..core.config import QBO_TOKEN_REFRESH_AHEAD_SECONDS
+
+
+@celery.task(name='app.task.qbo_task.sync_doc_number_index_task', ignore_result=True)
+def sync_doc_number_index_task(full: bool = False):
+    """
+    Keep the local DocNumber index of every connected QuickBooks company up to date.
+    """
+    db = SessionLocal()
+    try:
+        realm_ids = [row.realm_id for row in db.query(QboConnection.realm_id).all()]
+        for realm_id in realm_ids:
+            try:
+                qb = get_qbo_client(realm_id=realm_id, db=db)
+                sync_doc_numbers(qb, full=full, db=db)
+            except Exception as e:
+                # One company failing must not stop the others (nor leave the session unusable for them)
+                db.rollback()
+                print(f"[DocNumberIndex] sync failed for realm_id={realm_id}: {e}")
+    finally:
+        db.close()
+
+
+@celery.task(name='app.task.qbo_task.refresh_qbo_tokens_task', ignore_result=True)
+def refresh_qbo_tokens_task(ahead_seconds: int = QBO_TOKEN_REFRESH_AHEAD_SECONDS):
+    """
+    Beat job: rotate the tokens of every connected QuickBooks company before they
+    get close to expiry, and publish them to every worker.
+    """
+    db = SessionLocal()
+    refreshed = 0
+    realm_ids: list[str] = []
+    try:
+        realm_ids = [row.realm_id for row in db.query(QboConnection.realm_id).all()]
+        for realm_id in realm_ids:
+            try:
+                if refresh_realm_tokens(db, realm_id, ahead_seconds):
+                    refreshed += 1
+            except Exception as e:
+                # One company failing must not stop the others; tasks still refresh inline as a fallback
+                db.rollback()
+                print(f"[TokenRefresher] refresh failed for realm_id={realm_id}: {e}")
+    finally:
+        db.close()
+    print(f"[TokenRefresher] {refreshed} of {len(realm_ids)} companies refreshed")
+    return refreshed
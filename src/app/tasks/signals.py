@@ -0,0 +1,27 @@
+from celery.signals import task_retry, task_failure, worker_process_init, worker_process_shutdown
+
+from ..utils.metrics import metrics
+from ..shared.http_pool import reset_pools, close_pools
+
+
+@task_retry.connect
+def count_task_retry(sender=None, request=None, reason=None, **kwargs):
+    # reason is the exception passed to self.retry(exc=...), if any
+    exception = type(reason).__name__ if isinstance(reason, BaseException) else "Retry"
+    metrics.inc("celery_task_retries_total", task=getattr(sender, "name", "unknown"), exception=exception)
+
+
+@task_failure.connect
+def count_task_failure(sender=None, exception=None, **kwargs):
+    metrics.inc("celery_task_failures_total", task=getattr(sender, "name", "unknown"), exception=type(exception).__name__)
+
+
+@worker_process_init.connect
+def fresh_http_pools(**kwargs):
+    # A forked child must not reuse sockets opened by the parent
+    reset_pools()
+
+
+@worker_process_shutdown.connect
+def close_http_pools(**kwargs):
+    close_pools()
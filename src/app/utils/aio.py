@@ -0,0 +1,52 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core.config import BILL_IO_THREADS
+
+# pyairtable, python-quickbooks and SQLAlchemy are blocking (requests/DB-API), so their
+# calls run on this shared pool while the event loop keeps many bills in flight.
+_executor: ThreadPoolExecutor | None = None
+_executor_pid: int | None = None
+_executor_lock = threading.Lock()
+_loops = threading.local()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    # Threads don't survive a fork: build the pool in the process that uses it
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=BILL_IO_THREADS, thread_name_prefix="bill-io")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking call on the shared I/O pool without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def run_async(coro):
+    """
+    Run a coroutine on this thread's long-lived event loop.
+    Unlike asyncio.run() the loop is reused across Celery tasks.
+    """
+    loop = getattr(_loops, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _loops.loop = loop
+    return loop.run_until_complete(coro)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,235 @@
+import time
+from contextlib import contextmanager
+
+from ..shared.redis_client import redis_client
+from ..core.config import (
+    AIRTABLE_BASE_ID,
+    CIRCUIT_BREAKER_ENABLED,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_FAILURE_WINDOW_SECONDS,
+    CIRCUIT_OPEN_SECONDS,
+    CIRCUIT_HALF_OPEN_PROBES,
+)
+from ..core.exceptions import CircuitOpenError, UpstreamError
+from .metrics import metrics
+from .retry import classify_upstream_error
+
+# Circuit names
+OAUTH_CIRCUIT = "intuit_oauth"
+
+
+def airtable_circuit(base_id: str) -> str:
+    return f"airtable:{base_id}"
+
+
+def quickbooks_circuit(realm_id: str) -> str:
+    return f"quickbooks:{realm_id}"
+
+
+# Decides whether a call may go out.
+# Returns {1, 0} closed, {2, 0} allowed as a half-open probe, {0, wait_ms} rejected.
+#   KEYS[1] = circuit hash   ARGV = now_ms, probe lease ms, max probes in flight
+_ALLOW_LUA = """
+local state = redis.call('HGET', KEYS[1], 'state')
+if not state or state == 'closed' then
+  return {1, 0}
+end
+local now = tonumber(ARGV[1])
+if state == 'open' then
+  local open_until = tonumber(redis.call('HGET', KEYS[1], 'open_until') or 0)
+  if now < open_until then
+    return {0, open_until - now}
+  end
+  redis.call('HSET', KEYS[1], 'state', 'half_open', 'probes', 0, 'probe_until', 0)
+end
+local probes = tonumber(redis.call('HGET', KEYS[1], 'probes') or 0)
+local probe_until = tonumber(redis.call('HGET', KEYS[1], 'probe_until') or 0)
+if now >= probe_until then
+  -- probes that never reported (crashed worker) don't hold the circuit forever
+  probes = 0
+end
+if probes >= tonumber(ARGV[3]) then
+  return {0, math.max(1, math.min(5000, probe_until - now))}
+end
+redis.call('HSET', KEYS[1], 'probes', probes + 1, 'probe_until', now + tonumber(ARGV[2]))
+return {2, 0}
+"""
+
+# Counts a failure; opens the circuit when the window reaches the threshold or a probe failed.
+# Returns 1 when this failure opened the circuit.
+#   KEYS[1] = circuit hash   ARGV = now_ms, window ms, threshold, open ms
+_FAILURE_LUA = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'open' then
+  return 0
+end
+local trip = state == 'half_open'
+if not trip then
+  local window_start = tonumber(redis.call('HGET', KEYS[1], 'window_start') or 0)
+  if now - window_start > tonumber(ARGV[2]) then
+    redis.call('HSET', KEYS[1], 'window_start', now, 'failures', 0)
+  end
+  trip = redis.call('HINCRBY', KEYS[1], 'failures', 1) >= tonumber(ARGV[3])
+end
+if trip then
+  redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', now, 'open_until', now + tonumber(ARGV[4]), 'failures', 0, 'probes', 0)
+  redis.call('HINCRBY', KEYS[1], 'trips', 1)
+  return 1
+end
+return 0
+"""
+
+
+def is_outage(e: Exception) -> bool:
+    """
+    Errors that say the upstream is down (5xx, timeouts, connection errors).
+    Throttling, auth and validation errors don't trip a circuit.
+    """
+    typed = classify_upstream_error(e)
+    return isinstance(typed, UpstreamError) and typed.kind in (UpstreamError.SERVER_ERROR, UpstreamError.NETWORK)
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        redis_client,
+        prefix: str = "circuit",
+        failure_threshold: int = 5,
+        window_seconds: int = 30,
+        open_seconds: int = 30,
+        half_open_probes: int = 1,
+        enabled: bool = True,
+    ):
+        """
+        Circuit breakers shared by every process through Redis, one per name
+        (e.g. 'quickbooks:{realm_id}'). Closed: calls go out. After `failure_threshold`
+        outage errors within `window_seconds` the circuit opens and calls fail fast
+        with CircuitOpenError for `open_seconds`. Then it is half-open: up to
+        `half_open_probes` calls go out at a time; the first success closes it, a
+        failure opens it again.
+        :param redis_client: Client instance for Redis.
+        :param prefix: Key prefix, one hash per circuit: '{prefix}:{name}'.
+        :param enabled: When False every call goes out.
+        """
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.failure_threshold = failure_threshold
+        self.window_ms = window_seconds * 1000
+        self.open_ms = open_seconds * 1000
+        self.half_open_probes = half_open_probes
+        self.enabled = enabled
+        self._allow_script = redis_client.register_script(_ALLOW_LUA)
+        self._failure_script = redis_client.register_script(_FAILURE_LUA)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def check(self, name: str) -> bool:
+        """
+        Call before each request. Raises CircuitOpenError when the circuit is open.
+        Returns True when the call is a half-open probe; pass it back to record().
+        """
+        if not self.enabled:
+            return False
+        try:
+            allowed, wait_ms = self._allow_script(keys=[self._key(name)], args=[int(time.time() * 1000), self.open_ms, self.half_open_probes])
+        except Exception as e:
+            # Never block upstream calls because Redis is down
+            print(f"[Circuit] breaker unavailable, calling without it: {e}")
+            return False
+        if not allowed:
+            metrics.inc("circuit_rejected_total", circuit=name)
+            raise CircuitOpenError(
+                f"Circuit {name} is open, not calling it for {int(wait_ms) / 1000:.1f}s",
+                upstream=name.split(":")[0],
+                retry_after=int(wait_ms) / 1000.0,
+                payload={"circuit": name},
+            )
+        return allowed == 2
+
+    def record(self, name: str, probe: bool, failed: bool):
+        """
+        Call after each request with the value check() returned.
+        Successes outside half-open cost nothing.
+        """
+        if not self.enabled or (not failed and not probe):
+            return
+        try:
+            if failed:
+                opened = self._failure_script(keys=[self._key(name)], args=[int(time.time() * 1000), self.window_ms, self.failure_threshold, self.open_ms])
+                if opened:
+                    print(f"[Circuit] {name} opened for {self.open_ms / 1000:.0f}s")
+                    metrics.inc("circuit_transitions_total", circuit=name, state="open")
+            else:
+                # A probe went through: the upstream is back
+                self.redis_client.hset(self._key(name), mapping={"state": "closed", "failures": 0, "probes": 0})
+                print(f"[Circuit] {name} closed")
+                metrics.inc("circuit_transitions_total", circuit=name, state="closed")
+        except Exception as e:
+            print(f"[Circuit] could not record outcome for {name}: {e}")
+
+    @contextmanager
+    def guard(self, name: str):
+        """
+        check() + record() around a block; only outage errors count as failures.
+        """
+        probe = self.check(name)
+        try:
+            yield
+        except Exception as e:
+            self.record(name, probe, failed=is_outage(e))
+            raise
+        self.record(name, probe, failed=False)
+
+    def open_for(self, *names: str) -> float:
+        """
+        Seconds until every given circuit lets calls through again (0 if none is open).
+        Read-only, for deferring work before it starts.
+        """
+        if not self.enabled:
+            return 0.0
+        now_ms = int(time.time() * 1000)
+        wait_ms = 0
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for name in names:
+                pipe.hmget(self._key(name), "state", "open_until")
+            for state, open_until in pipe.execute():
+                if state == b"open":
+                    wait_ms = max(wait_ms, int(open_until or 0) - now_ms)
+        except Exception as e:
+            print(f"[Circuit] breaker unavailable: {e}")
+            return 0.0
+        return max(0, wait_ms) / 1000.0
+
+    def stats(self, name: str) -> dict:
+        raw = {k.decode(): v.decode() for k, v in self.redis_client.hgetall(self._key(name)).items()}
+        now_ms = int(time.time() * 1000)
+        state = raw.get("state", "closed")
+        return {
+            "state": state,
+            "failures_in_window": int(raw.get("failures", 0)),
+            "open_for_ms": max(0, int(raw.get("open_until", 0)) - now_ms) if state == "open" else 0,
+            "trips": int(raw.get("trips", 0)),
+        }
+
+
+def pipeline_circuits(company_id: str | None = None) -> list[str]:
+    """
+    Circuits a bill goes through: the Airtable base, Intuit OAuth and the QBO realm when known.
+    """
+    names = [airtable_circuit(AIRTABLE_BASE_ID), OAUTH_CIRCUIT]
+    if company_id:
+        names.append(quickbooks_circuit(company_id))
+    return names
+
+
+circuit_breaker = CircuitBreaker(
+    redis_client,
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    window_seconds=CIRCUIT_FAILURE_WINDOW_SECONDS,
+    open_seconds=CIRCUIT_OPEN_SECONDS,
+    half_open_probes=CIRCUIT_HALF_OPEN_PROBES,
+    enabled=CIRCUIT_BREAKER_ENABLED,
+)
@@ -1,37 +1,125 @@
-import redis
+import time
 import uuid
 
+# Libera solo si el lock sigue siendo nuestro; deja el resultado para quien espera y avisa.
+#   KEYS[1] = lock   KEYS[2] = result key   ARGV = owner uuid, result ('' = none), result ttl ms, channel
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return 0
+end
+redis.call('DEL', KEYS[1])
+if ARGV[2] ~= '' then
+  redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+end
+redis.call('PUBLISH', ARGV[4], ARGV[2])
+return 1
+"""
+
+# Renueva el TTL solo si el lock sigue siendo nuestro.
+#   KEYS[1] = lock   ARGV = owner uuid, ttl ms
+_EXTEND_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return 0
+end
+return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+"""
+
+
+def _text(value) -> str | None:
+    if isinstance(value, bytes):
+        value = value.decode()
+    return value or None
+
+
 class RedisLock:
-    def __init__(self, redis_client, lock_key: str, ttl: int = 300):
+    def __init__(self, redis_client, lock_key: str, ttl: int = 300, result_ttl: int = 30):
         """
         :param redis_client: Client instance for Redis.
         :param lock_key: Unique key for the lock (e.g., 'lock:refresh_token:{realm_id}').
         :param ttl: Time in seconds for the lock to be valid (default is 5 minutes).
+        :param result_ttl: Seconds the result passed to release() stays readable for late waiters.
         """
         self.redis_client = redis_client
         self.lock_key = lock_key
         self.ttl = ttl
+        self.result_ttl = result_ttl
         self.lock_uuid = str(uuid.uuid4())
+        self.result_key = f"{lock_key}:result"
+        self.channel = f"{lock_key}:released"
+        self._release_script = redis_client.register_script(_RELEASE_LUA)
+        self._extend_script = redis_client.register_script(_EXTEND_LUA)
 
-    def acquire(self):
+    def acquire(self, blocking: bool = False, timeout: float | None = None) -> bool:
         """
-        Intenta adquirir el lock.
+        Intenta adquirir el lock (SET NX PX, atómico).
+        With blocking=True waits up to `timeout` seconds (forever when None), woken
+        up by the holder's release instead of polling.
         """
-        if self.redis_client.setnx(self.lock_key, self.lock_uuid):
-            # Si el lock no existía, lo creamos y le damos un tiempo de vida (TTL)
-            self.redis_client.expire(self.lock_key, self.ttl)
-            return True
-        return False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.redis_client.set(self.lock_key, self.lock_uuid, nx=True, px=int(self.ttl * 1000)):
+                return True
+            if not blocking:
+                return False
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._wait_for_release(remaining)
 
-    def release(self):
+    def release(self, result: str | None = None) -> bool:
+        """
+        Free the lock if it's held by this instance and wake up every waiter.
+        `result` (e.g. the value the holder computed) is handed to them by wait(),
+        so they don't have to read it again from the database.
         """
-        Free the lock if it's held by this instance.
+        released = self._release_script(
+            keys=[self.lock_key, self.result_key],
+            args=[self.lock_uuid, result or "", int(self.result_ttl * 1000), self.channel],
+        )
+        return bool(released)
+
+    def extend(self, ttl: int | None = None) -> bool:
         """
-        stored_uuid = self.redis_client.get(self.lock_key)
-        if stored_uuid and stored_uuid.decode() == self.lock_uuid:
-            self.redis_client.delete(self.lock_key)
-            return True
-        return False
+        Reset the TTL of a held lock, for holders that may run longer than `ttl`.
+        Returns False when the lock expired and someone else may hold it now.
+        """
+        extended = self._extend_script(
+            keys=[self.lock_key],
+            args=[self.lock_uuid, int((ttl or self.ttl) * 1000)],
+        )
+        return bool(extended)
+
+    def wait(self, timeout: float) -> str | None:
+        """
+        Wait (without taking the lock) until the current holder releases it.
+        Returns the result the holder passed to release(), or None when it left
+        none or didn't release within `timeout` seconds.
+        """
+        return self._wait_for_release(timeout)
+
+    def _wait_for_release(self, timeout: float | None) -> str | None:
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before checking the lock, so a release in between isn't missed
+            pubsub.subscribe(self.channel)
+            if not self.redis_client.exists(self.lock_key):
+                return self._last_result()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                remaining = self.ttl if deadline is None else deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                # Never wait past the lock TTL: a crashed holder never publishes
+                message = pubsub.get_message(timeout=min(remaining, self.ttl))
+                if message and message["type"] == "message":
+                    return _text(message["data"])
+                if not self.redis_client.exists(self.lock_key):
+                    return self._last_result()
+        finally:
+            pubsub.close()
+
+    def _last_result(self) -> str | None:
+        return _text(self.redis_client.get(self.result_key))
 
     def is_locked(self):
         """
@@ -0,0 +1,137 @@
+import time
+from contextlib import contextmanager
+
+from ..shared.redis_client import redis_client
+from ..core.config import METRICS_ENABLED
+
+# Seconds; covers fast cache hits up to slow month-end QBO saves
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# name -> (type, help, buckets). Only registered metrics are rendered.
+METRICS: dict[str, tuple[str, str, tuple | None]] = {
+    "bill_stage_seconds": ("histogram", "Time spent in each numbered step of bill_service", DEFAULT_BUCKETS),
+    "bill_processed_total": ("counter", "Bills handled by bill_service by outcome", None),
+    "celery_task_retries_total": ("counter", "Celery task retries by task and exception class", None),
+    "retry_budget_exhausted_total": ("counter", "Tasks that used up the retry budget of an error class", None),
+    "circuit_transitions_total": ("counter", "Circuit breaker state changes by circuit and new state", None),
+    "circuit_rejected_total": ("counter", "Upstream calls and tasks held back by an open circuit", None),
+    "celery_task_failures_total": ("counter", "Celery tasks that failed for good by task and exception class", None),
+    "qbo_token_refresh_total": ("counter", "QBO token refreshes by outcome", None),
+    "qbo_token_refresh_seconds": ("histogram", "Time to refresh QBO tokens with Intuit", DEFAULT_BUCKETS),
+    "qbo_token_lock_wait_seconds": ("histogram", "Time spent waiting for another worker's token refresh", DEFAULT_BUCKETS),
+    "upstream_http_responses_total": ("counter", "HTTP responses from Airtable and QuickBooks by status", None),
+    "http_connections_opened_total": ("counter", "New TCP/TLS connections to Airtable and QuickBooks (the rest reuse pooled ones)", None),
+    "upstream_request_seconds": ("histogram", "Latency of HTTP calls to Airtable and QuickBooks", DEFAULT_BUCKETS),
+    "realm_bills_dispatched_total": ("counter", "Bills handed to the workers by the realm scheduler", None),
+    "webhook_ingest_seconds": ("histogram", "Time to accept the bills of one webhook request", DEFAULT_BUCKETS),
+    "webhook_outbox_relayed_total": ("counter", "Webhook events relayed from the outbox to the queue", None),
+    "airtable_writes_dead_lettered_total": ("counter", "Buffered Airtable writes moved to the dead-letter list", None),
+    "webhook_outbox_relay_errors_total": ("counter", "Outbox relay passes stopped by an unavailable queue", None),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_key(labels: dict) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _series(name: str, labels: str) -> str:
+    return f"{name}{{{labels}}}" if labels else name
+
+
+class MetricsRegistry:
+    def __init__(self, redis_client, prefix: str = "metrics", metrics: dict | None = None, enabled: bool = True):
+        """
+        Prometheus-style counters and histograms kept in Redis, so the web app and
+        every Celery worker process write to the same series and /metrics shows them all.
+        :param redis_client: Client instance for Redis.
+        :param prefix: Key prefix, one hash per metric: '{prefix}:{name}'.
+        :param metrics: Registered metrics (see METRICS).
+        :param enabled: When False recording is a no-op.
+        """
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.metrics = metrics or METRICS
+        self.enabled = enabled
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        try:
+            self.redis_client.hincrbyfloat(self._key(name), _label_key(labels), amount)
+        except Exception as e:
+            print(f"[Metrics] could not record {name}: {e}")
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        buckets = self.metrics[name][2] or DEFAULT_BUCKETS
+        # Non-cumulative bucket counts; render() accumulates them
+        bucket = next((str(b) for b in buckets if value <= b), "+Inf")
+        base = _label_key(labels)
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.hincrby(self._key(name), f"{base}|{bucket}", 1)
+            pipe.hincrbyfloat(self._key(name), f"{base}|sum", value)
+            pipe.hincrby(self._key(name), f"{base}|count", 1)
+            pipe.execute()
+        except Exception as e:
+            print(f"[Metrics] could not record {name}: {e}")
+
+    @contextmanager
+    def timed(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _render_histogram(self, name: str, raw: dict, buckets) -> list[str]:
+        series: dict[str, dict[str, float]] = {}
+        for field, value in raw.items():
+            labels, _, part = field.decode().rpartition("|")
+            series.setdefault(labels, {})[part] = float(value)
+
+        lines = []
+        for labels, parts in sorted(series.items()):
+            sep = "," if labels else ""
+            cumulative = 0.0
+            for b in list(buckets) + ["+Inf"]:
+                cumulative += parts.get(str(b), 0)
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{b}"}} {cumulative:g}')
+            lines.append(f"{_series(name + '_sum', labels)} {parts.get('sum', 0):g}")
+            lines.append(f"{_series(name + '_count', labels)} {parts.get('count', 0):g}")
+        return lines
+
+    def render(self, gauges: dict[str, tuple[str, float]] | None = None) -> str:
+        """
+        Prometheus text exposition of every registered metric, plus gauges
+        (name -> (help, value)) computed by the caller at scrape time.
+        """
+        lines = []
+        for name, (kind, help_text, buckets) in self.metrics.items():
+            raw = self.redis_client.hgetall(self._key(name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                lines.extend(self._render_histogram(name, raw, buckets or DEFAULT_BUCKETS))
+            else:
+                for labels, value in sorted(raw.items()):
+                    lines.append(f"{_series(name, labels.decode())} {float(value):g}")
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {'NaN' if value != value else format(value, 'g')}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        self.redis_client.delete(*(self._key(name) for name in self.metrics))
+
+
+metrics = MetricsRegistry(redis_client, enabled=METRICS_ENABLED)
@@ -0,0 +1,97 @@
+import json
+
+from ..shared.redis_client import redis_client
+from ..core.config import (
+    QBO_REFERENCE_CACHE_ENABLED,
+    QBO_REFERENCE_CACHE_TTL_SECONDS,
+    QBO_ACCOUNT_CACHE_TTL_SECONDS,
+)
+
+# Kinds of reference data we cache and how long each one lives
+REFERENCE_TTLS = {
+    "vendor": QBO_REFERENCE_CACHE_TTL_SECONDS,
+    "customer": QBO_REFERENCE_CACHE_TTL_SECONDS,
+    "department": QBO_REFERENCE_CACHE_TTL_SECONDS,
+    "account": QBO_ACCOUNT_CACHE_TTL_SECONDS,
+}
+
+
+class QboReferenceCache:
+    def __init__(self, redis_client, prefix: str = "qbo:ref", ttls: dict | None = None, enabled: bool = True):
+        """
+        :param redis_client: Client instance for Redis (shared by all workers).
+        :param prefix: Key prefix, keys look like '{prefix}:{realm_id}:{kind}:{lookup}'.
+        :param ttls: Time to live in seconds per kind of reference data.
+        :param enabled: When False every lookup goes straight to QuickBooks.
+        """
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.ttls = ttls or REFERENCE_TTLS
+        self.enabled = enabled
+
+    def _key(self, realm_id: str, kind: str, lookup: str) -> str:
+        return f"{self.prefix}:{realm_id}:{kind}:{lookup}"
+
+    def _stats_key(self, realm_id: str) -> str:
+        return f"{self.prefix}:stats:{realm_id}"
+
+    def _count(self, realm_id: str, kind: str, outcome: str):
+        try:
+            self.redis_client.hincrby(self._stats_key(realm_id), f"{kind}:{outcome}", 1)
+        except Exception as e:
+            print(f"[QboReferenceCache] could not update stats: {e}")
+
+    def get_or_load(self, realm_id: str, kind: str, lookup, obj_class, loader):
+        """
+        Return the cached QuickBooks object for (realm, kind, lookup) or call
+        `loader()` and store its result. Loader errors (e.g. NotFoundDomainError)
+        are never cached and propagate unchanged.
+        Redis failures degrade to a direct QuickBooks call.
+        """
+        if not self.enabled or not realm_id:
+            return loader()
+
+        key = self._key(realm_id, kind, str(lookup))
+        try:
+            raw = self.redis_client.get(key)
+        except Exception as e:
+            print(f"[QboReferenceCache] read failed for {key}: {e}")
+            return loader()
+
+        if raw is not None:
+            self._count(realm_id, kind, "hits")
+            return obj_class.from_json(json.loads(raw))
+
+        self._count(realm_id, kind, "misses")
+        obj = loader()
+        if obj is not None:
+            try:
+                self.redis_client.set(key, obj.to_json(), ex=self.ttls.get(kind, QBO_REFERENCE_CACHE_TTL_SECONDS))
+            except Exception as e:
+                print(f"[QboReferenceCache] write failed for {key}: {e}")
+        return obj
+
+    def invalidate(self, realm_id: str, kind: str | None = None, lookup=None) -> int:
+        """
+        Drop cached entries. With only realm_id every kind is dropped for that realm,
+        with kind all entries of that kind, with kind + lookup a single entry.
+        """
+        if lookup is not None and kind:
+            return self.redis_client.delete(self._key(realm_id, kind, str(lookup)))
+
+        pattern = self._key(realm_id, kind or "*", "*")
+        deleted = 0
+        for key in self.redis_client.scan_iter(match=pattern, count=500):
+            deleted += self.redis_client.delete(key)
+        return deleted
+
+    def stats(self, realm_id: str) -> dict:
+        """
+        Hit/miss counters for a realm, e.g. {'vendor:hits': 10, 'vendor:misses': 2}.
+        """
+        raw = self.redis_client.hgetall(self._stats_key(realm_id))
+        return {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw.items()}
+
+
+# Shared instance used by the helpers in utils/quickbooks.py
+reference_cache = QboReferenceCache(redis_client, enabled=QBO_REFERENCE_CACHE_ENABLED)
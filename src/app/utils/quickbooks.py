@@ -1,3 +1,4 @@
+import time
 from sqlalchemy.orm import Session
 
 from quickbooks.objects.vendor import Vendor
@@ -10,13 +11,22 @@ from quickbooks.objects.bill import Bill
 
 from ..database.models.QuickBooksToken import QboConnection
 from ..core.exceptions import BusinessValidationError, NotFoundDomainError
+from .qb_cache import reference_cache
 
 
+# Default company ID cached per process: (realm_id, loaded_at)
+DEFAULT_COMPANY_ID_TTL_SECONDS = 300
+_default_company_id: tuple[str, float] | None = None
+
 # Get the default company ID from the database
 def _get_default_company_id(db: Session) -> str:
+    global _default_company_id
+    if _default_company_id and time.monotonic() - _default_company_id[1] < DEFAULT_COMPANY_ID_TTL_SECONDS:
+        return _default_company_id[0]
     row = db.query(QboConnection).first()
     if not row:
         raise BusinessValidationError("No QuickBooks connection found in the system.")
+    _default_company_id = (row.realm_id, time.monotonic())
     return row.realm_id
 
 # Escape QuickBooks special characters in strings
@@ -25,11 +35,17 @@ def _escape_qb(value: str) -> str:
         return value.replace("'", "''") if value else value
     return str(value)
 
+# Realm (company id) of a QuickBooks client, used to scope the reference cache
+def _realm_of(qb) -> str:
+    return str(getattr(qb, "company_id", "") or "")
+
 def _get_vendor(qb, vendor_id: str) -> Vendor:
-    res = Vendor.where(f"Id = '{_escape_qb(vendor_id)}'", qb=qb)
-    if not res:
-      raise NotFoundDomainError(f"Vendor (Hauler) '{vendor_id}' not found in QuickBooks.")  
-    return res[0]
+    def load():
+        res = Vendor.where(f"Id = '{_escape_qb(vendor_id)}'", qb=qb)
+        if not res:
+          raise NotFoundDomainError(f"Vendor (Hauler) '{vendor_id}' not found in QuickBooks.")  
+        return res[0]
+    return reference_cache.get_or_load(_realm_of(qb), "vendor", vendor_id, Vendor, load)
 
 
 def _get_customer_by_display_name(qb, display_name: str):
@@ -37,20 +53,35 @@ def _get_customer_by_display_name(qb, display_name: str):
   # the search has to find the part of the display name that
   # only contains "A-####" it has to ignore the name "XXXXXXX - " part
   search_term = display_name.split(" - ")[-1]
-  query = f"DisplayName LIKE '%{_escape_qb(search_term)}%'"
-  customers = Customer.where(query, qb=qb)
-  if not customers:
-      raise NotFoundDomainError(f"Customer with display name {display_name} not found.")
-  return customers[0]
+  def load():
+    query = f"DisplayName LIKE '%{_escape_qb(search_term)}%'"
+    customers = Customer.where(query, qb=qb)
+    if not customers:
+        raise NotFoundDomainError(f"Customer with display name {display_name} not found.")
+    return customers[0]
+  return reference_cache.get_or_load(_realm_of(qb), "customer", search_term, Customer, load)
 
 def get_department_from_service_account(qb, service_account_id: str) -> Department:
   #A departament has a name, the name comes like "XXXXX, service_account_id"
   # the search has to find the part of name that only contains the service_account_id
   #before the comma and the space
-  departments = Department.where(f"Name LIKE '%{_escape_qb(service_account_id)}%'", qb=qb)
-  if not departments:
-      raise NotFoundDomainError(f"No department found for service account {service_account_id}")
-  return departments[0]
+  def load():
+    departments = Department.where(f"Name LIKE '%{_escape_qb(service_account_id)}%'", qb=qb)
+    if not departments:
+        raise NotFoundDomainError(f"No department found for service account {service_account_id}")
+    return departments[0]
+  return reference_cache.get_or_load(_realm_of(qb), "department", service_account_id, Department, load)
+
+def get_expense_account(qb, account_id: str) -> Account | None:
+  return reference_cache.get_or_load(_realm_of(qb), "account", account_id, Account, lambda: Account.get(account_id, qb=qb))
+
+def invalidate_reference_cache(qb, kind: str | None = None, lookup=None) -> int:
+  # Drop cached reference data for the client's realm (all kinds, one kind or one entry)
+  try:
+    return reference_cache.invalidate(_realm_of(qb), kind, lookup)
+  except Exception as e:
+    print(f"Could not invalidate QuickBooks reference cache: {e}")
+    return 0
 
 def check_duplicate_bill_number(qb, doc_number: str) -> bool:
   existing_bills = Bill.where(f"DocNumber = '{_escape_qb(doc_number)}'", qb=qb)
@@ -58,3 +89,19 @@ def check_duplicate_bill_number(qb, doc_number: str) -> bool:
     print("Duplicate bill number found in QuickBooks.")
     return True
   return False
+
+def check_duplicate_bill_numbers(qb, doc_numbers: list[str]) -> set[str]:
+  # Single "DocNumber IN (...)" query for a group of bills (QBO caps results at 1000 per page)
+  if not doc_numbers:
+    return set()
+  in_clause = ", ".join(f"'{_escape_qb(n)}'" for n in doc_numbers)
+  existing_bills = Bill.where(f"DocNumber IN ({in_clause})", max_results=1000, qb=qb)
+  return {b.DocNumber for b in existing_bills}
+
+def existing_bill_ids(qb, bill_ids: list[str]) -> set[str]:
+  # Single "Id IN (...)" query: which of these QBO bills still exist (deleted bills aren't returned)
+  if not bill_ids:
+    return set()
+  in_clause = ", ".join(f"'{_escape_qb(str(i))}'" for i in bill_ids)
+  existing_bills = Bill.where(f"Id IN ({in_clause})", max_results=1000, qb=qb)
+  return {str(b.Id) for b in existing_bills}
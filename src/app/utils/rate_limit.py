@@ -0,0 +1,156 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from ..shared.redis_client import redis_client
+from ..core.config import (
+    QBO_RATE_LIMIT_ENABLED,
+    QBO_RATE_LIMIT_PER_MINUTE,
+    QBO_RATE_LIMIT_BURST,
+    QBO_MAX_CONCURRENT_REQUESTS,
+    QBO_RATE_LIMIT_MAX_WAIT_SECONDS,
+)
+from ..core.exceptions import UpstreamError
+
+# Takes a concurrency slot and a bucket token atomically, or neither.
+# Returns 0 when both were taken, otherwise how many ms to wait before trying again.
+#   KEYS[1] = bucket hash (tokens, ts)   KEYS[2] = semaphore zset (holder -> lease expiry ms)
+#   ARGV = now_ms, rate per ms, burst, max concurrent, holder id, lease ms
+_ACQUIRE_LUA = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local max_concurrent = tonumber(ARGV[4])
+local lease = tonumber(ARGV[6])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if redis.call('ZCARD', KEYS[2]) >= max_concurrent then
+  local first = redis.call('ZRANGE', KEYS[2], 0, 0, 'WITHSCORES')
+  return math.max(1, math.min(50, tonumber(first[2]) - now))
+end
+
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts'))
+if tokens == nil then
+  tokens = burst
+  ts = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+if tokens < 1 then
+  redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+  return math.max(1, math.ceil((1 - tokens) / rate))
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate) + 1000)
+redis.call('ZADD', KEYS[2], now + lease, ARGV[5])
+redis.call('PEXPIRE', KEYS[2], lease)
+return 0
+"""
+
+
+class QboRateLimiter:
+    def __init__(
+        self,
+        redis_client,
+        prefix: str = "qbo:rl",
+        per_minute: int = 450,
+        burst: int = 20,
+        max_concurrent: int = 8,
+        max_wait: float = 30,
+        lease_seconds: int = 120,
+        enabled: bool = True,
+    ):
+        """
+        :param redis_client: Client instance for Redis (shared by all workers).
+        :param prefix: Key prefix, keys look like '{prefix}:{realm_id}:bucket' and '{prefix}:{realm_id}:slots'.
+        :param per_minute: Sustained requests per minute allowed per realm (token bucket refill).
+        :param burst: Bucket size, how many requests can go out back to back.
+        :param max_concurrent: Requests in flight per realm across every worker.
+        :param max_wait: Seconds a caller waits for a slot before giving up with UpstreamError.
+        :param lease_seconds: A slot not released after this long (crashed worker) is reclaimed.
+        :param enabled: When False calls go straight to QuickBooks.
+        """
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.rate_per_ms = per_minute / 60000.0
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.lease_ms = lease_seconds * 1000
+        self.enabled = enabled
+        self._acquire_script = redis_client.register_script(_ACQUIRE_LUA)
+
+    def _keys(self, realm_id: str) -> list[str]:
+        return [f"{self.prefix}:{realm_id}:bucket", f"{self.prefix}:{realm_id}:slots"]
+
+    def acquire(self, realm_id: str) -> str | None:
+        """
+        Wait until the realm has a free slot and a token. Returns the holder id to
+        pass to release(), or None when limiting is off or Redis is unavailable.
+        """
+        if not self.enabled or not realm_id:
+            return None
+
+        holder = str(uuid.uuid4())
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            try:
+                wait_ms = self._acquire_script(
+                    keys=self._keys(realm_id),
+                    args=[int(time.time() * 1000), self.rate_per_ms, self.burst, self.max_concurrent, holder, self.lease_ms],
+                )
+            except Exception as e:
+                # Never block QuickBooks calls because Redis is down
+                print(f"[QboRateLimiter] limiter unavailable, calling without it: {e}")
+                return None
+
+            if not wait_ms:
+                return holder
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise UpstreamError(
+                    f"QBO rate limit: no request slot for realm_id {realm_id} within {self.max_wait}s",
+                    upstream="quickbooks",
+                    kind=UpstreamError.THROTTLED,
+                    retry_after=int(wait_ms) / 1000.0,
+                    payload={"realm_id": realm_id},
+                )
+            time.sleep(min(int(wait_ms) / 1000.0, remaining))
+
+    def release(self, realm_id: str, holder: str | None):
+        if holder is None:
+            return
+        try:
+            self.redis_client.zrem(self._keys(realm_id)[1], holder)
+        except Exception as e:
+            print(f"[QboRateLimiter] could not release slot: {e}")
+
+    @contextmanager
+    def slot(self, realm_id: str):
+        holder = self.acquire(realm_id)
+        try:
+            yield
+        finally:
+            self.release(realm_id, holder)
+
+    def stats(self, realm_id: str) -> dict:
+        bucket_key, slots_key = self._keys(realm_id)
+        now_ms = int(time.time() * 1000)
+        return {
+            "tokens": float(self.redis_client.hget(bucket_key, "tokens") or self.burst),
+            "in_flight": self.redis_client.zcount(slots_key, now_ms, "+inf"),
+            "max_concurrent": self.max_concurrent,
+            "per_minute": round(self.rate_per_ms * 60000),
+        }
+
+
+qbo_rate_limiter = QboRateLimiter(
+    redis_client,
+    per_minute=QBO_RATE_LIMIT_PER_MINUTE,
+    burst=QBO_RATE_LIMIT_BURST,
+    max_concurrent=QBO_MAX_CONCURRENT_REQUESTS,
+    max_wait=QBO_RATE_LIMIT_MAX_WAIT_SECONDS,
+    enabled=QBO_RATE_LIMIT_ENABLED,
+)
@@ -0,0 +1,190 @@
+import email.utils
+import random
+import time
+
+from requests.exceptions import ConnectionError as RequestsConnectionError, HTTPError, Timeout
+
+from ..core.config import (
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_MAX_DELAY_SECONDS,
+    RETRY_BUDGET_THROTTLED,
+    RETRY_BUDGET_SERVER_ERROR,
+    RETRY_BUDGET_NETWORK,
+    RETRY_BUDGET_AUTH,
+    RETRY_BUDGET_OTHER,
+)
+from ..core.exceptions import DomainError, RetryableSystemError, UpstreamError, CircuitOpenError
+from .metrics import metrics
+
+# Errors that aren't UpstreamError but still worth retrying (RetryableSystemError, unknown exceptions)
+OTHER = "other"
+
+RETRY_BUDGETS = {
+    UpstreamError.THROTTLED: RETRY_BUDGET_THROTTLED,
+    UpstreamError.SERVER_ERROR: RETRY_BUDGET_SERVER_ERROR,
+    UpstreamError.NETWORK: RETRY_BUDGET_NETWORK,
+    UpstreamError.AUTH: RETRY_BUDGET_AUTH,
+    OTHER: RETRY_BUDGET_OTHER,
+}
+
+# QBO fault codes (https://developer.intuit.com/app/developer/qbo/docs/develop/troubleshooting/error-codes)
+QBO_THROTTLE_CODES = {3001}   # ThrottleExceeded
+QBO_SEVERE_CODE = 10000       # Intuit internal errors, also used by python-quickbooks for non-JSON (e.g. 502 HTML) bodies
+
+
+def parse_retry_after(response) -> float | None:
+    """
+    Seconds from a Retry-After header, either delta-seconds or an HTTP date.
+    """
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def upstream_http_error(upstream: str, response) -> UpstreamError:
+    """
+    UpstreamError for a 429 or 5xx response.
+    """
+    status = response.status_code
+    kind = UpstreamError.THROTTLED if status == 429 else UpstreamError.SERVER_ERROR
+    return UpstreamError(
+        f"{upstream} returned {status}",
+        upstream=upstream,
+        kind=kind,
+        retry_after=parse_retry_after(response),
+        status_code=status,
+    )
+
+
+def _upstream_from_url(url: str | None) -> str:
+    return "airtable" if url and "/v0/app" in url else "quickbooks"
+
+
+def classify_upstream_error(e: Exception, upstream: str | None = None) -> Exception:
+    """
+    Typed version of an error raised while talking to Airtable or QuickBooks:
+    an UpstreamError for throttling, 5xx, network and authorization failures,
+    `e` unchanged for everything else (validation errors, domain errors...).
+    """
+    if isinstance(e, DomainError):
+        return e
+    # SDK imports deferred: this module is loaded by the web app too, which never talks to QBO
+    from intuitlib.exceptions import AuthClientError
+    from quickbooks.exceptions import AuthorizationException, QuickbooksException, SevereException
+    if isinstance(e, Timeout):
+        return UpstreamError(f"Timeout talking to {upstream or 'upstream'}: {e}", upstream=upstream or "unknown", kind=UpstreamError.NETWORK)
+    if isinstance(e, RequestsConnectionError):
+        return UpstreamError(f"Connection error talking to {upstream or 'upstream'}: {e}", upstream=upstream or "unknown", kind=UpstreamError.NETWORK)
+    if isinstance(e, HTTPError) and e.response is not None:
+        status = e.response.status_code
+        if status == 429 or status >= 500:
+            error = upstream_http_error(upstream or _upstream_from_url(e.response.url), e.response)
+            error.args = (f"{error}: {e}",)
+            return error
+        return e
+    if isinstance(e, AuthClientError):
+        # Token refresh with Intuit; a 4xx may be a refresh token another worker just rotated
+        if e.status_code == 429 or e.status_code >= 500:
+            error = upstream_http_error("quickbooks", e.response)
+        else:
+            error = UpstreamError("", upstream="quickbooks", kind=UpstreamError.AUTH, status_code=e.status_code)
+        error.args = (f"QBO token refresh failed: {e}",)
+        return error
+    if isinstance(e, AuthorizationException):
+        return UpstreamError(f"QBO authorization error: {e}", upstream="quickbooks", kind=UpstreamError.AUTH, status_code=401)
+    if isinstance(e, QuickbooksException):
+        try:
+            code = int(e.error_code or 0)
+        except (TypeError, ValueError):
+            code = 0
+        if code in QBO_THROTTLE_CODES:
+            return UpstreamError(f"QBO throttled: {e}", upstream="quickbooks", kind=UpstreamError.THROTTLED, status_code=429)
+        if isinstance(e, SevereException) or code >= QBO_SEVERE_CODE:
+            return UpstreamError(f"QBO transient error: {e}", upstream="quickbooks", kind=UpstreamError.SERVER_ERROR)
+    return e
+
+
+def error_kind(e: Exception) -> str | None:
+    """
+    Retry class of an error, or None when it must not be retried (4xx domain errors).
+    """
+    from quickbooks.exceptions import QuickbooksException
+    typed = classify_upstream_error(e)
+    if isinstance(typed, UpstreamError):
+        return typed.kind
+    # Other QBO faults and Airtable 4xx are about the data: retrying won't help
+    if isinstance(typed, (QuickbooksException, HTTPError)):
+        return None
+    if isinstance(typed, RetryableSystemError) or not isinstance(typed, DomainError):
+        return OTHER
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """
+    Seconds before retry number `attempt` (0-based). Full jitter: uniform between 0
+    and base * 2^attempt (capped), so retries of many tasks don't come back in waves.
+    When the upstream sent Retry-After we wait at least that long, plus a little jitter.
+    """
+    if retry_after:
+        return min(RETRY_MAX_DELAY_SECONDS, retry_after) + random.uniform(0, RETRY_BASE_DELAY_SECONDS)
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+def dominant_error(errors) -> Exception:
+    """
+    Of the errors of several bills retried together, the one that decides the
+    retry: the one with the longest Retry-After, else the first.
+    """
+    typed = [classify_upstream_error(e) for e in errors]
+    return max(typed, key=lambda e: getattr(e, "retry_after", None) or 0)
+
+
+def retry_task(task, exc: Exception, args: list | None = None) -> Exception:
+    """
+    Schedule a retry of the running Celery task (bind=True) for `exc`.
+    Retries are counted per error class in the task kwarg `retry_counts`, so a
+    burst of 429s doesn't use up the retries meant for 5xx and vice versa.
+    Returns the exception to raise: Celery's Retry, or `exc` itself when it isn't
+    retryable or its class has no retries left.
+    """
+    typed = classify_upstream_error(exc)
+    if isinstance(typed, CircuitOpenError):
+        return defer_task(task, typed.retry_after or RETRY_BASE_DELAY_SECONDS, args=args)
+    kind = error_kind(typed)
+    if kind is None:
+        return exc
+
+    kwargs = dict(task.request.kwargs or {})
+    counts = dict(kwargs.get("retry_counts") or {})
+    used = counts.get(kind, 0)
+    budget = RETRY_BUDGETS.get(kind, RETRY_BUDGET_OTHER)
+    if used >= budget:
+        print(f"[Retry] {task.name} gave up after {used} {kind} retries: {exc}")
+        metrics.inc("retry_budget_exhausted_total", task=task.name, kind=kind)
+        return exc
+
+    counts[kind] = used + 1
+    kwargs["retry_counts"] = counts
+    countdown = backoff_delay(used, getattr(typed, "retry_after", None))
+    print(f"[Retry] {task.name} {kind} retry {used + 1}/{budget} in {countdown:.1f}s: {exc}")
+    return task.retry(exc=typed, args=args, kwargs=kwargs, countdown=countdown, throw=False)
+
+
+def defer_task(task, wait: float, args: list | None = None) -> Exception:
+    """
+    Run the task again in `wait` seconds (plus jitter) without using any retry
+    budget, e.g. while a circuit breaker is open. Returns Celery's Retry to raise.
+    """
+    countdown = wait + random.uniform(0, RETRY_BASE_DELAY_SECONDS)
+    print(f"[Retry] {task.name} deferred {countdown:.1f}s, upstream unavailable")
+    metrics.inc("circuit_rejected_total", circuit="task", task=task.name)
+    return task.retry(args=args, kwargs=task.request.kwargs or {}, countdown=countdown, throw=False)
@@ -13,7 +13,19 @@ ls -la src/
 if [ "$RAILWAY_SERVICE_NAME" = "worker" ]; then
     echo "Starting Celery worker..."
     exec celery -A src.app.core.celery_worker worker --loglevel=info
+elif [ "$RAILWAY_SERVICE_NAME" = "beat" ]; then
+    echo "Starting Celery beat..."
+    exec celery -A src.app.core.celery_worker beat --loglevel=info
+elif [ "$RAILWAY_SERVICE_NAME" = "migrate" ]; then
+    echo "Creating database tables..."
+    exec python -m src.app.core.migrate
 else
+    # Tables are no longer created when the app is imported; set MIGRATE_ON_START=false
+    # when a release/pre-deploy step already runs the migration
+    if [ "${MIGRATE_ON_START:-true}" = "true" ]; then
+        echo "Creating database tables..."
+        python -m src.app.core.migrate || exit 1
+    fi
     echo "Starting FastAPI web server..."
     exec uvicorn src.app.main:app --host 0.0.0.0 --port ${PORT:-8000}
 fi
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from requests import HTTPError, Response
+
+from app.services import airtable_writer
+from app.services.airtable_writer import DEAD_LETTER_KEY, PENDING_KEY, PROCESSING_KEY, flush_writes, pending_record_ids
+
+
+def _http_error(status):
+    response = Response()
+    response.status_code = status
+    return HTTPError(str(status), response=response)
+
+
+class FakeTable:
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.fail_with = None
+
+    def batch_create(self, records, typecast):
+        if self.fail_with:
+            raise self.fail_with
+        if any(record.get("Bad") for record in records):
+            raise _http_error(422)
+        self.created.append(records)
+
+    def batch_update(self, records, typecast):
+        if self.fail_with:
+            raise self.fail_with
+        self.updated.append(records)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable()
+    model = type("Bill", (), {"meta": type("meta", (), {"table": table})})
+    monkeypatch.setattr(airtable_writer, "WRITE_BEHIND_MODELS", {"Bill": model})
+    monkeypatch.setattr(airtable_writer, "AIRTABLE_WRITE_BEHIND", True)
+    return table
+
+
+def _queue(redis_client, *entries):
+    for entry in entries:
+        redis_client.rpush(PENDING_KEY, json.dumps({"model": "Bill", **entry}))
+
+
+def test_batches_and_acks(redis_client, table):
+    _queue(redis_client, *({"op": "create", "fields": {"n": i}} for i in range(12)))
+    stats = flush_writes()
+    assert stats["created"] == 12
+    assert [len(chunk) for chunk in table.created] == [10, 2]
+    assert redis_client.llen(PENDING_KEY) == redis_client.llen(PROCESSING_KEY) == 0
+
+
+def test_updates_of_a_record_are_merged(redis_client, table):
+    _queue(redis_client,
+           {"op": "update", "id": "rec1", "fields": {"Status": "Sending"}},
+           {"op": "update", "id": "rec1", "fields": {"Status": "Bill in QB", "Detail": ""}})
+    assert pending_record_ids("Bill") == {"rec1"}
+    flush_writes()
+    assert table.updated == [[{"id": "rec1", "fields": {"Status": "Bill in QB", "Detail": ""}}]]
+    assert pending_record_ids("Bill") == set()
+
+
+def test_transient_failure_keeps_entries_for_next_flush(redis_client, table):
+    _queue(redis_client, {"op": "create", "fields": {"n": 1}})
+    table.fail_with = _http_error(503)
+    assert flush_writes()["failed"] == 1
+    assert redis_client.llen(PROCESSING_KEY) == 1
+
+    # The next flush requeues what the failed one left in processing
+    table.fail_with = None
+    stats = flush_writes()
+    assert stats["requeued"] == 1 and stats["created"] == 1
+    assert redis_client.llen(PROCESSING_KEY) == 0
+
+
+def test_rejected_record_doesnt_block_the_chunk(redis_client, table, monkeypatch):
+    monkeypatch.setattr(airtable_writer, "AIRTABLE_WRITE_MAX_ATTEMPTS", 2)
+    _queue(redis_client, *({"op": "create", "fields": {"n": i, "Bad": i == 3}} for i in range(5)))
+    stats = flush_writes()
+    assert stats["created"] == 4 and stats["rejected"] == 1
+    assert json.loads(redis_client.lindex(PENDING_KEY, 0))["attempts"] == 1
+
+    stats = flush_writes()
+    assert stats["dead_lettered"] == 1
+    dead = json.loads(redis_client.lindex(DEAD_LETTER_KEY, 0))
+    assert dead["fields"]["n"] == 3 and dead["attempts"] == 2 and dead["error"] == "422"
+    assert redis_client.llen(PENDING_KEY) == redis_client.llen(PROCESSING_KEY) == 0
+
+
+def test_malformed_entry_is_dead_lettered(redis_client, table):
+    redis_client.rpush(PENDING_KEY, b"not json")
+    assert flush_writes()["dead_lettered"] == 1
+    assert redis_client.lrange(DEAD_LETTER_KEY, 0, -1) == [b"not json"]
+
+
+def test_flush_skipped_while_another_runs(redis_client, table):
+    from app.utils.lock import RedisLock
+    RedisLock(redis_client, airtable_writer.FLUSH_LOCK_KEY).acquire()
+    _queue(redis_client, {"op": "create", "fields": {"n": 1}})
+    assert flush_writes() == {"skipped": True}
+    assert redis_client.llen(PENDING_KEY) == 1
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from app.core.exceptions import CircuitOpenError
+from app.utils.circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture
+def breaker(redis_client):
+    return CircuitBreaker(redis_client, failure_threshold=3, window_seconds=30, open_seconds=1, half_open_probes=1)
+
+
+def _fail(breaker, name="quickbooks:1"):
+    with pytest.raises(RequestsConnectionError):
+        with breaker.guard(name):
+            raise RequestsConnectionError("down")
+
+
+def test_opens_after_threshold(breaker):
+    for _ in range(2):
+        _fail(breaker)
+    assert breaker.check("quickbooks:1") is False
+    _fail(breaker)
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.check("quickbooks:1")
+    assert 0 < info.value.retry_after <= 1
+    assert breaker.stats("quickbooks:1")["state"] == "open"
+    assert 0 < breaker.open_for("quickbooks:1", "airtable:appTest") <= 1
+
+
+def test_validation_errors_dont_count(breaker):
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            with breaker.guard("quickbooks:1"):
+                raise ValueError("bad bill")
+    assert breaker.stats("quickbooks:1")["state"] == "closed"
+
+
+def test_half_open_probe_closes_circuit(breaker):
+    for _ in range(3):
+        _fail(breaker)
+    time.sleep(1.05)
+    assert breaker.check("quickbooks:1") is True
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.check("quickbooks:1")
+    breaker.record("quickbooks:1", probe=True, failed=False)
+    assert breaker.stats("quickbooks:1")["state"] == "closed"
+    assert breaker.open_for("quickbooks:1") == 0
+
+
+def test_failed_probe_opens_again(breaker):
+    for _ in range(3):
+        _fail(breaker)
+    time.sleep(1.05)
+    _fail(breaker)
+    stats = breaker.stats("quickbooks:1")
+    assert stats["state"] == "open"
+    assert stats["trips"] == 2
+
+
+def test_circuits_are_independent(breaker):
+    for _ in range(3):
+        _fail(breaker, "quickbooks:1")
+    assert breaker.check("quickbooks:2") is False
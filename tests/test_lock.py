@@ -0,0 +1,58 @@
+import threading
+import time
+
+from app.utils.lock import RedisLock
+
+
+def test_acquire_is_exclusive(redis_client):
+    first = RedisLock(redis_client, "lock:test")
+    second = RedisLock(redis_client, "lock:test")
+    assert first.acquire()
+    assert not second.acquire()
+    assert first.release()
+    assert second.acquire()
+
+
+def test_release_only_by_owner(redis_client):
+    owner = RedisLock(redis_client, "lock:test")
+    other = RedisLock(redis_client, "lock:test")
+    owner.acquire()
+    assert not other.release()
+    assert owner.is_locked()
+
+
+def test_extend_fails_once_lock_expired_and_taken(redis_client):
+    lock = RedisLock(redis_client, "lock:test", ttl=0.05)
+    assert lock.acquire()
+    assert lock.extend()
+    time.sleep(0.1)
+    assert RedisLock(redis_client, "lock:test").acquire()
+    assert not lock.extend()
+
+
+def test_wait_gets_result_of_release(redis_client):
+    holder = RedisLock(redis_client, "lock:test")
+    holder.acquire()
+    threading.Timer(0.1, holder.release, args=("token-123",)).start()
+    assert RedisLock(redis_client, "lock:test").wait(timeout=5) == "token-123"
+
+
+def test_wait_after_release_reads_stored_result(redis_client):
+    holder = RedisLock(redis_client, "lock:test")
+    holder.acquire()
+    holder.release("token-123")
+    assert RedisLock(redis_client, "lock:test").wait(timeout=1) == "token-123"
+
+
+def test_blocking_acquire_wakes_up_on_release(redis_client):
+    holder = RedisLock(redis_client, "lock:test")
+    holder.acquire()
+    threading.Timer(0.1, holder.release).start()
+    started = time.monotonic()
+    assert RedisLock(redis_client, "lock:test").acquire(blocking=True, timeout=5)
+    assert time.monotonic() - started < 2
+
+
+def test_blocking_acquire_times_out(redis_client):
+    RedisLock(redis_client, "lock:test").acquire()
+    assert not RedisLock(redis_client, "lock:test").acquire(blocking=True, timeout=0.2)
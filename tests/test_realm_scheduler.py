@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from app.services import realm_scheduler
+from app.services.realm_scheduler import (
+    bill_scheduled,
+    dispatch_bills,
+    hold_slot,
+    release_slot,
+    submit_bill,
+    submit_bills,
+)
+
+
+@pytest.fixture(autouse=True)
+def caps(monkeypatch):
+    monkeypatch.setattr(realm_scheduler, "REALM_MAX_IN_FLIGHT", 2)
+    monkeypatch.setattr(realm_scheduler, "REALM_WEIGHTS", {})
+    monkeypatch.setattr(realm_scheduler, "REALM_MAX_IN_FLIGHT_OVERRIDES", {})
+
+
+def _collect():
+    sent = []
+    return sent, lambda bill_id, company_id: sent.append((bill_id, company_id))
+
+
+def test_caps_bills_in_flight_per_realm():
+    submit_bills([f"a{i}" for i in range(5)], "realm-a")
+    sent, send = _collect()
+    assert dispatch_bills(send) == 2
+    release_slot("realm-a", "a0")
+    assert dispatch_bills(send) == 1
+    assert [bill_id for bill_id, _ in sent] == ["a0", "a1", "a2"]
+
+
+def test_big_backlog_doesnt_starve_other_realms(monkeypatch):
+    monkeypatch.setattr(realm_scheduler, "REALM_MAX_IN_FLIGHT", 100)
+    submit_bills([f"a{i}" for i in range(50)], "realm-a")
+    submit_bills(["b0", "b1"], "realm-b")
+    sent, send = _collect()
+    dispatch_bills(send)
+    order = [company_id for _, company_id in sent]
+    # Round-robin: realm-b's bills go out within the first rounds, not after the 50 of realm-a
+    assert max(i for i, realm in enumerate(order) if realm == "realm-b") < 4
+
+
+def test_weights_and_overrides(monkeypatch):
+    monkeypatch.setattr(realm_scheduler, "REALM_WEIGHTS", {"realm-a": 3})
+    monkeypatch.setattr(realm_scheduler, "REALM_MAX_IN_FLIGHT_OVERRIDES", {"realm-a": 3})
+    submit_bills([f"a{i}" for i in range(5)], "realm-a")
+    submit_bills([f"b{i}" for i in range(5)], "realm-b")
+    sent, send = _collect()
+    dispatch_bills(send)
+    assert sum(1 for _, realm in sent if realm == "realm-a") == 3
+    assert sum(1 for _, realm in sent if realm == "realm-b") == 2
+
+
+def test_delay_keeps_bill_waiting():
+    submit_bill("a0", "realm-a", delay=60)
+    sent, send = _collect()
+    assert dispatch_bills(send) == 0
+    assert bill_scheduled("a0", "realm-a")
+    assert 55 < realm_scheduler.next_ready_in() <= 60
+
+
+def test_broker_failure_puts_unsent_bills_back():
+    submit_bills(["a0", "a1"], "realm-a")
+    calls = []
+
+    def send(bill_id, company_id):
+        calls.append(bill_id)
+        if len(calls) == 2:
+            raise ConnectionError("broker down")
+
+    with pytest.raises(ConnectionError):
+        dispatch_bills(send)
+    stats = realm_scheduler.realm_queue_stats()
+    assert stats == [{"realm": "realm-a", "waiting": 1, "in_flight": 1, "cap": 2, "weight": 1}]
+    sent, send = _collect()
+    assert dispatch_bills(send) == 1
+    assert sent == [("a1", "realm-a")]
+
+
+def test_held_slot_counts_against_cap():
+    submit_bills(["a0", "a1", "a2"], "realm-a")
+    sent, send = _collect()
+    dispatch_bills(send)
+    # a0 waits for a Celery retry: its slot stays taken
+    hold_slot("realm-a", "a0", 30)
+    release_slot("realm-a", "a1")
+    assert dispatch_bills(send) == 1
+    assert dispatch_bills(send) == 0
+
+
+def test_expired_lease_frees_slot(redis_client):
+    submit_bills(["a0", "a1", "a2"], "realm-a")
+    sent, send = _collect()
+    dispatch_bills(send)
+    # Worker crashed: its lease ran out
+    redis_client.zadd(realm_scheduler.IN_FLIGHT_KEY.format(realm="realm-a"), {"a0": time.time() - 1})
+    assert not bill_scheduled("a0", "realm-a")
+    assert dispatch_bills(send) == 1
+
+
+def test_bill_without_company_uses_default_company(monkeypatch):
+    monkeypatch.setattr(realm_scheduler, "_default_realm", lambda: "realm-a")
+    submit_bill("a0")
+    sent, send = _collect()
+    dispatch_bills(send)
+    assert sent == [("a0", "realm-a")]
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from requests import HTTPError, Response
+
+from app.core.exceptions import BusinessValidationError, CircuitOpenError, UpstreamError
+from app.utils import retry
+from app.utils.retry import dominant_error, retry_task
+
+
+class FakeTask:
+    name = "app.task.test"
+
+    def __init__(self, retry_counts=None):
+        self.request = SimpleNamespace(kwargs={"retry_counts": retry_counts} if retry_counts else {})
+        self.retries = []
+
+    def retry(self, **kwargs):
+        self.retries.append(kwargs)
+        return SimpleNamespace(when=kwargs["countdown"], kwargs=kwargs["kwargs"])
+
+
+def _throttled(retry_after=None):
+    return UpstreamError("429", upstream="quickbooks", kind=UpstreamError.THROTTLED, retry_after=retry_after, status_code=429)
+
+
+def _server_error():
+    return UpstreamError("503", upstream="quickbooks", kind=UpstreamError.SERVER_ERROR, status_code=503)
+
+
+def test_counts_retries_per_error_class():
+    task = FakeTask({UpstreamError.THROTTLED: 2})
+    result = retry_task(task, _server_error())
+    assert result.kwargs["retry_counts"] == {UpstreamError.THROTTLED: 2, UpstreamError.SERVER_ERROR: 1}
+
+
+def test_gives_up_when_class_budget_is_used(monkeypatch):
+    monkeypatch.setitem(retry.RETRY_BUDGETS, UpstreamError.SERVER_ERROR, 2)
+    error = _server_error()
+    assert retry_task(FakeTask({UpstreamError.SERVER_ERROR: 2}), error) is error
+    # Another class still has its own budget
+    assert retry_task(FakeTask({UpstreamError.SERVER_ERROR: 2}), _throttled()) is not error
+
+
+def test_waits_at_least_retry_after():
+    result = retry_task(FakeTask(), _throttled(retry_after=7))
+    assert result.when >= 7
+
+
+def test_domain_errors_are_not_retried():
+    error = BusinessValidationError("bad vendor")
+    task = FakeTask()
+    assert retry_task(task, error) is error
+    assert not task.retries
+
+
+def test_airtable_4xx_is_not_retried():
+    response = Response()
+    response.status_code = 422
+    error = HTTPError("422", response=response)
+    assert retry_task(FakeTask(), error) is error
+
+
+def test_open_circuit_defers_without_budget():
+    task = FakeTask({UpstreamError.SERVER_ERROR: 1})
+    result = retry_task(task, CircuitOpenError("open", upstream="quickbooks", retry_after=4))
+    assert result.when >= 4
+    assert result.kwargs == {"retry_counts": {UpstreamError.SERVER_ERROR: 1}}
+
+
+def test_dominant_error_has_longest_retry_after():
+    errors = [_server_error(), _throttled(retry_after=3), _throttled(retry_after=9)]
+    assert dominant_error(errors).retry_after == 9
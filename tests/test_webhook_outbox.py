@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.database.crud_webhook_outbox import claim_events
+from app.services import webhook_outbox
+from app.services.webhook_outbox import OutboxRelay, accept_bill_events, drain_outbox, outbox_status, relay_batch
+
+
+@pytest.fixture
+def queued(monkeypatch, db):
+    calls = []
+    monkeypatch.setattr(webhook_outbox, "enqueue_bill_events", lambda bill_ids, company_id: calls.append((bill_ids, company_id)))
+    return calls
+
+
+def test_relays_in_order_per_company(queued):
+    accept_bill_events(["a0", "a1"], "realm-a")
+    accept_bill_events(["b0"], "realm-b")
+    accept_bill_events(["a2"], "realm-a")
+    assert drain_outbox(batch_size=10) == (4, 0)
+    assert queued == [(["a0", "a1"], "realm-a"), (["b0"], "realm-b"), (["a2"], "realm-a")]
+    assert outbox_status()["pending"] == 0
+
+
+def test_broker_failure_keeps_the_rest(monkeypatch, db):
+    accept_bill_events(["a0"], "realm-a")
+    accept_bill_events(["b0"], "realm-b")
+    accept_bill_events(["a1"], "realm-a")
+    calls = []
+
+    def enqueue(bill_ids, company_id):
+        if company_id == "realm-b":
+            raise ConnectionError("broker down")
+        calls.append(bill_ids)
+
+    monkeypatch.setattr(webhook_outbox, "enqueue_bill_events", enqueue)
+    assert relay_batch() == (1, 2)
+    assert calls == [["a0"]]
+    assert outbox_status()["pending"] == 2
+
+    # Released events are claimable again right away, in the same order
+    monkeypatch.setattr(webhook_outbox, "enqueue_bill_events", lambda bill_ids, company_id: calls.append(bill_ids))
+    assert drain_outbox() == (2, 0)
+    assert calls == [["a0"], ["b0"], ["a1"]]
+
+
+def test_claimed_events_belong_to_one_relay(queued, db):
+    accept_bill_events(["a0", "a1"], "realm-a")
+    assert len(claim_events(db, "other-relay", 10, lease_seconds=60)) == 2
+    assert relay_batch() == (0, 0)
+    assert queued == []
+
+
+def test_expired_claim_is_relayed(monkeypatch, queued, db):
+    accept_bill_events(["a0"], "realm-a")
+    claim_events(db, "dead-relay", 10, lease_seconds=60)
+    # The relay that claimed it died: once the lease is over another relay takes it
+    monkeypatch.setattr(webhook_outbox, "WEBHOOK_OUTBOX_CLAIM_LEASE_SECONDS", 0)
+    assert relay_batch() == (1, 0)
+    assert queued == [(["a0"], "realm-a")]
+
+
+def test_relay_loop_backs_off_and_recovers(monkeypatch, db):
+    accept_bill_events(["a0"], "realm-a")
+    attempts = []
+
+    def enqueue(bill_ids, company_id):
+        attempts.append(bill_ids)
+        if len(attempts) < 3:
+            raise ConnectionError("broker down")
+
+    monkeypatch.setattr(webhook_outbox, "enqueue_bill_events", enqueue)
+
+    async def run():
+        relay = OutboxRelay(interval=0.01, max_backoff=0.02)
+        relay.start()
+        for _ in range(200):
+            await asyncio.sleep(0.01)
+            if outbox_status()["pending"] == 0 and not relay._backoff:
+                break
+        await relay.stop()
+        return relay
+
+    relay = asyncio.run(run())
+    assert len(attempts) == 3
+    assert relay._backoff == 0
+    assert outbox_status()["pending"] == 0